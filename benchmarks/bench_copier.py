@@ -0,0 +1,239 @@
+"""Measures copy and move throughput of the navcopier engine.
+
+    python benchmarks/bench_copier.py --workloads large,small \\
+        --strategies buffered-16k,copy_file_range --output copier.json
+
+Workloads are generated once in tmpfs and reused: one large file, many
+small files, a deep tree, a sparse file, a tree with hardlinks, and
+moves of the small files within the scratch filesystem and onto another
+one. Each workload is copied by each strategy in a fresh offscreen
+interpreter, reporting bytes/s, files/s, CPU time and the read and write
+system calls counted in /proc/self/io. Sources stay in the page cache
+between runs, so the figures compare strategies rather than disks; use
+--dest to copy onto a real disk. Comparison against a baseline works as
+in bench_model.py, on bytes/s.
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import bench_model
+import common
+
+MiB = 1024 * 1024
+# label -> (strategy, chunk, workers)
+STRATEGIES = {
+    "buffered-16k": ("buffered", 16 * 1024, 1),
+    "buffered-128k": ("buffered", 128 * 1024, 1),
+    "buffered-1m": ("buffered", MiB, 1),
+    "copy_file_range": ("copy_file_range", 8 * MiB, 1),
+    "sendfile": ("sendfile", 8 * MiB, 1),
+    "buffered-128k-x4": ("buffered", 128 * 1024, 4),
+    "copy_file_range-x4": ("copy_file_range", 8 * MiB, 4),
+}
+WORKLOADS = ("large", "small", "deep", "sparse", "hardlinks", "move_same",
+             "move_cross")
+
+
+def write(name, size):
+    """Writes size incompressible bytes, a MiB block at a time."""
+    block = os.urandom(min(size, MiB))
+    with open(name, "wb") as fh:
+        for _ in range(size // len(block)):
+            fh.write(block)
+        fh.write(block[:size % len(block)])
+
+
+def generate(kind, path, scale):
+    """Fills path with the files of a workload."""
+    if kind == "large":
+        write(os.path.join(path, "large.bin"), 256 * MiB * scale // 100)
+    elif kind in ("small", "move_same", "move_cross"):
+        for i in range(5000 * scale // 100):
+            sub = os.path.join(path, f"d{i // 500:03d}")
+            os.makedirs(sub, exist_ok=True)
+            write(os.path.join(sub, f"f{i:05d}"), 4096)
+    elif kind == "deep":
+        sub = path
+        for depth in range(200):
+            sub = os.path.join(sub, f"level{depth:03d}")
+            os.makedirs(sub)
+            for i in range(5):
+                write(os.path.join(sub, f"f{i}"), 16 * 1024)
+    elif kind == "sparse":
+        # Data at both ends of a hole, as left by downloaders and VMs
+        with open(os.path.join(path, "sparse.img"), "wb") as fh:
+            fh.write(os.urandom(MiB))
+            fh.seek(1024 * MiB * scale // 100)
+            fh.write(os.urandom(MiB))
+    elif kind == "hardlinks":
+        tree = os.path.join(path, "tree")
+        links = os.path.join(path, "links")
+        os.makedirs(tree)
+        os.makedirs(links)
+        for i in range(500 * scale // 100):
+            name = os.path.join(tree, f"f{i:04d}")
+            write(name, 64 * 1024)
+            os.link(name, os.path.join(links, f"f{i:04d}"))
+
+
+def make_workload(kind, scale):
+    """Returns the source directory of a workload, creating it once."""
+    path = os.path.join(bench_model.scratch_dir(),
+                        f"navbench-copy-{kind}-{scale}")
+    done = os.path.join(path, ".complete")
+    if os.path.exists(done):
+        return path
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    generate(kind, path, scale)
+    open(done, "w").close()
+    return path
+
+
+def io_counters():
+    """Returns the I/O counters of this process, including its threads."""
+    counters = {}
+    with open("/proc/self/io") as fh:
+        for line in fh:
+            key, _, value = line.partition(":")
+            counters[key] = int(value)
+    return counters
+
+
+def allocated(path):
+    """Returns the bytes of disk allocated under path."""
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            total += os.lstat(os.path.join(root, name)).st_blocks * 512
+    return total
+
+
+def once(kind, src, dest, label):
+    """Copies or moves src once in this process, printing JSON."""
+    sys.path.insert(0, os.path.join(common.ROOT, "src"))
+    from PyQt5 import QtWidgets
+    app = QtWidgets.QApplication([])  # noqa: F841
+    from navcopier import NavCopier
+    strategy, chunk, workers = STRATEGIES[label]
+    act = "move" if kind.startswith("move") else "copy"
+    out = os.path.join(dest, f"navbench-copy-out-{os.getpid()}")
+    os.makedirs(out)
+    if act == "move":  # a fresh source every run
+        staged = os.path.join(bench_model.scratch_dir(),
+                              f"navbench-copy-staged-{os.getpid()}")
+        shutil.copytree(src, staged)
+        src = staged
+    copier = NavCopier([act, src, out], strategy, chunk, workers)
+    io, ru = io_counters(), resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    copier.copier(act)
+    seconds = time.perf_counter() - start
+    ru_end, io_end = resource.getrusage(resource.RUSAGE_SELF), io_counters()
+    result = {
+        "seconds": seconds,
+        "bytes_per_s": copier.total / seconds,
+        "files_per_s": copier.files / seconds,
+        "files": copier.files,
+        "cpu": (ru_end.ru_utime + ru_end.ru_stime) -
+               (ru.ru_utime + ru.ru_stime),
+        "syscr": io_end["syscr"] - io["syscr"],
+        "syscw": io_end["syscw"] - io["syscw"],
+        "allocated": allocated(out),
+    }
+    shutil.rmtree(out)
+    print(json.dumps(result))
+    os._exit(0)
+
+
+def cross_device(scratch):
+    """Returns a directory on another filesystem than scratch, if any."""
+    tmp = tempfile.gettempdir()
+    if os.stat(tmp).st_dev != os.stat(scratch).st_dev:
+        return tmp
+    return None
+
+
+def compare(results, baseline, tolerance):
+    """Prints strategies slower than the baseline. Returns the count."""
+    regressions = 0
+    for kind, strategies in results.items():
+        for label, metrics in strategies.items():
+            try:
+                before = baseline[kind][label]["bytes_per_s"]
+            except KeyError:
+                continue
+            now = statistics.median(metrics["bytes_per_s"])
+            was = statistics.median(before)
+            if now < was * (1 - tolerance):
+                regressions += 1
+                print(f"REGRESSION {kind} {label}: {was / MiB:.1f} -> "
+                      f"{now / MiB:.1f} MiB/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--workloads", default=",".join(WORKLOADS))
+    parser.add_argument("--strategies", default=",".join(STRATEGIES))
+    parser.add_argument("--scale", type=int, default=100,
+                        help="workload size in percent")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--dest", help="directory copies are written to, "
+                        "by default the tmpfs holding the workloads")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="JSON file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed slowdown against the baseline")
+    parser.add_argument("--once", nargs=4, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.once:
+        return once(*args.once)
+    home = common.make_home(1, 1)
+    scratch = bench_model.scratch_dir()
+    results = {}
+    for kind in args.workloads.split(","):
+        dest = args.dest or scratch
+        if kind == "move_cross":
+            dest = cross_device(scratch)
+            if dest is None:
+                print(f"{kind}: skipped, {scratch} is the only filesystem")
+                continue
+        src = make_workload(kind, args.scale)
+        results[kind] = {}
+        print(f"{kind} ({src} -> {dest})")
+        print(f"  {'strategy':<20} {'MiB/s':>9} {'files/s':>9} "
+              f"{'cpu s':>7} {'syscr':>8} {'syscw':>8} {'alloc MiB':>10}")
+        for label in args.strategies.split(","):
+            runs = common.run_child(os.path.abspath(__file__),
+                                    ["--once", kind, src, dest, label],
+                                    home, args.runs)
+            metrics = {key: [run[key] for run in runs] for key in runs[0]}
+            results[kind][label] = metrics
+
+            def median(key):
+                return statistics.median(metrics[key])
+
+            print(f"  {label:<20} {median('bytes_per_s') / MiB:9.1f} "
+                  f"{median('files_per_s'):9.0f} {median('cpu'):7.2f} "
+                  f"{median('syscr'):8.0f} {median('syscw'):8.0f} "
+                  f"{median('allocated') / MiB:10.1f}")
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(results, fh, indent=2)
+    if args.baseline:
+        with open(args.baseline) as fh:
+            if compare(results, json.load(fh), args.tolerance):
+                return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
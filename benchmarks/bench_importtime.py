@@ -0,0 +1,73 @@
+"""Checks that importing the application stays within a time budget.
+
+    python benchmarks/bench_importtime.py --budget 200 --runs 5
+
+Runs `python -X importtime -c "import src.navgator"` in fresh
+interpreters, reports the median cumulative import time and the slowest
+modules, and exits non-zero when the budget is exceeded or when one of
+the modules that must only be imported on first use shows up.
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+import common
+
+# Imported on first use only: thumbnails, viewer, trash and resource usage
+LAZY = ("PIL", "magic", "send2trash", "psutil", "faulthandler")
+
+
+def importtime(module):
+    """Returns {module: (self us, cumulative us)} for one cold import."""
+    err = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=common.child_env(common.ROOT), check=True,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        universal_newlines=True).stderr
+    times = {}
+    for line in err.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative, name = line[12:].split("|")
+        if not self_us.strip().isdigit():
+            continue  # header line
+        times[name.strip()] = (int(self_us), int(cumulative))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--module", default="src.navgator")
+    parser.add_argument("--budget", type=float, default=200,
+                        help="median cumulative import time in ms")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10,
+                        help="number of slowest modules to list")
+    args = parser.parse_args()
+    runs = [importtime(args.module) for _ in range(args.runs)]
+    totals = [r[args.module][1] / 1000 for r in runs]
+    common.report(args.module, totals, unit="ms")
+
+    last = runs[-1]
+    print("\nSlowest modules (self time, last run):")
+    for name, (self_us, cumulative) in sorted(
+            last.items(), key=lambda i: i[1][0], reverse=True)[:args.top]:
+        print(f"  {self_us / 1000:8.2f}ms {cumulative / 1000:8.2f}ms  {name}")
+
+    failed = False
+    eager = sorted({m for m in last if m.split(".")[0] in LAZY})
+    if eager:
+        print(f"\nFAIL: imported at startup but should be lazy: {eager}")
+        failed = True
+    median = statistics.median(totals)
+    if median > args.budget:
+        print(f"\nFAIL: {median:.1f}ms exceeds the {args.budget:.0f}ms budget")
+        failed = True
+    else:
+        print(f"\nOK: {median:.1f}ms within the {args.budget:.0f}ms budget")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+"""Measures what a log call costs on the GUI thread.
+
+    python benchmarks/bench_logging.py --calls 200000 --budget 300
+
+Compares a disabled debug call with lazy arguments against the eager
+f-string and frame inspection it replaced, and an enabled call handed to
+the writer thread. Exits non-zero when the disabled call costs more than
+the budget in nanoseconds.
+"""
+import argparse
+import logging
+import sys
+import timeit
+
+import common
+
+sys.path.insert(0, common.ROOT)
+from src.helper import setup_logging  # noqa: E402
+
+logger = logging.getLogger("src.bench")
+loc, path = "/home/user/projects", "/home/user/projects/file.txt"
+
+
+def eager():
+    logger.debug(f"Invoked by {sys._getframe().f_back.f_code.co_name}")
+    logger.debug(f"{path} created in {loc}")
+
+
+def lazy():
+    logger.debug("%s created in %s", path, loc)
+
+
+def per_call(fn, calls):
+    """Returns the best per call time in nanoseconds."""
+    return min(timeit.repeat(fn, number=calls, repeat=5)) / calls * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--calls", type=int, default=200000)
+    parser.add_argument("--budget", type=float, default=300,
+                        help="ns allowed for a disabled call")
+    args = parser.parse_args()
+    setup_logging({"level": "INFO"})
+    results = {
+        "disabled, eager (before)": per_call(eager, args.calls),
+        "disabled, lazy": per_call(lazy, args.calls),
+    }
+    setup_logging({"level": "INFO", "modules": {"bench": "DEBUG"}})
+    results["enabled, queued"] = per_call(lazy, args.calls // 10)
+    for name, ns in results.items():
+        print(f"{name:<30} {ns:10.0f} ns/call")
+    if results["disabled, lazy"] > args.budget:
+        print(f"FAIL: disabled call exceeds {args.budget:.0f} ns")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""Measures resident memory after startup and tree navigation.
+
+    python benchmarks/bench_memory.py --panes 4 --reveal /usr/share
+
+Every pane tree and the main tree reveal the same directories, which is
+where per-tree filesystem models used to multiply memory.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import common
+
+
+def rss():
+    """Resident set size of this process in bytes."""
+    with open("/proc/self/statm") as fh:
+        return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def settle(app, seconds):
+    """Processes events for a while so background listings land."""
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        app.processEvents()
+        time.sleep(0.01)
+
+
+def once(reveal, wait):
+    from PyQt5 import QtWidgets
+    app = QtWidgets.QApplication([])
+    base = rss()
+    from src.navgator import Navgator
+    w = Navgator()
+    settle(app, wait)
+    started = rss()
+    trees = [w.tree] + [p.tree for p in w.panes]
+    for path in reveal:
+        for tree in trees:
+            index = tree.model.index(path, 0)
+            tree.setCurrentIndex(index)
+            tree.scrollTo(index)
+            tree.expand(index)
+    settle(app, wait)
+    print(json.dumps({
+        "qapp": base,
+        "startup": started,
+        "revealed": rss(),
+        "trees": len(trees),
+    }))
+    os._exit(0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--panes", type=int, default=4)
+    parser.add_argument("--reveal", nargs="*",
+                        default=["/usr/share", "/usr/lib", "/etc"])
+    parser.add_argument("--wait", type=float, default=1.0,
+                        help="seconds to let background work finish")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--once", action="store_true",
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.once:
+        return once(args.reveal, args.wait)
+    home = common.make_home(args.panes, tabs=1)
+    results = common.run_child(
+        os.path.abspath(__file__),
+        ["--once", "--wait", str(args.wait), "--reveal"] + args.reveal,
+        home, args.runs)
+    print(f"{results[0]['trees']} trees revealing {', '.join(args.reveal)}")
+    mib = 1024 * 1024
+    for key in ("qapp", "startup", "revealed"):
+        common.report(key, [r[key] / mib for r in results], unit="MiB")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+"""Benchmarks the listing hot paths on synthetic directories.
+
+    python benchmarks/bench_model.py --sizes 1000,100000,1000000 \\
+        --output results.json --baseline baseline.json
+
+Directories holding the requested number of entries are generated once in
+tmpfs and reused. Each size is measured in a fresh interpreter running
+the application with a single tab: listing, sorting by each column,
+filter keystrokes, select all, invert selection, applying watcher events
+and memory per row. Results
+are written as JSON; given a baseline, timings more than --tolerance
+slower than the baseline are reported and the exit status is non-zero.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import common
+
+SHM = "/dev/shm"
+COLUMNS = ("Name", "Ext", "Size", "Modified")
+KEYSTROKES = ("f", "f1", "f12", "f123", "f12", "f1", "f", "")
+EXTS = ("txt", "jpg", "py", "mp3", "tar.gz", "")
+EVENTS = 200  # watcher events applied per kind
+
+
+def scratch_dir():
+    """Returns where generated directories are kept, tmpfs if present."""
+    return SHM if os.path.isdir(SHM) else tempfile.gettempdir()
+
+
+def make_tree(size):
+    """Returns a directory holding size entries, creating it if needed.
+    About one in twenty entries is a directory."""
+    path = os.path.join(scratch_dir(), f"navbench-{size}")
+    done = os.path.join(path, ".complete")
+    if os.path.exists(done):
+        return path
+    os.makedirs(path, exist_ok=True)
+    for i in range(size):
+        name = os.path.join(path, f"f{i:07d}")
+        if i % 20 == 0:
+            os.makedirs(name, exist_ok=True)
+            continue
+        name = f"{name}.{EXTS[i % len(EXTS)]}".rstrip(".")
+        with open(name, "wb") as fh:
+            fh.write(b"x" * (i % 4096))
+    open(done, "w").close()
+    return path
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def once(path, runs):
+    """Measures one directory in this process, printing JSON."""
+    from PyQt5 import QtCore, QtWidgets
+    app = QtWidgets.QApplication([])
+    from watchdog.events import FileCreatedEvent, FileDeletedEvent
+    from src.navcache import NavDirCache
+    from src.navperf import NavPerf
+    from src.core import Nav
+    from src.navgator import Navgator
+    window = Navgator()  # noqa: F841, keeps the tab alive
+    app.processEvents()
+    tab = Nav.pact.tabbar.currentWidget()  # opened on the repository
+    rss = NavPerf.memory()
+    tab.load_tab(path)
+    app.processEvents()
+    rows = tab.model.rowCount()
+    result = {"rows": rows,
+              "bytes_per_row": (NavPerf.memory() - rss) / max(rows, 1)}
+
+    def list_dirs(fresh):
+        if fresh:
+            NavDirCache.invalidate(path)
+        tab.model.list_dirs(path)
+
+    result["list_dirs"] = [timed(list_dirs, True) for _ in range(runs)]
+    result["list_dirs_cached"] = [timed(list_dirs, False)
+                                  for _ in range(runs)]
+    tab.load_tab(path, forced=True)
+    for col, name in enumerate(COLUMNS):
+        result[f"sort_{name.lower()}"] = [
+            timed(tab.proxy.sort, col, order)
+            for order in (QtCore.Qt.AscendingOrder,
+                          QtCore.Qt.DescendingOrder)]
+    result["filter_keystroke"] = [timed(tab.set_filter, text)
+                                  for text in KEYSTROKES]
+
+    def select_all():
+        tab.updateModel(0, 1)
+        app.processEvents()
+
+    def invert():
+        tab.invert_selection()
+        app.processEvents()
+
+    result["select_all"] = [timed(select_all)]
+    result["invert"] = [timed(invert)]
+    tab.updateModel(0, 0)
+
+    names = [os.path.join(path, f"zz-bench-{i}") for i in range(EVENTS)]
+    for name in names:
+        open(name, "w").close()
+    start = time.perf_counter()
+    for name in names:
+        tab.change_detected(FileCreatedEvent(name))
+    created = (time.perf_counter() - start) / EVENTS
+    for name in names:
+        os.unlink(name)
+    start = time.perf_counter()
+    for name in names:
+        tab.change_detected(FileDeletedEvent(name))
+    deleted = (time.perf_counter() - start) / EVENTS
+    result["watch_created_event"] = [created]
+    result["watch_deleted_event"] = [deleted]
+    print(json.dumps(result))
+    os._exit(0)
+
+
+def compare(results, baseline, tolerance):
+    """Prints timings slower than the baseline. Returns the count."""
+    regressions = 0
+    for size, metrics in results.items():
+        for key, value in metrics.items():
+            try:
+                before = baseline[size][key]
+            except KeyError:
+                continue
+            if not isinstance(value, list) or not before:
+                continue
+            now, was = statistics.median(value), statistics.median(before)
+            if was and now > was * (1 + tolerance):
+                regressions += 1
+                print(f"REGRESSION {size} {key}: {was * 1000:.2f}ms -> "
+                      f"{now * 1000:.2f}ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", default="1000,100000,1000000",
+                        help="comma separated entry counts")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="JSON file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed slowdown against the baseline")
+    parser.add_argument("--once", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.once:
+        return once(args.once, args.runs)
+    home = common.make_home(1, 1)
+    results = {}
+    for size in map(int, args.sizes.split(",")):
+        path = make_tree(size)
+        results[str(size)] = common.run_child(
+            os.path.abspath(__file__),
+            ["--once", path, "--runs", str(args.runs)], home, 1)[0]
+        print(f"{size} entries, "
+              f"{results[str(size)]['bytes_per_row']:.0f} bytes/row")
+        for key, value in results[str(size)].items():
+            if isinstance(value, list):
+                common.report(key, [v * 1000 for v in value], "ms")
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(results, fh, indent=2)
+    if args.baseline:
+        with open(args.baseline) as fh:
+            if compare(results, json.load(fh), args.tolerance):
+                return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
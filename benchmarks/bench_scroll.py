@@ -0,0 +1,149 @@
+"""Measures repaint cost while scrolling each view through large listings.
+
+    python benchmarks/bench_scroll.py --sizes 10000,100000 --frames 60 \\
+        --output scroll.json --baseline scroll-baseline.json
+
+Each size is listed by a fresh offscreen instance. The Details, List and
+Icons views are then scrolled a page at a time, and each page is painted
+synchronously. The Thumbnails view is scrolled through a directory of
+generated images. Every frame records its paint time and the number of
+NavItemModel.data() calls it made, which is what optimizations of the
+data path should bring down. Comparison against a baseline works as in
+bench_model.py.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import bench_model
+import common
+
+VIEWS = ("Details", "List", "Icons", "Thumbnails")
+
+
+def make_images(count):
+    """Returns a directory holding count PNG images, creating it once."""
+    path = os.path.join(bench_model.scratch_dir(), f"navbench-img-{count}")
+    done = os.path.join(path, ".complete")
+    if os.path.exists(done):
+        return path
+    from PIL import Image
+    os.makedirs(path, exist_ok=True)
+    for i in range(count):
+        colour = (i * 37 % 256, i * 91 % 256, i * 53 % 256)
+        Image.new("RGB", (640, 480), colour).save(
+            os.path.join(path, f"img{i:05d}.png"))
+    open(done, "w").close()
+    return path
+
+
+def once(path, images, frames):
+    """Scrolls every view in this process, printing JSON."""
+    from PyQt5 import QtCore, QtWidgets
+    app = QtWidgets.QApplication([])
+    from src.core import Nav, NavView, NavSize
+    from src.model import NavItemModel
+    from src.navgator import Navgator
+    calls = [0]
+    data = NavItemModel.data
+
+    def counted(self, index, role=QtCore.Qt.DisplayRole):
+        calls[0] += 1
+        return data(self, index, role)
+
+    NavItemModel.data = counted
+    window = Navgator()  # noqa: F841, keeps the tab alive
+    tab = Nav.pact.tabbar.currentWidget()
+    result = {}
+    for name in VIEWS:
+        vtype = NavView[name]
+        loc = images if vtype == NavView.Thumbnails else path
+        tab.load_tab(loc)
+        size = NavSize.Small if vtype == NavView.Thumbnails else \
+            NavSize.Tiny
+        tab.switch_view(vtype, size)
+        app.processEvents()
+        vp = tab.view.viewport()
+        bar = tab.view.verticalScrollBar()
+        if bar.maximum() == 0:  # the list view flows sideways
+            bar = tab.view.horizontalScrollBar()
+        times, counts = [], []
+        for i in range(frames):
+            bar.setValue(i * bar.pageStep() % (bar.maximum() + 1))
+            app.processEvents()
+            calls[0] = 0
+            start = time.perf_counter()
+            vp.repaint()
+            times.append(time.perf_counter() - start)
+            counts.append(calls[0])
+        result[name] = {"rows": tab.model.rowCount(), "frame": times,
+                        "data_calls": counts}
+    print(json.dumps(result))
+    os._exit(0)
+
+
+def compare(results, baseline, tolerance):
+    """Prints frames slower or making more data() calls than baseline."""
+    regressions = 0
+    for size, views in results.items():
+        for view, metrics in views.items():
+            try:
+                before = baseline[size][view]
+            except KeyError:
+                continue
+            for key in ("frame", "data_calls"):
+                now = statistics.median(metrics[key])
+                was = statistics.median(before[key])
+                if was and now > was * (1 + tolerance):
+                    regressions += 1
+                    print(f"REGRESSION {size} {view} {key}: "
+                          f"{was:.4g} -> {now:.4g}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", default="10000,100000",
+                        help="comma separated entry counts")
+    parser.add_argument("--images", type=int, default=500,
+                        help="images listed by the thumbnails view")
+    parser.add_argument("--frames", type=int, default=60)
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="JSON file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed slowdown against the baseline")
+    parser.add_argument("--once", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.once:
+        return once(*args.once, args.frames)
+    home = common.make_home(1, 1)
+    images = make_images(args.images)
+    results = {}
+    for size in map(int, args.sizes.split(",")):
+        path = bench_model.make_tree(size)
+        views = common.run_child(
+            os.path.abspath(__file__),
+            ["--once", path, images, "--frames", str(args.frames)],
+            home, 1)[0]
+        results[str(size)] = views
+        for view, metrics in views.items():
+            print(f"{size} entries, {view} ({metrics['rows']} rows)")
+            common.report("frame", [t * 1000 for t in metrics["frame"]],
+                          "ms")
+            common.report("data() calls per frame", metrics["data_calls"],
+                          "")
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(results, fh, indent=2)
+    if args.baseline:
+        with open(args.baseline) as fh:
+            if compare(results, json.load(fh), args.tolerance):
+                return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+"""Measures how long it takes to build the main window.
+
+    python benchmarks/bench_startup.py --panes 4 --tabs 10 --runs 5
+
+Each run starts a fresh interpreter so that every measurement pays for
+imports and widget creation the way a real cold start does.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import common
+
+
+def once():
+    """Builds the window in this process and prints the timings."""
+    t0 = time.perf_counter()
+    from PyQt5 import QtWidgets
+    app = QtWidgets.QApplication([])
+    from src.navgator import Navgator
+    t1 = time.perf_counter()
+    w = Navgator()
+    app.processEvents()
+    t2 = time.perf_counter()
+    from src.core import Nav
+    tabs = [p.tabbar.widget(i) for p in w.panes
+            for i in range(p.tabbar.count())]
+    print(json.dumps({
+        "imports": t1 - t0,
+        "window": t2 - t1,
+        "total": t2 - t0,
+        "tabs": len(tabs),
+        "materialized": sum(1 for t in tabs if t.model is not None),
+        "pact": Nav.pact.pid,
+    }))
+    os._exit(0)  # skip saving settings and tearing down widgets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--panes", type=int, default=4)
+    parser.add_argument("--tabs", type=int, default=10,
+                        help="saved tabs per pane")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--once", action="store_true",
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.once:
+        return once()
+    home = common.make_home(args.panes, args.tabs)
+    results = common.run_child(os.path.abspath(__file__), ["--once"], home,
+                               args.runs)
+    print(f"{args.panes} panes x {args.tabs} tabs, "
+          f"{results[0]['materialized']}/{results[0]['tabs']} tabs "
+          "materialized at startup")
+    for key in ("imports", "window", "total"):
+        common.report(key, [r[key] for r in results])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+"""Helpers shared by the benchmark scripts.
+
+Benchmarks run the real application offscreen against a throwaway HOME
+so that they neither touch nor depend on the user's navgator.json.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_home(panes=4, tabs=10, locations=None, visible=2):
+    """Creates a temporary HOME holding a navgator.json with the given
+    number of panes and saved tabs. Returns its path."""
+    home = tempfile.mkdtemp(prefix="navbench-")
+    locations = locations or [ROOT]
+    conf = {"panes": {"total": panes, "active": "Pane 1"}}
+    for i in range(1, panes + 1):
+        saved = {"total": tabs, "active": 0}
+        for j in range(tabs):
+            saved[str(j)] = {"location": locations[j % len(locations)],
+                             "history": [], "future": []}
+        conf["panes"][f"Pane {i}"] = {"visible": i <= visible,
+                                      "tabs": saved}
+    conf["dims"] = {
+        "main": [0, 0, 1200, 800], "tp": [100, 550, 550],
+        "p12": [400, 400], "p23": [400, 400],
+        **{f"Pane {i}": [50, 500] for i in range(1, panes + 1)},
+    }
+    with open(os.path.join(home, "navgator.json"), "w") as fh:
+        json.dump(conf, fh)
+    return home
+
+
+def child_env(home):
+    """Environment for running the application headless."""
+    env = dict(os.environ, HOME=home, QT_QPA_PLATFORM="offscreen")
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in (ROOT, env.get("PYTHONPATH")) if p)
+    return env
+
+
+def run_child(script, args, home, runs=3):
+    """Runs script once per run in a fresh interpreter. Each run prints a
+    JSON object on its last line; returns the list of those objects."""
+    results = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, script] + args,
+                             env=child_env(home), check=True,
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.DEVNULL,
+                             universal_newlines=True).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+    return results
+
+
+def report(name, samples, unit="s"):
+    """Prints min/median/max for a list of samples."""
+    print(f"{name:<30} min {min(samples):8.3f}{unit} "
+          f"median {statistics.median(samples):8.3f}{unit} "
+          f"max {max(samples):8.3f}{unit}")
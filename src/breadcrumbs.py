@@ -1,18 +1,78 @@
+import logging
 import os
 import pathlib
+from concurrent import futures
 from PyQt5 import QtGui, QtCore, QtWidgets
 from .core import Nav
-# from .helper import logger
+from .navcache import NavDirCache
+
+logger = logging.getLogger(__name__)
+
+
+class NavFolderModel(QtCore.QAbstractListModel):
+    """Folders of a breadcrumb menu matching its filter. Rows are handed
+    to the view a page at a time through fetchMore, as it scrolls."""
+    page = 100  # rows added at a time
+
+    def __init__(self, icon, parent=None):
+        super().__init__(parent)
+        self.icon = icon
+        self.names = []  # (sort key, name) of the folders, sorted
+        self.text = ""
+        self.matching = []  # names matching text
+        self.rows = 0  # rows of matching handed to the view
+
+    def set_names(self, names):
+        self.names = names
+        self.set_filter(self.text)
+
+    def set_filter(self, text):
+        """Shows the first page of folders containing text."""
+        self.beginResetModel()
+        self.text = text.lower()
+        self.matching = [n for k, n in self.names if self.text in k]
+        self.rows = min(self.page, len(self.matching))
+        self.endResetModel()
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else self.rows
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and self.rows < len(self.matching)
+
+    def fetchMore(self, parent):
+        rows = min(self.page, len(self.matching) - self.rows)
+        self.beginInsertRows(parent, self.rows, self.rows + rows - 1)
+        self.rows += rows
+        self.endInsertRows()
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == QtCore.Qt.DisplayRole:
+            return self.matching[index.row()]
+        elif role == QtCore.Qt.DecorationRole:
+            return self.icon
+        return None
 
 
 class NavBreadCrumbMenu(QtWidgets.QLabel):
-    """A class to present drop down menu on crumbs down arrow click."""
+    """A class to present drop down menu on crumbs down arrow click. The
+    menu opens at once and fills from the cached listing if any, then as
+    the directory is listed in the background through NavDirCache. Typing
+    filters the folders. They're listed in a view rather than as menu
+    actions, which an open menu lays out again one by one."""
     open_location = QtCore.pyqtSignal("QString")
+    # generation, [(sort key, name)] sorted, whether they replace those
+    # listed so far, whether the listing is done
+    listed = QtCore.pyqtSignal(int, list, bool, bool)
     arrow_right_icon = arrow_down_icon = folder_icon = None
+    pool = futures.ThreadPoolExecutor(2, thread_name_prefix="NavBreadCrumb")
+    visible_rows = 20  # rows the menu grows to before scrolling
 
     def __init__(self, path):
         super().__init__()
-        self.cwd = QtCore.QDir(path)
+        self.path = path
         if self.arrow_right_icon is None:
             self.__class__.arrow_right_icon = QtGui.QIcon.fromTheme(
                 "arrow-right").pixmap(QtCore.QSize(16, 16))
@@ -20,33 +80,155 @@ class NavBreadCrumbMenu(QtWidgets.QLabel):
                 "arrow-down").pixmap(QtCore.QSize(16, 16))
             self.__class__.folder_icon = QtGui.QIcon.fromTheme("folder")
         self.setPixmap(self.arrow_right_icon)
+        self.generation = 0
+        self.names = []  # (sort key, name) of the folders listed so far
+        self.loading = False
         self.menu = QtWidgets.QMenu()
-        self.menu.setStyleSheet("menu-scrollable: 1;")
         self.menu.aboutToHide.connect(self.onMenuHidden)
+        self.model = NavFolderModel(self.folder_icon, self)
+        panel = QtWidgets.QWidget()
+        lyt = QtWidgets.QVBoxLayout(panel)
+        lyt.setContentsMargins(2, 2, 2, 2)
+        self.filter = QtWidgets.QLineEdit()
+        self.filter.setPlaceholderText("Filter")
+        self.filter.setClearButtonEnabled(True)
+        self.filter.textChanged.connect(self.filter_changed)
+        self.filter.returnPressed.connect(self.open_current)
+        self.filter.installEventFilter(self)
+        self.view = QtWidgets.QListView()
+        self.view.setModel(self.model)
+        self.view.setUniformItemSizes(True)
+        self.view.setFrameShape(QtWidgets.QFrame.NoFrame)
+        self.view.setMinimumWidth(250)
+        self.view.clicked.connect(self.onMenuItemClicked)
+        self.view.activated.connect(self.onMenuItemClicked)
+        self.status = QtWidgets.QLabel()
+        self.status.setEnabled(False)
+        lyt.addWidget(self.filter)
+        lyt.addWidget(self.view)
+        lyt.addWidget(self.status)
+        action = QtWidgets.QWidgetAction(self.menu)
+        action.setDefaultWidget(panel)
+        self.menu.addAction(action)
+        self.fill_timer = QtCore.QTimer(self)
+        self.fill_timer.setSingleShot(True)
+        self.fill_timer.timeout.connect(self.fill)
+        self.listed.connect(self.add_names)
 
     def mousePressEvent(self, event):
-        """Populates the drop down menu on arrow button click."""
-        self.menu.clear()
-        self.cwd.setFilter(QtCore.QDir.NoDotAndDotDot | QtCore.QDir.Dirs)
-        if self.cwd.entryList():
-            for d in self.cwd.entryList():
-                action = self.menu.addAction(self.folder_icon, d)
-                action.triggered.connect(self.onMenuItemClicked)
-        else:
-            action = self.menu.addAction("No folders")
-            action.setDisabled(True)
-
+        """Opens the drop down menu on arrow button click, listing the
+        folders in the background."""
+        self.generation += 1
+        self.filter.clear()
+        self.names = []
+        self.loading = True
+        self.fill()
+        self.pool.submit(self.list_folders, self.path, self.generation)
         self.setPixmap(self.arrow_down_icon)
         self.menu.popup(self.mapToGlobal(self.frameRect().bottomLeft()))
+        self.filter.setFocus()
         event.accept()
 
+    def eventFilter(self, obj, event):
+        """Moves from the filter into the folders with the down key."""
+        if event.type() == QtCore.QEvent.KeyPress and \
+                event.key() == QtCore.Qt.Key_Down and self.model.rows:
+            self.view.setCurrentIndex(self.model.index(0))
+            self.view.setFocus()
+            return True
+        return False
+
+    @staticmethod
+    def folders(entries):
+        """Returns the visible folders among entries as (key, name)."""
+        return sorted((e.name.lower(), e.name) for e in entries
+                      if e.is_dir and not e.name.startswith("."))
+
+    def list_folders(self, path, generation):
+        """Lists path, the cached listing first while it's revalidated.
+        Runs in the pool."""
+        replace = [True]
+
+        def emit(names, done):
+            try:
+                self.listed.emit(generation, names, replace[0], done)
+            except RuntimeError:  # the crumb is gone, the cache isn't
+                pass
+            replace[0] = False
+
+        cached = NavDirCache.peek(path)
+        if cached is not None:
+            emit(self.folders(cached), False)
+            replace[0] = True  # by a scan if it's stale
+        try:
+            listing = NavDirCache.get(
+                path, progress=lambda batch: emit(self.folders(batch), False))
+        except OSError as e:
+            logger.debug("Unable to list %s: %s", path, e)
+            listing = []
+        replace[0] = True
+        emit(self.folders(listing), True)
+
+    def add_names(self, generation, names, replace, done):
+        """Takes folders from the pool. Replacements are shown at once,
+        batches added to them shortly after."""
+        if generation != self.generation:
+            return
+        self.loading = not done
+        if replace:
+            self.names = names
+            self.fill_timer.stop()
+            self.fill()
+            return
+        self.names.extend(names)
+        if not self.fill_timer.isActive():
+            self.fill_timer.start(100)
+
+    def filter_changed(self, text):
+        self.model.set_filter(text)
+        self.update_status()
+
+    def fill(self):
+        """Hands the folders listed so far to the view."""
+        self.names.sort()  # merges the sorted batches
+        self.model.set_names(self.names)
+        self.update_status()
+
+    def update_status(self):
+        """Sizes the view to the folders and tells whether more are
+        coming."""
+        rows = min(len(self.model.matching), self.visible_rows)
+        self.view.setFixedHeight(max(rows, 1) *
+                                 max(self.view.sizeHintForRow(0), 1))
+        self.view.setVisible(bool(rows))
+        count = len(self.model.matching)
+        self.status.setText("Loading..." if self.loading else
+                            "No folders" if not count else
+                            "1 folder" if count == 1 else f"{count} folders")
+        if self.menu.isVisible():
+            self.menu.adjustSize()
+
+    def open_current(self):
+        """Opens the selected folder, or the first one matching."""
+        index = self.view.currentIndex()
+        if not index.isValid() and self.model.rows:
+            index = self.model.index(0)
+        if index.isValid():
+            self.onMenuItemClicked(index)
+
     def onMenuHidden(self):
         """Reverts back the down arrow to right arrow."""
         self.setPixmap(self.arrow_right_icon)
+        self.generation += 1  # drops batches still coming
+        self.names = []
+        self.model.set_names([])
+        self.fill_timer.stop()
 
-    def onMenuItemClicked(self):
+    def onMenuItemClicked(self, index):
         """Emits a clicked event with location to navigate to."""
-        self.open_location.emit(self.cwd.filePath(self.sender().text()))
+        name = index.data()
+        self.menu.hide()
+        self.open_location.emit(os.path.join(self.path, name))
 
 
 class NavBreadCrumb(QtWidgets.QLabel):
@@ -56,22 +238,22 @@ class NavBreadCrumb(QtWidgets.QLabel):
 
     def __init__(self, path, current=False):
         super().__init__()
-        self.cwd = QtCore.QDir(path)
+        self.path = path
         if self.root_icon is None:
             self.__class__.root_icon = QtGui.QIcon.fromTheme(
                 "drive-harddisk").pixmap(QtCore.QSize(16, 16))
 
-        if self.cwd.isRoot():
+        if os.path.dirname(path) == path:
             self.setPixmap(self.root_icon)
         else:
-            self.setText(self.cwd.dirName())
+            self.setText(os.path.basename(path))
 
         if current:
             self.setStyleSheet("QtWidgets.QLabel { font-weight: bold; }")
 
     def mousePressEvent(self, event):
         """Emits a clicked event with location to navigate to."""
-        self.open_location.emit(self.cwd.absolutePath())
+        self.open_location.emit(self.path)
         event.accept()
 
 
@@ -122,7 +304,7 @@ class NavBreadCrumbsBar(QtWidgets.QFrame):
                 try:
                     wid = self.layout().itemAt(i).widget()
                     # logger.debug(wid)
-                    if common == wid.cwd.absolutePath():
+                    if common == wid.path:
                         break
                     wid.close()
                     wid.deleteLater()
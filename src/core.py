@@ -16,10 +16,22 @@ class Nav:
 
     conf = {
         "panes": {"total": 4, "active": "Pane 1", },
-        "window": {"main_tree": True, "statusbar": True},
+        "window": {"main_tree": True, "statusbar": True, "perf_hud": False},
         "history_without_dupes": True,
         "sort_folders_first": True,
         "watch_all_tabs": True,
+        "watch_budget": 512,  # capped by the inotify watch limit
+        "session_snapshot": True,  # paint tabs from the last session
+        "session_interval": 60,  # seconds between session snapshots
+        # Root level and levels by module name, e.g. {"tabs": "DEBUG"}
+        "logging": {"level": "INFO", "modules": {}},
+        "profile_seconds": 10,  # default length of a sampling profile
+        "stall_ms": 150,  # GUI thread stalls longer are reported, 0 is off
+        "viewer_prefetch": 2,  # images decoded ahead each way in the viewer
+        "viewer_cache_mb": 256,  # decoded images kept by the viewer
+        "viewer_decode_mp": 64,  # megapixels a JPEG is decoded at, at most
+        "viewer_animation_mb": 64,  # frames an animation keeps decoded
+        "prefetch_entries": 50000,  # listed ahead of navigation, 0 is off
         "shortcuts": {"back": "backspace", },
         "colors": {"bcbar": {"active": "blue", "inactive": "green"}},
     }
@@ -1,5 +1,6 @@
 from PyQt5 import QtWidgets, QtCore
 from dataclasses import dataclass
+from .navtree import NavTreeModel
 
 
 @dataclass
@@ -16,16 +17,26 @@ class NavTree(QtWidgets.QTreeView):
         super().__init__()
         self.setSizePolicy(QtWidgets.QSizePolicy.Preferred,
                            QtWidgets.QSizePolicy.Expanding)
-        self.model = QtWidgets.QFileSystemModel(self)
-        self.model.setRootPath("/")
-        self.model.setResolveSymlinks(False)
-        self.model.setFilter(QtCore.QDir.AllDirs | QtCore.QDir.NoDotAndDotDot)
+        # One model shared by all trees, expansion state is per view
+        self.model = NavTreeModel.instance()
         self.setModel(self.model)
-        self.setRootIndex(self.model.index(None))
-        self.hideColumn(1)
-        self.hideColumn(2)
-        self.hideColumn(3)
+        self.expanded.connect(self.model.revalidate)
+        self.model.revealed.connect(self.revealed)
         self.setHeaderHidden(True)
+        self.target = None  # path to select once revealed
+
+    def reveal(self, path):
+        """Selects path once the shared model has listed its way to it."""
+        self.target = path
+        self.model.reveal(path)
+
+    def revealed(self, path):
+        if path != self.target:
+            return
+        self.target = None
+        index = self.model.path_index(path)
+        self.setCurrentIndex(index)
+        self.scrollTo(index)
 
 
 class NavCheckBoxDelegate(QtWidgets.QStyledItemDelegate):
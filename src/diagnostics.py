@@ -0,0 +1,57 @@
+import logging
+from PyQt5 import QtWidgets
+
+logger = logging.getLogger(__name__)
+
+
+class NavDiagnostics(QtWidgets.QDialog):
+    """Dialog listing internal counters published by various services."""
+    providers = {}  # section -> callable returning {name: value}
+
+    @classmethod
+    def register(cls, section, provider):
+        """Registers a callable to be queried whenever shown."""
+        cls.providers[section] = provider
+
+    @classmethod
+    def get(cls, section):
+        """Queries the provider of a single section, if registered."""
+        provider = cls.providers.get(section)
+        if provider is None:
+            return {}
+        try:
+            return provider()
+        except Exception as e:
+            logger.error("Error collecting %s diagnostics: %s", section, e)
+            return {"Error": str(e)}
+
+    @classmethod
+    def collect(cls):
+        """Queries all providers for their current counters."""
+        return {section: cls.get(section) for section in list(cls.providers)}
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.tree = QtWidgets.QTreeWidget()
+        self.tree.setHeaderLabels(["Name", "Value"])
+        refresh = QtWidgets.QPushButton("Refresh")
+        refresh.clicked.connect(self.refresh)
+        close = QtWidgets.QPushButton("Close")
+        close.clicked.connect(self.hide)
+        lyt = QtWidgets.QGridLayout(self)
+        lyt.addWidget(self.tree, 0, 0, 1, 3)
+        lyt.addWidget(refresh, 1, 1)
+        lyt.addWidget(close, 1, 2)
+        self.setWindowTitle("Diagnostics")
+        self.resize(500, 400)
+        self.refresh()
+
+    def refresh(self):
+        """Repopulates the counters."""
+        self.tree.clear()
+        for section, stats in self.collect().items():
+            item = QtWidgets.QTreeWidgetItem(self.tree, [section])
+            for k, v in stats.items():
+                QtWidgets.QTreeWidgetItem(item, [k, str(v)])
+            item.setExpanded(True)
+        self.tree.resizeColumnToContents(0)
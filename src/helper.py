@@ -1,48 +1,52 @@
 import collections
 import functools
-import logging.config
+import logging
 import sys
 
 
-lconf = {
-        'version': 1,
-        'disable_existing_loggers': False,
-        'formatters': {
-            'detailed': {
-                'class': 'logging.Formatter',
-                'format': '%(asctime)s - %(levelname)s - %(filename)s - '
-                          '%(funcName)s - %(lineno)d - %(message)s',
-                'datefmt': '%Y-%m-%d %H:%M:%S'
-            }
-        },
-        'handlers': {
-            'console': {
-                'class': 'logging.StreamHandler',
-                'level': 'DEBUG',
-                'formatter': 'detailed',
-            },
-            'file': {
-                'class': 'logging.FileHandler',
-                'filename': '/tmp/navgator.log',
-                'mode': 'w',
-                'level': 'DEBUG',
-                'formatter': 'detailed',
-            },
-        },
-        'loggers': {
-            'foo': {
-                'handlers': []
-            }
-        },
-        'root': {
-            'level': 'DEBUG',
-            'handlers': ['console', 'file']
-        },
-    }
-logging.config.dictConfig(lconf)
+log_format = ("%(asctime)s - %(levelname)s - %(filename)s - "
+              "%(funcName)s - %(lineno)d - %(message)s")
+log_file = "/tmp/navgator.log"
+log_listener = None
 logger = logging.getLogger(__name__)
 
 
+def setup_logging(conf=None):
+    """Configures logging. Called by entry points, not on import.
+
+    Records are handed to a queue and written by a listener thread so
+    that the GUI thread never waits on the console or the log file.
+    conf holds the root "level" and per module "modules" levels keyed by
+    module name, e.g. {"level": "INFO", "modules": {"tabs": "DEBUG"}}.
+    """
+    global log_listener
+    conf = conf or {}
+    root = logging.getLogger()
+    if log_listener is None:
+        import atexit
+        import logging.handlers as log_handlers
+        import queue
+        # Not shown by the format, skip collecting them per record
+        logging.logProcesses = logging.logMultiprocessing = False
+        formatter = logging.Formatter(log_format, "%Y-%m-%d %H:%M:%S")
+        handlers = [logging.StreamHandler()]
+        try:
+            handlers.append(logging.FileHandler(log_file, mode="w"))
+        except OSError as e:
+            print(f"Unable to log to {log_file}: {e}", file=sys.stderr)
+        for handler in handlers:
+            handler.setFormatter(formatter)
+        log_queue = queue.SimpleQueue()
+        root.addHandler(log_handlers.QueueHandler(log_queue))
+        log_listener = log_handlers.QueueListener(log_queue, *handlers)
+        log_listener.start()
+        atexit.register(log_listener.stop)
+    root.setLevel(conf.get("level", "INFO"))
+    package = f"{__package__}." if __package__ else ""
+    for module, level in conf.get("modules", {}).items():
+        logging.getLogger(f"{package}{module}").setLevel(level)
+
+
 def humansize(num, power=1024, sep=' ', precision=2, unit=None):
     """Converts raw bytes to a human friendly format."""
     if power == 1024:
@@ -111,8 +115,8 @@ def debug(func):
         args_repr = [repr(a) for a in args]
         kwargs_repr = [f"{k}={v!r}" for k, v in kwargs.items()]
         signature = ", ".join(args_repr + kwargs_repr)
-        logger.debug(f"{caller} called {func.__name__}({signature})")
+        logger.debug("%s called %s(%s)", caller, func.__name__, signature)
         value = func(*args, **kwargs)
-        logger.debug(f"{func.__name__!r} returned {value!r}")
+        logger.debug("%r returned %r", func.__name__, value)
         return value
     return wrapper_debug
@@ -1,32 +1,372 @@
-import magic
+import collections
+import itertools
+import logging
+import math
+import os
+import threading
+import time
+from concurrent import futures
 from PyQt5 import QtCore, QtWidgets, QtGui
-from PIL.ImageQt import ImageQt
 from .core import Nav
-from .helper import logger  # , humansize, to_bytes
+from .diagnostics import NavDiagnostics
+from .navmime import NavMime
+from .navperf import NavPerf
+
+logger = logging.getLogger(__name__)
+
+
+# A decoded image or tile. data holds the pixels of image and has to
+# outlive it. full is the size of the whole image at level 0, level the
+# power of two it was reduced by and finest the lowest level decodable
+# within the decode budget. animated tells whether image is only the
+# first frame of an animation.
+NavDecoded = collections.namedtuple("NavDecoded",
+                                    "image data full level finest animated")
+TILE = 512  # pixels per side of a tile, at its level
+
+
+def open_image(path):
+    """Opens path without decoding it. JPEGs past PIL's decompression bomb
+    limit are opened too as they're decoded at a fraction of their size,
+    other formats have to be decoded whole and are refused."""
+    from PIL import Image, JpegImagePlugin
+    try:
+        return Image.open(path)
+    except Image.DecompressionBombError:
+        with open(path, "rb") as fh:
+            if fh.read(2) != b"\xff\xd8":
+                raise
+        return JpegImagePlugin.JpegImageFile(path)
+
+
+def finest_level(im):
+    """Returns the lowest level im decodes at within the budget. JPEG
+    and JPEG 2000 decoders reduce while decoding, others decode whole
+    whatever the level."""
+    level = 0
+    if im.format in ("JPEG", "JPEG2000"):
+        limit = Nav.conf["viewer_decode_mp"] * 1000000
+        while im.width * im.height / 4 ** level > limit:
+            level += 1
+    return level
+
+
+def level_size(full, level):
+    """Returns the size of an image at level, rounded up like PIL."""
+    return (-(-full[0] // 2 ** level), -(-full[1] // 2 ** level))
+
+
+def decode_level(im, level):
+    """Decodes im reduced by 2**level, through draft which has libjpeg
+    scale by up to 8 while decoding and reduce for the rest."""
+    width, height = level_size(im.size, level)
+    if level:
+        im.draft(im.mode, (width, height))
+        factor = min(im.width // width, im.height // height)
+        if factor > 1:
+            if im.mode not in ("L", "RGB", "RGBA"):
+                im = im.convert("RGBA" if "A" in im.getbands() or
+                                "transparency" in im.info else "RGB")
+            return im.reduce(factor)
+    im.load()
+    return im
+
+
+def to_qimage(im):
+    """Converts im into a QImage in a format QPixmap takes without
+    converting. Returns the image and the buffer holding its pixels."""
+    if "A" in im.getbands() or "transparency" in im.info:
+        im = im.convert("RGBA")
+        raw, fmt = "BGRA", QtGui.QImage.Format_ARGB32
+    else:
+        im = im.convert("RGB")
+        raw, fmt = "BGRX", QtGui.QImage.Format_RGB32
+    data = im.tobytes("raw", raw)
+    return QtGui.QImage(data, im.width, im.height, im.width * 4, fmt), data
+
+
+def decode_image(path, fit):
+    """Decodes path at the level closest to covering fit, (width, height)
+    in pixels, without going below it."""
+    with open_image(path) as im:
+        full = im.size
+        finest = finest_level(im)
+        animated = getattr(im, "is_animated", False)
+        ratio = min(full[0] / fit[0], full[1] / fit[1])
+        level = max(finest, int(math.log2(ratio)) if ratio >= 2 else 0)
+        image, data = to_qimage(decode_level(im, level))
+    return NavDecoded(image, data, full, level, finest, animated)
+
+
+def decode_tiles(path, level, tiles, budget=0):
+    """Decodes path at level and yields ((column, row), NavDecoded) for
+    the given tiles, and then for the tiles around them, the closest
+    first, within budget bytes of pixels as the level is decoded whole
+    whatever the tiles."""
+    with open_image(path) as im:
+        full = im.size
+        finest = finest_level(im)
+        scaled = decode_level(im, level)
+        columns = -(-scaled.width // TILE)
+        rows = -(-scaled.height // TILE)
+        x = sum(t[0] for t in tiles) / len(tiles)
+        y = sum(t[1] for t in tiles) / len(tiles)
+        around = sorted(set(itertools.product(range(columns), range(rows)))
+                        - set(tiles),
+                        key=lambda t: max(abs(t[0] - x), abs(t[1] - y)))
+        for column, row in itertools.chain(tiles, around):
+            if budget < 0 and (column, row) not in tiles:
+                return
+            budget -= TILE * TILE * 4
+            box = (column * TILE, row * TILE,
+                   min((column + 1) * TILE, scaled.width),
+                   min((row + 1) * TILE, scaled.height))
+            image, data = to_qimage(scaled.crop(box))
+            yield (column, row), NavDecoded(image, data, full, level,
+                                            finest, False)
+
+
+class NavImageCache:
+    """Process wide cache of decoded images and tiles for the viewer,
+    keyed by path or (path, level, column, row). Entries are revalidated
+    against the file mtime and the least recently used are dropped once
+    their pixels exceed the budget."""
+    images = collections.OrderedDict()  # key -> (mtime_ns, NavDecoded)
+    budget = 256 * 1024 * 1024  # bytes of pixels kept
+    used = 0
+    hits = misses = 0
+    lock = threading.Lock()
+
+    @classmethod
+    def get(cls, key, stamp, count=True):
+        """Returns the NavDecoded of key, or None."""
+        with cls.lock:
+            entry = cls.images.get(key)
+            if entry is None or entry[0] != stamp:
+                cls.misses += count
+                return None
+            cls.images.move_to_end(key)
+            cls.hits += count
+            return entry[1]
+
+    @classmethod
+    def put(cls, key, stamp, decoded):
+        """Stores a decoded image, dropping least recently used ones."""
+        with cls.lock:
+            old = cls.images.pop(key, None)
+            if old is not None:
+                cls.used -= len(old[1].data)
+            if len(decoded.data) > cls.budget:
+                return
+            cls.images[key] = (stamp, decoded)
+            cls.used += len(decoded.data)
+            while cls.used > cls.budget:
+                _, (_, dropped) = cls.images.popitem(last=False)
+                cls.used -= len(dropped.data)
+
+    @classmethod
+    def diagnostics(cls):
+        """Returns cache counters for the diagnostics dialog."""
+        return {
+            "Images": len(cls.images),
+            "Bytes": cls.used,
+            "Budget": cls.budget,
+            "Hits": cls.hits,
+            "Misses": cls.misses,
+        }
+
+
+class NavAnimation(QtCore.QObject):
+    """Plays an animated GIF, WebP or PNG. A thread decodes frames ahead of
+    the one shown, scaled to the zoom, and keeps them within the budget,
+    which holds every frame of most animations so that they're decoded
+    once. Frames are shown by the clock; when decoding falls behind, the
+    frames whose time passed are dropped instead of waited for."""
+    ready = QtCore.pyqtSignal()
+    ahead = 8  # frames decoded ahead of the one shown
+    budget = 64 * 1024 * 1024  # bytes of frames kept
+    resync = 1  # seconds late past which the clock restarts
+    shown = dropped = 0
+
+    def __init__(self, path, scale, show, parent=None):
+        super().__init__(parent)
+        self.path, self.scale, self.show = path, scale, show
+        self.frames = {}  # index -> (scale, ms, QImage, pixels)
+        self.used = 0
+        self.count = self.end = self.full = None  # known once opened
+        self.position = 0  # frames shown or dropped since it started
+        self.due = None  # perf_counter at which position is shown
+        self.last = 100  # ms of the frame last shown
+        self.waiting = True  # for the frame at position
+        self.stopping = False
+        self.cond = threading.Condition()
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.tick)
+        self.ready.connect(self.tick)
+        threading.Thread(target=self.run, name="NavAnimation",
+                         daemon=True).start()
+
+    def stop(self):
+        self.timer.stop()
+        with self.cond:
+            self.stopping = True
+            self.cond.notify_all()
+
+    def rescale(self, scale):
+        """Has frames decoded at scale from now on, those at another
+        scale are shown until replaced."""
+        with self.cond:
+            if scale != self.scale:
+                self.scale = scale
+                self.cond.notify_all()
+
+    def run(self):
+        try:
+            with open_image(self.path) as im:
+                with self.cond:
+                    self.full = im.size
+                    self.count = getattr(im, "n_frames", 1)
+                    # GIFs without a loop count are played once
+                    loops = im.info.get("loop", 1)
+                    self.end = self.count * loops if loops else None
+                self.decode(im)
+        except Exception as e:
+            logger.debug("Unable to play %s: %s", self.path, e)
+
+    def next_frame(self, wanted):
+        """Waits until a frame has to be decoded and returns it, or None
+        once stopped. Frames passed by meanwhile are skipped."""
+        with self.cond:
+            while not self.stopping:
+                wanted = max(wanted, self.position)
+                if wanted - self.position >= self.ahead or \
+                        self.end is not None and wanted >= self.end:
+                    self.cond.wait()
+                    continue
+                entry = self.frames.get(wanted % self.count)
+                if entry is not None and entry[0] == self.scale:
+                    wanted += 1
+                    continue
+                return wanted
+        return None
+
+    def decode(self, im):
+        """Runs on the thread, decoding frames until stopped."""
+        from PIL import Image, ImageSequence
+        frames = ImageSequence.Iterator(im)
+        wanted = 0
+        while True:
+            wanted = self.next_frame(wanted)
+            if wanted is None:
+                return
+            index, scale = wanted % self.count, self.scale
+            with NavPerf.timed("animation_frame"):
+                # Seeks, compositing on the way. WebP has the duration
+                # once loaded.
+                frame = frames[index].convert("RGBA")
+                # Browsers and QMovie play frames this short at 10 fps
+                ms = im.info.get("duration") or 0
+                ms = ms if ms > 10 else 100
+                if scale < 1:
+                    frame = frame.resize(
+                        (max(1, round(frame.width * scale)),
+                         max(1, round(frame.height * scale))),
+                        Image.BILINEAR, reducing_gap=2.0)
+                image, data = to_qimage(frame)
+            with self.cond:
+                old = self.frames.get(index)
+                if old is not None:
+                    self.used -= len(old[3])
+                self.frames[index] = (scale, ms, image, data)
+                self.used += len(data)
+                self.evict()
+                notify = self.waiting
+            wanted += 1
+            if notify:
+                try:
+                    self.ready.emit()
+                except RuntimeError:  # the viewer is gone
+                    return
+
+    def evict(self):
+        """Drops frames needed last, those at another scale first, until
+        within budget. Frames about to be shown are kept regardless."""
+        start = self.position % self.count
+        while self.used > self.budget:
+            index = max(self.frames, key=lambda k: (
+                self.frames[k][0] != self.scale, (k - start) % self.count))
+            if self.frames[index][0] == self.scale and \
+                    (index - start) % self.count < self.ahead:
+                break
+            self.used -= len(self.frames.pop(index)[3])
+
+    def tick(self):
+        """Shows the frame due, dropping those decoded too late for
+        their turn."""
+        now = time.perf_counter()
+        with self.cond:
+            if self.stopping or self.count is None:
+                return
+            if self.due is None or now - self.due > self.resync:
+                self.due = now
+            while self.end is None or self.position < self.end:
+                entry = self.frames.get(self.position % self.count)
+                ms = entry[1] if entry is not None else self.last
+                if now < self.due + ms / 1000:
+                    break
+                self.position += 1
+                self.due += ms / 1000
+                NavAnimation.dropped += 1
+            else:
+                return  # played through
+            self.waiting = entry is None
+            if self.waiting:  # ready ticks again once it's decoded
+                self.cond.notify_all()
+                return
+            self.position += 1
+            self.due += ms / 1000
+            self.last = ms
+            self.cond.notify_all()
+            full = self.full
+        NavAnimation.shown += 1
+        self.show(entry[2], full)
+        self.timer.start(max(0, int((self.due - time.perf_counter()) *
+                                    1000)))
+
+    @classmethod
+    def diagnostics(cls):
+        """Returns frame counters for the diagnostics dialog."""
+        return {
+            "Shown": cls.shown,
+            "Dropped": cls.dropped,
+            "Budget": cls.budget,
+        }
 
 
 class NavViewer(QtWidgets.QMainWindow):
-    """Image Viewer"""
+    """Image Viewer. Images are decoded on workers, the current one
+    first and then the ones around it in the order they'd be shown."""
+    decoded = QtCore.pyqtSignal(str, object)
+    pool = futures.ThreadPoolExecutor(2, thread_name_prefix="NavViewer")
+
     def __init__(self, parent=None):
         super().__init__()
         self.setWindowIcon(Nav.icon)
-        self._zoom = 0
+        self.cur_file = None
+        self.pending = {}  # path -> future decoding it
+        self.failed = {}  # path -> stamp of the file PIL couldn't decode
+        self.decoded.connect(self.show_decoded)
+        NavImageCache.budget = Nav.conf["viewer_cache_mb"] * 1024 * 1024
+        NavAnimation.budget = Nav.conf["viewer_animation_mb"] * 1024 * 1024
         # self.setWindowFlags(QtCore.Qt.FramelessWindowHint)
         self.setGeometry(QtWidgets.QDesktopWidget().screenGeometry(-1))
-        self.main_widget = QtWidgets.QWidget(self)
-        self.stack = QtWidgets.QStackedLayout(self.main_widget)
+        # Images are first decoded about as large as the screen
+        ratio = self.devicePixelRatioF()
+        self.fit = (self.width() * ratio, self.height() * ratio)
         self.imgvwr = ImageViewer(self)
         self.imgvwr.setFocusPolicy(QtCore.Qt.NoFocus)
-        self.gifvwr = QtWidgets.QLabel()
-        self.gifvwr.setAlignment(QtCore.Qt.AlignCenter)
-        self.gifvwr.setStyleSheet("background-color: black")
-        self.gifvwr.setGeometry(self.geometry())
-        self.gifvwr.setSizePolicy(QtWidgets.QSizePolicy.Ignored,
-                                  QtWidgets.QSizePolicy.Ignored)
-        # self.movie = QtGui.QMovie("a")
-        self.stack.addWidget(self.gifvwr)
-        self.stack.addWidget(self.imgvwr)
-        self.setCentralWidget(self.main_widget)
+        self.setCentralWidget(self.imgvwr)
         self.setFocus()
         self.installEventFilter(self)
 
@@ -42,15 +382,26 @@ class NavViewer(QtWidgets.QMainWindow):
             elif key == QtCore.Qt.Key_Right or key == QtCore.Qt.Key_Space:
                 self.load_index(self.owner.proxy.next_index(self.ind))
             elif key == QtCore.Qt.Key_Delete and self.cur_file is not None:
-                logger.debug(f"Deleting {self.cur_file}")
-                self.owner.trash([self.cur_file])
-                self.load_index(self.ind) or \
-                    (self.load_index(self.owner.proxy.previous_index(self.ind))
-                        if self.ind > 0 else self.load_index(self.ind))
+                logger.debug("Deleting %s", self.cur_file)
+                if self.owner.trash([self.cur_file], self.trashed):
+                    self.cur_file = None
             else:
                 super().keyPressEvent(event)
         return False
 
+    def trashed(self, done, errors):
+        """Shows the image which took the place of the trashed one."""
+        total = self.owner.proxy.rowCount()
+        if total == 0:
+            self.close()
+            return
+        self.load_index(min(self.ind, total - 1))
+
+    def closeEvent(self, event):
+        """Stops animations, the window is kept for next time."""
+        self.imgvwr.stop()
+        super().closeEvent(event)
+
     def loadCurrentImage(self, owner):
         """Gets the index for currently selected item."""
         self.owner = owner
@@ -78,55 +429,119 @@ class NavViewer(QtWidgets.QMainWindow):
                 self.setWindowTitle(f"Image Viewer")
             return False
         self.setWindowTitle(f"{self.ind+1}/{total}: {self.cur_file}")
+        self.show_image(self.cur_file)
+        self.prefetch(index)
+
+    @staticmethod
+    def stamp(path):
         try:
-            info = magic.detect_from_filename(self.cur_file)
-        except ValueError as e:
-            logger.debug(e)
-            return False
-        self._zoom = 0
-        if info.mime_type == "image/gif":
-            self.stack.setCurrentWidget(self.gifvwr)
-            # self.movie.stop()
-            # Instantiate again to remove scaling
-            self.movie = QtGui.QMovie(self.cur_file)
-            self.movie.setFileName(self.cur_file)
-            if self.movie.isValid():
-                self.movie.setSpeed(100)
-                self.gifvwr.setMovie(self.movie)
-                self.movie.start()
-            else:
-                self.stack.setCurrentWidget(self.imgvwr)
-                self.imgvwr.setPhoto(self.cur_file)
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def show_image(self, path):
+        """Shows a decoded image, or decodes it first keeping the previous
+        one on screen meanwhile."""
+        stamp = self.stamp(path)
+        decoded = NavImageCache.get(path, stamp)
+        if decoded is not None:
+            self.imgvwr.setPhoto(decoded, path, stamp)
+        elif self.failed.get(path, False) == stamp:
+            self.show_failed(path)
         else:
-            self.stack.setCurrentWidget(self.imgvwr)
-            self.imgvwr.setPhoto(self.cur_file)
+            self.request(path)
 
-    def wheelEvent(self, event):
-        """Handles wheel event for GIFs."""
-        if magic.detect_from_filename(self.cur_file).mime_type == "image/gif":
-            if event.angleDelta().y() > 0:
-                factor = 1.2
-                self._zoom += 1
-            else:
-                factor = 0.8
-                self._zoom -= 1
-            if self._zoom != 0:
-                newsize = QtCore.QSize(
-                    self.movie.currentImage().size().width() * factor,
-                    self.movie.currentImage().size().height() * factor)
-                self.movie.setScaledSize(newsize)
-                self.gifvwr.setAlignment(QtCore.Qt.AlignCenter)
-            else:
-                self._zoom = 0
+    def show_failed(self, path):
+        """Clears the view for an image which couldn't be decoded, rather
+        than decoding it whole through Qt on the GUI thread."""
+        self.imgvwr.setPhoto(QtGui.QPixmap())
+        self.setWindowTitle(f"{self.windowTitle()} (unable to show)")
+
+    def request(self, path):
+        if path not in self.pending:
+            self.pending[path] = self.pool.submit(self.decode, path)
+
+    def decode(self, path):
+        """Runs on a worker, caching the image of path."""
+        stamp = self.stamp(path)
+        try:
+            with NavPerf.timed("decode"):
+                decoded = decode_image(path, self.fit)
+        except Exception as e:
+            logger.debug("Unable to decode %s: %s", path, e)
+            self.failed[path] = stamp
+            decoded = None
+        else:
+            NavImageCache.put(path, stamp, decoded)
+        try:
+            self.decoded.emit(path, decoded)
+        except RuntimeError:  # the viewer is gone
+            pass
+
+    def show_decoded(self, path, decoded):
+        """Shows path if it's still the one awaited. decoded is passed on
+        as it isn't cached when larger than the budget."""
+        self.pending.pop(path, None)
+        if path != self.cur_file:
+            return
+        if decoded is None:
+            self.show_failed(path)
+        else:
+            self.imgvwr.setPhoto(decoded, path, self.stamp(path))
+
+    def prefetch(self, index):
+        """Decodes the images around index, nearest first, dropping queued
+        decodes of images no longer near."""
+        proxy = self.owner.proxy
+        wanted = {self.cur_file: None}
+        ahead = behind = index
+        for _ in range(Nav.conf["viewer_prefetch"]):
+            if ahead is not None:
+                ahead = proxy.next_index(ahead)
+            if behind is not None:
+                behind = proxy.previous_index(behind)
+            for row in (ahead, behind):
+                if row is not None:
+                    wanted[proxy.get_full_name_at_row(row)] = None
+        for path, future in list(self.pending.items()):
+            if path not in wanted and future.cancel():
+                del self.pending[path]
+        for path in wanted:
+            if not path or not self.decodable(path):
+                continue
+            stamp = self.stamp(path)
+            if self.failed.get(path, False) != stamp and \
+                    NavImageCache.get(path, stamp, False) is None:
+                self.request(path)
+
+    @staticmethod
+    def decodable(path):
+        """Whether path is worth decoding ahead. Types still being sniffed
+        count as images."""
+        mime = NavMime.lookup(path)
+        return mime is None or mime.startswith("image/")
 
 
 class ImageViewer(QtWidgets.QGraphicsView):
-    """Customised class to display images"""
+    """Customised class to display images. A decoded image is shown at
+    the size of the whole image, and when zoomed in past its resolution
+    the visible region is overlaid with tiles of a finer level. The
+    frames of animations are shown in place of their first one."""
+    tiles_decoded = QtCore.pyqtSignal(str)
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self._scene = QtWidgets.QGraphicsScene(self)
         self._photo = QtWidgets.QGraphicsPixmapItem()
+        self._photo.setTransformationMode(QtCore.Qt.SmoothTransformation)
         self._scene.addItem(self._photo)
+        self.path = self.decoded = self.stamp = self.animation = None
+        self.tiles = {}  # (level, column, row) -> QGraphicsPixmapItem
+        self.requested = set()  # levels being decoded
+        self.tile_timer = QtCore.QTimer(self)
+        self.tile_timer.setSingleShot(True)
+        self.tile_timer.timeout.connect(self.update_tiles)
+        self.tiles_decoded.connect(self.tiles_ready)
         self.setScene(self._scene)
         self.setTransformationAnchor(QtWidgets.QGraphicsView.AnchorUnderMouse)
         self.setResizeAnchor(QtWidgets.QGraphicsView.AnchorUnderMouse)
@@ -136,7 +551,7 @@ class ImageViewer(QtWidgets.QGraphicsView):
 
     def fit_to_view(self, scale=True):
         """Resizes image and rectangle to fit in main window"""
-        rect = QtCore.QRectF(self._photo.pixmap().rect())
+        rect = self._photo.sceneBoundingRect()
         if not rect.isNull():
             self.setSceneRect(rect)
             unity = self.transform().mapRect(QtCore.QRectF(0, 0, 1, 1))
@@ -150,15 +565,20 @@ class ImageViewer(QtWidgets.QGraphicsView):
                 self.scale(factor, factor)
             self._zoom = 0
 
-    def setPhoto(self, pic=None):
-        """Displays the images in the viewer."""
-        # pixmap = QtGui.QPixmap(pic)
-        # if pic is not None:
-        try:
-            qim = ImageQt(pic)
-            pixmap = QtGui.QPixmap.fromImage(qim.copy())
-        except Exception:
+    def setPhoto(self, pic=None, path=None, stamp=None):
+        """Displays a NavDecoded of path, or a file or pixmap through Qt."""
+        self.stop()
+        self.clear_tiles()
+        self.requested.clear()
+        self.path, self.stamp = path, stamp
+        if isinstance(pic, NavDecoded):
+            self.decoded = pic
+            pixmap = QtGui.QPixmap.fromImage(pic.image)
+            self._photo.setScale(pic.full[0] / pic.image.width())
+        else:
+            self.decoded = None
             pixmap = QtGui.QPixmap(pic)
+            self._photo.setScale(1)
         self._zoom = 0
         if pixmap and not pixmap.isNull():
             self.setDragMode(QtWidgets.QGraphicsView.ScrollHandDrag)
@@ -167,6 +587,26 @@ class ImageViewer(QtWidgets.QGraphicsView):
             self.setDragMode(QtWidgets.QGraphicsView.NoDrag)
             self._photo.setPixmap(QtGui.QPixmap())
         self.fit_to_view()
+        if self.decoded is not None and self.decoded.animated:
+            self.animation = NavAnimation(path, self.frame_scale(),
+                                          self.show_frame, self)
+
+    def stop(self):
+        if self.animation is not None:
+            self.animation.stop()
+            self.animation.deleteLater()
+            self.animation = None
+
+    def frame_scale(self):
+        """Returns the scale animation frames are decoded at for the zoom,
+        the power of two at or above it up to the image resolution."""
+        scale = self.transform().m11() * self.devicePixelRatioF()
+        return 1 if scale >= 1 else 2 ** math.ceil(math.log2(scale))
+
+    def show_frame(self, image, full):
+        """Shows a frame of the animation at the size of the image."""
+        self._photo.setPixmap(QtGui.QPixmap.fromImage(image))
+        self._photo.setScale(full[0] / image.width())
 
     def wheelEvent(self, event):
         """Handles wheel to zoom in and out"""
@@ -180,4 +620,97 @@ class ImageViewer(QtWidgets.QGraphicsView):
             self.scale(factor, factor)
         else:
             self.fit_to_view()
+        self.tile_timer.start(100)
         event.accept()
+
+    def scrollContentsBy(self, dx, dy):
+        super().scrollContentsBy(dx, dy)
+        if self.tiles or self.requested:
+            self.tile_timer.start(100)
+
+    def clear_tiles(self, keep=()):
+        for key in [k for k in self.tiles if k not in keep]:
+            self._scene.removeItem(self.tiles.pop(key))
+
+    def update_tiles(self):
+        """Overlays the visible region with tiles of the level matching
+        the zoom, when finer than the decoded image. Animations have
+        their frames decoded at the zoom instead."""
+        decoded = self.decoded
+        if decoded is None:
+            return
+        if self.animation is not None:
+            self.animation.rescale(self.frame_scale())
+            return
+        scale = self.transform().m11() * self.devicePixelRatioF()
+        level = int(math.log2(1 / scale)) if scale < 1 else 0
+        level = max(level, decoded.finest)
+        if level >= decoded.level:
+            self.clear_tiles()
+            return
+        width, height = level_size(decoded.full, level)
+        ratio = decoded.full[0] / width
+        visible = self.mapToScene(self.viewport().rect()).boundingRect() \
+            .intersected(self._photo.sceneBoundingRect())
+        span = TILE * ratio
+        wanted = {(level, column, row)
+                  for column in range(int(visible.left() // span),
+                                      int(visible.right() // span) + 1)
+                  for row in range(int(visible.top() // span),
+                                   int(visible.bottom() // span) + 1)
+                  if column * TILE < width and row * TILE < height}
+        self.clear_tiles(wanted)
+        missing = []
+        for key in sorted(wanted - self.tiles.keys()):
+            tile = NavImageCache.get((self.path, *key), self.stamp)
+            if tile is None:
+                missing.append(key[1:])
+                continue
+            item = self._scene.addPixmap(QtGui.QPixmap.fromImage(tile.image))
+            item.setTransformationMode(QtCore.Qt.SmoothTransformation)
+            item.setScale(ratio)
+            item.setPos(key[1] * span, key[2] * span)
+            item.setZValue(1)
+            self.tiles[key] = item
+        if missing and level not in self.requested:
+            self.requested.add(level)
+            NavViewer.pool.submit(self.decode_tiles, self.path, self.stamp,
+                                  level, missing)
+
+    def decode_tiles(self, path, stamp, level, tiles):
+        """Runs on a worker, caching tiles of path at level. The tiles
+        around them are cut from the same decode and cached too, within
+        half the cache, so that panning seldom decodes the level again.
+        Tiles cached meanwhile by an earlier decode aren't decoded."""
+        tiles = [t for t in tiles if NavImageCache.get(
+            (path, level, *t), stamp, count=False) is None]
+        try:
+            if tiles:
+                with NavPerf.timed("decode_tiles"):
+                    decoded = decode_tiles(path, level, tiles,
+                                           NavImageCache.budget // 2)
+                    for n, (tile, image) in enumerate(decoded, 1):
+                        NavImageCache.put((path, level, *tile), stamp,
+                                          image)
+                        if n == len(tiles):
+                            self.emit_tiles(path)
+                return
+        except Exception as e:
+            logger.debug("Unable to decode tiles of %s: %s", path, e)
+            return
+        self.emit_tiles(path)
+
+    def emit_tiles(self, path):
+        try:
+            self.tiles_decoded.emit(path)
+        except RuntimeError:  # the viewer is gone
+            pass
+
+    def tiles_ready(self, path):
+        if path == self.path:
+            self.requested.clear()
+            self.update_tiles()
+
+
+NavDiagnostics.register("Image cache", NavImageCache.diagnostics)
+NavDiagnostics.register("Animation", NavAnimation.diagnostics)
@@ -1,31 +1,37 @@
+import logging
 import os
 import pathlib
 import sys
 import time
 import datetime
 from PyQt5 import QtCore, QtWidgets, QtGui
-from PIL import Image
-from PIL.ImageQt import ImageQt
 from .core import NavStates, NavView, Nav
-from .helper import logger, humansize
+from .helper import humansize
+from .navcache import NavDirCache
+from .navmime import NavMime
+from .navperf import NavPerf
+from .navtrace import traced
 from .pub import Pub
-from .navtrash import NavTrash
+from .navtrash import NavTrashIndex
+
+logger = logging.getLogger(__name__)
 
 NAME = 0
 EXT = 1
 SIZE = 2
 MODIFIED = 3
-PATH = 4
-DELETED = 5
-FULLNAME = 6
-THUMBNAIL = 7
+THUMBNAIL = 4
+PATH = 5
+DELETED = 6
+TYPE = 7
+FULLNAME = 8
 STATE = -1
 
 
 class NavIcon:
     """Icon store for files."""
     icon_map = {}
-    iconProvider = QtWidgets.QFileIconProvider()
+    iconProvider = None  # created on first use, needs a QApplication
 
     @classmethod
     def get_icon(cls, path, ext=None):
@@ -35,6 +41,8 @@ class NavIcon:
         if ext not in cls.icon_map:
             # logger.debug(f"Fresh Icon for {path} {ext}")
             file_info = QtCore.QFileInfo(path)
+            if cls.iconProvider is None:
+                cls.iconProvider = QtWidgets.QFileIconProvider()
             icon = cls.iconProvider.icon(file_info)
             if ext is None:
                 return icon
@@ -54,13 +62,19 @@ class NavItemModel(QtCore.QAbstractItemModel):
         # logger.debug(self.header)
         self.files = []
         self.fcount = self.dcount = self.total = 0
+        self.selcount = self.selsize = 0
         self.last_read = 0
         self._loading = False
         self.location = None
+        self.sniffing = {}  # path -> type, sniffed and not yet shown
+        self.removed = set()  # paths removed in bulk, before the watcher
+        self.types_timer = QtCore.QTimer(self)
+        self.types_timer.setSingleShot(True)
+        self.types_timer.timeout.connect(self.show_types)
+        NavMime.signals.detected.connect(self.type_detected)
 
     def model_size(self, width, height):
         """Set the size for icons and thumbnails."""
-        logger.debug(f"Invoked by {sys._getframe().f_back.f_code.co_name}")
         self.tw = width
         self.th = height
 
@@ -69,6 +83,8 @@ class NavItemModel(QtCore.QAbstractItemModel):
     #     self.header = header
 
     def is_changed(self, loc, last_read):
+        if loc == "trash":
+            loc = NavTrashIndex.get_info_locations()
         for d in loc.split(";"):
             try:
                 if last_read < os.stat(d).st_mtime:
@@ -77,46 +93,117 @@ class NavItemModel(QtCore.QAbstractItemModel):
                 return True
         return False
 
+    @traced("NavItemModel.load_tab", "model")
     def load_tab(self, loc, forced=False):
         """Loads a tab if not already loaded or is stale."""
         # logger.debug(f"Invoked by {sys._getframe().f_back.f_code.co_name}")
         # logger.debug(f"Navigating to {loc} and current is {self.location}")
         if loc is None or loc != self.location:
             self.last_read = 0
+            self.removed = set()
         #     loc = self.location
         if (forced and self._loading is False) or loc != self.location \
                 or self.is_changed(loc, self.last_read):
             logger.debug("Loading required")
             self.location = loc
             self._loading = True
-            # if loc != "trash":
+            if forced and loc != "trash":
+                for d in loc.split(";"):
+                    NavDirCache.invalidate(d)
             self.list_dirs(loc)
-            # else:
-            #     self.list_trash()
             self._loading = False
             return True
         logger.debug("Loading Skipped")
         return False
 
-    # def list_trash(self):
-    #     self.files = []
-    #     self.fcount = self.dcount = self.total = self.selsize = 0
-    #     self.last_read = datetime.datetime.now().timestamp()
-    #     for tf in NavTrash.get_trash_folders():
-    #         self.list_dir(tf, 1)
-
     def list_dirs(self, ds):
         """Invokes list_dir for each dir in  the list"""
-        logger.debug(f"Invoked by {sys._getframe().f_back.f_code.co_name}")
         self.files = []
-        self.fcount = self.dcount = self.total = self.selsize = 0
+        self.fcount = self.dcount = self.total = 0
+        self.selcount = self.selsize = 0
         self.last_read = datetime.datetime.now().timestamp()
-        for d in ds.split(";"):
-            self.list_dir(d)
+        with NavPerf.timed("list_dir"):
+            if ds == "trash":
+                self.list_trash()
+                return
+            for d in ds.split(";"):
+                self.list_dir(d)
+
+    @staticmethod
+    def new_row(name, ext, size, modified, path, state, deleted=None,
+                fullname=None):
+        """Builds a row with its values placed under matching columns."""
+        return [name, ext, size, modified, None, path, deleted, None,
+                fullname, state]
+
+    def trash_row(self, rec):
+        """Builds a row for a trashed item from its trash index record."""
+        if rec["is_dir"]:
+            state = NavStates.IS_DIR
+            ext = None
+            self.dcount += 1
+        else:
+            state = 0
+            ext = pathlib.Path(rec["name"]).suffix.lstrip('.')
+            self.fcount += 1
+        self.total += rec["size"]
+        return self.new_row(rec["name"], ext, rec["size"], rec["modified"],
+                            os.path.dirname(rec["origin"]), state,
+                            rec["deleted"], NavTrashIndex.trashed_path(rec))
+
+    def list_trash(self):
+        """Updates the model with the trash listing indexed so far, which
+        sync_trash brings up to date once the trash index is refreshed in
+        the background."""
+        self.layoutAboutToBeChanged.emit()
+        self.files = [self.trash_row(rec) for rec in NavTrashIndex.known()]
+        self.layoutChanged.emit()
+        NavTrashIndex.refresh_later()
+
+    def sync_trash(self, records):
+        """Applies the refreshed trash index records to the rows, keeping
+        the rows which didn't change and their selections."""
+        fresh = {NavTrashIndex.trashed_path(rec): rec for rec in records}
+        self.remove_rows([self.full_name(item) for item in self.files
+                          if self.full_name(item) not in fresh])
+        self.fcount = self.dcount = self.total = 0
+        changed = False
+        for item in self.files:
+            row = self.trash_row(fresh.pop(self.full_name(item)))
+            if row[SIZE] != item[SIZE] or row[MODIFIED] != item[MODIFIED] \
+                    or row[DELETED] != item[DELETED]:
+                item[SIZE], item[MODIFIED], item[DELETED] = \
+                    row[SIZE], row[MODIFIED], row[DELETED]
+                changed = True
+        if changed:
+            self.dataChanged.emit(self.index(0, 0), self.index(
+                self.rowCount() - 1, self.columnCount() - 1))
+        if fresh:
+            # Appended as a layout change, sorted once instead of row by
+            # row by the proxy as inserted rows are, as on a first refresh
+            # the whole trash is new
+            self.layoutAboutToBeChanged.emit()
+            self.files.extend(self.trash_row(rec) for rec in fresh.values())
+            self.layoutChanged.emit()
+
+    def update_trash(self, info_file):
+        """Syncs a row with the trash index after its trashinfo changed."""
+        rec = NavTrashIndex.update(info_file)
+        name = os.path.basename(info_file)[:-len(".trashinfo")]
+        if rec is None:
+            trash = os.path.dirname(os.path.dirname(info_file))
+            return self.remove_row(os.path.join(trash, "files", name))
+        for item in self.files:
+            if item[NAME] == name:
+                return
+        self.removed.discard(NavTrashIndex.trashed_path(rec))
+        new_pos = self.rowCount()
+        self.beginInsertRows(QtCore.QModelIndex(), new_pos, new_pos)
+        self.files.append(self.trash_row(rec))
+        self.endInsertRows()
 
-    def list_dir(self, d: str, kind=0):
+    def list_dir(self, d: str):
         """Updates the model with directory listing."""
-        logger.debug(f"Invoked by {sys._getframe().f_back.f_code.co_name}")
         if not os.path.exists(d):
             # self.files = []
             self.layoutAboutToBeChanged.emit()
@@ -133,55 +220,107 @@ class NavItemModel(QtCore.QAbstractItemModel):
         #     logger.error(f"{d} is not a directory")
         #     return False
         self.layoutAboutToBeChanged.emit()
-        if kind:
-            mp = pathlib.Path(f"{d}{os.sep}").parent
-            ti = pathlib.Path(f"{d}{os.sep}info{os.sep}")
-            d = pathlib.Path(f"{d}{os.sep}files")
-        # else:
-        #     self.files = []
-
-        with os.scandir(d) as it:
-            for entry in it:
-                if entry.is_file():
-                    state = 0
-                    ext = pathlib.Path(entry.name).suffix.lstrip('.')
-                    self.fcount += 1
-                    size = entry.stat().st_size
-                else:
-                    state = NavStates.IS_DIR
-                    ext = None
-                    self.dcount += 1
-                    size = 0
+        for entry in NavDirCache.get(d):
+            self.files.append(self.entry_row(d, entry))
+        self.layoutChanged.emit()
 
-                modified = str(time.strftime('%Y-%m-%d %H:%M',
-                               time.localtime(entry.stat().st_mtime)))
-                self.total += entry.stat().st_size
-
-                if kind:
-                    info = f"{ti}{os.sep}{entry.name}.trashinfo"
-                    # current = f"{d}{os.sep}{entry.name}"
-                    with open(info, "r") as fh:
-                        contents = fh.readlines()
-                        for line in contents:
-                            line = line.strip()
-                            if line.startswith('DeletionDate='):
-                                deleted = datetime.datetime.strptime(
-                                        line, "DeletionDate=%Y-%m-%dT%H:%M:%S")
-                            elif line.startswith('Path='):
-                                origin = line[len('Path='):]
-                                if not origin.startswith("/"):
-                                    origin = f"{mp}{os.sep}{origin}"
-                    self.files.append([entry.name, ext, size, modified, d,
-                                       deleted, origin, state])
-                else:
-                    self.files.append([entry.name, ext, size, modified, d,
-                                       state])
+    def entry_row(self, d, entry):
+        """Builds a row for a listing entry of d and counts it."""
+        if entry.is_file:
+            state = 0
+            ext = pathlib.Path(entry.name).suffix.lstrip('.')
+            self.fcount += 1
+            size = entry.size
+        else:
+            state = NavStates.IS_DIR
+            ext = None
+            self.dcount += 1
+            size = 0
+
+        modified = str(time.strftime('%Y-%m-%d %H:%M',
+                       time.localtime(entry.mtime)))
+        self.total += entry.size
+        return self.new_row(entry.name, ext, size, modified, d, state)
+
+    def restore(self, loc, snap):
+        """Shows rows from a session snapshot without listing loc."""
+        self.layoutAboutToBeChanged.emit()
+        self.files = snap["files"]
+        self.fcount, self.dcount, self.total = snap["counts"]
+        self.selcount = self.selsize = 0
+        self.last_read = snap["last_read"]
+        self.location = loc
         self.layoutChanged.emit()
 
+    def sync_listing(self):
+        """Brings rows up to date with the listing, touching only the rows
+        which changed instead of rebuilding the model."""
+        loc = self.location
+        self.last_read = datetime.datetime.now().timestamp()
+        fresh = {}
+        for d in loc.split(";"):
+            try:
+                listing = NavDirCache.get(d)
+            except OSError:
+                continue
+            for entry in listing:
+                fresh[(d, entry.name)] = entry
+        keep = []
+        moved = {}
+        changed = []
+        for row, item in enumerate(self.files):
+            entry = fresh.pop((item[PATH], item[NAME]), None)
+            if entry is None:
+                if item[STATE] & NavStates.IS_DIR:
+                    self.dcount -= 1
+                else:
+                    self.fcount -= 1
+                self.total -= item[SIZE]
+                if item[STATE] & NavStates.IS_SELECTED:
+                    self.selcount -= 1
+                    self.selsize -= item[SIZE]
+                continue
+            moved[row] = len(keep)
+            keep.append(item)
+            if entry.is_file:
+                modified = time.strftime('%Y-%m-%d %H:%M',
+                                         time.localtime(entry.mtime))
+                if (item[SIZE], item[MODIFIED]) != (entry.size, modified):
+                    self.total += entry.size - item[SIZE]
+                    item[SIZE] = entry.size
+                    item[MODIFIED] = modified
+                    item[THUMBNAIL] = item[TYPE] = None
+                    NavMime.forget(self.full_name(item))
+                    changed.append(moved[row])
+        if len(keep) != len(self.files):
+            self.layoutAboutToBeChanged.emit()
+            old = self.persistentIndexList()
+            new = [self.index(moved[i.row()], i.column())
+                   if i.row() in moved else QtCore.QModelIndex()
+                   for i in old]
+            self.changePersistentIndexList(old, new)
+            self.files = keep
+            self.layoutChanged.emit()
+        if changed:
+            self.dataChanged.emit(self.index(min(changed), 0),
+                                  self.index(max(changed),
+                                             self.columnCount() - 1))
+        if fresh:
+            rows = [self.entry_row(d, entry)
+                    for (d, _), entry in fresh.items()]
+            new_pos = self.rowCount()
+            self.beginInsertRows(QtCore.QModelIndex(), new_pos,
+                                 new_pos + len(rows) - 1)
+            self.files.extend(rows)
+            self.endInsertRows()
+        logger.debug("%s: %s synced, %s changed, %s added", self.pid, loc,
+                     len(changed), len(fresh))
+
     def insert_row(self, new_item: str):
         """Inserts a new item to the model."""
         path = os.path.dirname(new_item)
         name = os.path.basename(new_item)
+        self.removed.discard(new_item)
         if name not in self.files:
             try:
                 if os.path.isfile(new_item):
@@ -201,7 +340,8 @@ class NavItemModel(QtCore.QAbstractItemModel):
                                time.localtime(stats.st_mtime)))
                 new_pos = self.rowCount()
                 self.beginInsertRows(QtCore.QModelIndex(), new_pos, new_pos)
-                self.files.append([name, ext, size, modified, path, state])
+                self.files.append(self.new_row(name, ext, size, modified,
+                                               path, state))
                 Pub.notify("App", f"{self.pid}: {new_item} was added.")
                 self.endInsertRows()
                 return True
@@ -211,6 +351,8 @@ class NavItemModel(QtCore.QAbstractItemModel):
     def update_row(self, upd_item: str):
         """Updates a row in the model."""
         # path = os.path.dirname(upd_item)
+        if upd_item in self.removed:
+            return
         name = os.path.basename(upd_item)
         for item in self.files:
             if item[NAME] == name:
@@ -219,7 +361,7 @@ class NavItemModel(QtCore.QAbstractItemModel):
                     try:
                         self.total -= item[SIZE]
                     except Exception:
-                        logger.debug(f"Error getting size for {upd_item}",
+                        logger.debug("Error getting size for %s", upd_item,
                                      exc_info=True)
                 try:
                     stats = os.lstat(upd_item)
@@ -232,6 +374,8 @@ class NavItemModel(QtCore.QAbstractItemModel):
                 self.total += self.files[ind][SIZE]
                 self.files[ind][MODIFIED] = str(time.strftime(
                     '%Y-%m-%d %H:%M', time.localtime(stats.st_mtime)))
+                self.files[ind][TYPE] = None
+                NavMime.forget(upd_item)
                 self.layoutChanged.emit()
                 # try:
                 #     self.last_read = os.stat(self.parent.location).st_mtime
@@ -258,17 +402,18 @@ class NavItemModel(QtCore.QAbstractItemModel):
 
     def remove_row(self, rem_item: str):
         """ Remove a row from the model."""
-        if os.sep in rem_item:
-            rem_item = os.path.basename(rem_item)
+        if rem_item in self.removed:
+            self.removed.discard(rem_item)
+            return True  # already removed by remove_rows
         for item in self.files:
-            if rem_item == item[NAME]:
+            if rem_item == self.full_name(item):
                 if item[STATE] & NavStates.IS_DIR:
                     self.dcount -= 1
                 else:
                     try:
                         self.total -= item[SIZE]
                     except Exception:
-                        logger.debug(f"Error getting size for {rem_item}",
+                        logger.debug("Error getting size for %s", rem_item,
                                      exc_info=True)
                     self.fcount -= 1
                 if item[STATE] & NavStates.IS_SELECTED:
@@ -282,10 +427,41 @@ class NavItemModel(QtCore.QAbstractItemModel):
                 self.files.pop(index)
                 self.endRemoveRows()
                 # logger.debug(f"{item} removed from {index}")
-                Pub.notify("App", f"{self.pid}: {rem_item} was deleted.")
+                Pub.notify("App", f"{self.pid}: {item[NAME]} was deleted.")
                 break
         return True
 
+    def remove_rows(self, rem_items):
+        """Removes many rows from the model in a single pass. The paths
+        are remembered to drop the watcher events which follow."""
+        paths = set(rem_items)
+        self.removed |= paths
+        keep = []
+        moved = {}
+        for row, item in enumerate(self.files):
+            if self.full_name(item) not in paths:
+                moved[row] = len(keep)
+                keep.append(item)
+                continue
+            if item[STATE] & NavStates.IS_DIR:
+                self.dcount -= 1
+            else:
+                self.fcount -= 1
+            self.total -= item[SIZE]
+            if item[STATE] & NavStates.IS_SELECTED:
+                self.selcount -= 1
+                self.selsize -= item[SIZE]
+        if len(keep) == len(self.files):
+            return False
+        self.layoutAboutToBeChanged.emit()
+        old = self.persistentIndexList()
+        new = [self.index(moved[i.row()], i.column()) if i.row() in moved
+               else QtCore.QModelIndex() for i in old]
+        self.changePersistentIndexList(old, new)
+        self.files = keep
+        self.layoutChanged.emit()
+        return True
+
     def rowCount(self, parent=None):
         """Returns the no. of rows in current model."""
         return len(self.files)
@@ -298,6 +474,46 @@ class NavItemModel(QtCore.QAbstractItemModel):
         """Re-implemented to return index of a row."""
         return QtCore.QAbstractItemModel.createIndex(self, row, column, row)
 
+    def file_type(self, row):
+        """Returns the MIME type of a row, None while it's sniffed."""
+        item = self.files[row]
+        if item[TYPE] is None:
+            if item[STATE] & NavStates.IS_DIR:
+                item[TYPE] = "inode/directory"
+            else:
+                path = self.get_full_name(row)
+                item[TYPE] = NavMime.lookup(path, item[SIZE])
+                if item[TYPE] is None:
+                    self.sniffing[path] = None
+        return item[TYPE]
+
+    def type_detected(self, path, mime):
+        """Collects types sniffed for us, shown in batches."""
+        if path in self.sniffing:
+            self.sniffing[path] = mime
+            if not self.types_timer.isActive():
+                self.types_timer.start(50)
+
+    def show_types(self):
+        """Fills in sniffed types and repaints their rows, thumbnails
+        included."""
+        done = {p: m for p, m in self.sniffing.items() if m is not None}
+        if not done:
+            return
+        rows = []
+        for row, item in enumerate(self.files):
+            if item[TYPE] is None:
+                mime = done.get(self.get_full_name(row))
+                if mime is not None:
+                    item[TYPE] = mime
+                    rows.append(row)
+        for path in done:
+            del self.sniffing[path]
+        if rows:
+            self.dataChanged.emit(self.index(min(rows), 0),
+                                  self.index(max(rows),
+                                             self.columnCount() - 1))
+
     def data(self, index, role=QtCore.Qt.DisplayRole):
         """Returns data to be displayed in the model."""
         if not index.isValid():
@@ -318,14 +534,18 @@ class NavItemModel(QtCore.QAbstractItemModel):
             elif role == QtCore.Qt.DecorationRole:
                 if h == "Thumbnails" or \
                         self.parent.vtype == NavView.Thumbnails:
+                    mime = self.file_type(row)
+                    if mime is None or not mime.startswith("image/"):
+                        return NavIcon.get_icon(self.files[row][NAME],
+                                                ext=self.files[row][EXT])
                     try:
-                        if self.parent.location != "trash":
-                            im = Image.open(f"{self.parent.location}{os.sep}"
-                                            f"{self.files[row][NAME]}")
-                        else:
-                            im = Image.open(self.files[row][FULLNAME])
-                        im.thumbnail((self.tw, self.th), Image.ANTIALIAS)
-                        return QtGui.QImage(ImageQt(im))
+                        from PIL import Image
+                        from PIL.ImageQt import ImageQt
+                        with NavPerf.timed("thumbnail"):
+                            im = Image.open(self.get_full_name(row))
+                            im.thumbnail((self.tw, self.th),
+                                         Image.ANTIALIAS)
+                            return QtGui.QImage(ImageQt(im))
                     except Exception:
                         # Icon if thumbnails can't be generated
                         return NavIcon.get_icon(self.files[row][NAME],
@@ -338,6 +558,8 @@ class NavItemModel(QtCore.QAbstractItemModel):
             elif role == QtCore.Qt.DisplayRole:
                 if column == SIZE:
                     return humansize(value)
+                if column == TYPE:
+                    return self.file_type(row)
                 # logger.debug(f"returning {value} for {row} {column}")
                 return value if h != "Thumbnails" else ""
             elif role == QtCore.Qt.CheckStateRole and column == NAME:
@@ -395,24 +617,24 @@ class NavItemModel(QtCore.QAbstractItemModel):
             c = index.column()
             if c == NAME:
                 old = self.files[r][c]
-                logger.debug(f"Rename {old} to {value}")
+                logger.debug("Rename %s to %s", old, value)
                 self.rename(old, value)
         # self.dataChanged.emit(index, index)
         return False
 
     def rename(self, old, new):
         if os.path.exists(f"{new}"):
-            logger.error(f"{self.parent.location}: {new} - Exists")
+            logger.error("%s: %s - Exists", self.parent.location, new)
             Pub.notify("App", f"{self.pid}: {new} - exists.")
         else:
-            logger.info(f"{self.parent.location}: Rename {old} to {new}")
+            logger.info("%s: Rename %s to %s", self.parent.location, old, new)
             try:
                 os.rename(old, new)
                 Pub.notify(f"App.{self.pid}.Tab.Files.Renamed",
                            f"{self.pid}: {old} renamed to {new}")
             except OSError:
-                logger.error(f"{self.parent.location}: Error renaming "
-                             f"from {old} to {new}", exc_info=True)
+                logger.error("%s: Error renaming from %s to %s",
+                             self.parent.location, old, new, exc_info=True)
                 Pub.notify("App", f"{self.pid}: Error renaming.")
 
     def get_selection_stats(self):
@@ -424,9 +646,14 @@ class NavItemModel(QtCore.QAbstractItemModel):
                 self.selcount += 1
         return self.selcount, self.selsize
 
+    @staticmethod
+    def full_name(item):
+        """Returns the path of a row, trashed items being in the trash."""
+        return item[FULLNAME] or os.path.join(item[PATH], item[NAME])
+
     def get_full_name(self, index):
         try:
-            return self.files[index][PATH] + os.sep + self.files[index][NAME]
+            return self.full_name(self.files[index])
         except IndexError:
             return None
 
@@ -448,6 +675,11 @@ class NavSortFilterProxyModel(QtCore.QSortFilterProxyModel):
         # Rely on the base implementation
         return super().headerData(section, orientation, role)
 
+    def sort(self, column, order=QtCore.Qt.AscendingOrder):
+        """Reimplemented to time sorting."""
+        with NavPerf.timed("sort"):
+            super().sort(column, order)
+
     def lessThan(self, left, right):
         """Reimplemented to sort folders to top."""
         l_data = self.sourceModel().files[left.row()]
@@ -463,6 +695,12 @@ class NavSortFilterProxyModel(QtCore.QSortFilterProxyModel):
                     return sort_order != QtCore.Qt.AscendingOrder
             except TypeError:
                 return True
+        if left.column() == TYPE:
+            # Types are looked up as compared, those still being sniffed
+            # sort as unknown until they're announced
+            model = self.sourceModel()
+            return (model.file_type(left.row()) or "") < \
+                (model.file_type(right.row()) or "")
         try:
             return True if (l_data[left.column()] <= r_data[right.column()]) \
                 else False
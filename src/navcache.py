@@ -0,0 +1,100 @@
+import collections
+import os
+import threading
+from .diagnostics import NavDiagnostics
+
+NavEntry = collections.namedtuple("NavEntry",
+                                  "name is_file is_dir size mtime")
+
+
+class NavDirCache:
+    """Process wide cache of directory listings shared by the tab models
+    and the tree. Listings are revalidated against the directory mtime."""
+    listings = collections.OrderedDict()  # path -> (mtime_ns, entries)
+    max_entries = 200000  # total entries kept across all listings
+    entries = 0
+    batch = 1000  # entries per progress call while scanning
+    hits = misses = 0
+    lock = threading.Lock()
+
+    @classmethod
+    def get(cls, path, fresh=False, progress=None):
+        """Returns the listing of path as a list of NavEntry. When path
+        has to be scanned, progress is called with batches of entries as
+        they're found."""
+        stamp = os.stat(path).st_mtime_ns
+        with cls.lock:
+            if not fresh:
+                try:
+                    cached_stamp, listing = cls.listings[path]
+                except KeyError:
+                    pass
+                else:
+                    if cached_stamp == stamp:
+                        cls.listings.move_to_end(path)
+                        cls.hits += 1
+                        return listing
+            cls.misses += 1
+        listing = cls.scan(path, progress)
+        cls.put(path, stamp, listing)
+        return listing
+
+    @classmethod
+    def peek(cls, path):
+        """Returns a cached listing without validating it, or None."""
+        with cls.lock:
+            try:
+                return cls.listings[path][1]
+            except KeyError:
+                return None
+
+    @classmethod
+    def scan(cls, path, progress=None):
+        """Lists path with the stat details the views need."""
+        listing = []
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    st = entry.stat()
+                except OSError:  # dangling symlink
+                    st = entry.stat(follow_symlinks=False)
+                listing.append(NavEntry(entry.name, entry.is_file(),
+                                        entry.is_dir(), st.st_size,
+                                        st.st_mtime))
+                if progress is not None and len(listing) % cls.batch == 0:
+                    progress(listing[-cls.batch:])
+        return listing
+
+    @classmethod
+    def put(cls, path, stamp, listing):
+        """Stores a listing, dropping least recently used ones."""
+        with cls.lock:
+            old = cls.listings.pop(path, None)
+            if old is not None:
+                cls.entries -= len(old[1])
+            cls.listings[path] = (stamp, listing)
+            cls.entries += len(listing)
+            while cls.entries > cls.max_entries and len(cls.listings) > 1:
+                _, (_, dropped) = cls.listings.popitem(last=False)
+                cls.entries -= len(dropped)
+
+    @classmethod
+    def invalidate(cls, path):
+        """Forgets the listing of path."""
+        with cls.lock:
+            old = cls.listings.pop(path, None)
+            if old is not None:
+                cls.entries -= len(old[1])
+
+    @classmethod
+    def diagnostics(cls):
+        """Returns cache counters for the diagnostics dialog."""
+        return {
+            "Listings": len(cls.listings),
+            "Entries": cls.entries,
+            "Hits": cls.hits,
+            "Misses": cls.misses,
+        }
+
+
+NavDiagnostics.register("Listing cache", NavDirCache.diagnostics)
@@ -0,0 +1,300 @@
+import bisect
+import collections
+import json
+import logging
+import os
+import threading
+import time
+from concurrent import futures
+from PyQt5 import QtCore, QtWidgets
+from .core import Nav
+from .diagnostics import NavDiagnostics
+from .navcache import NavDirCache
+from .navperf import NavPerf
+
+logger = logging.getLogger(__name__)
+
+
+class NavTrie:
+    """Prefix trie holding the values inserted under each key."""
+    __slots__ = ("children", "values")
+
+    def __init__(self):
+        self.children = {}
+        self.values = None
+
+    def insert(self, key, value):
+        node = self
+        for ch in key:
+            child = node.children.get(ch)
+            if child is None:
+                child = node.children[ch] = NavTrie()
+            node = child
+        if node.values is None:
+            node.values = set()
+        node.values.add(value)
+
+    def remove(self, key, value):
+        node = self
+        for ch in key:
+            node = node.children.get(ch)
+            if node is None:
+                return
+        if node.values is not None:
+            node.values.discard(value)
+
+    def find(self, prefix, limit):
+        """Returns up to limit values of keys starting with prefix, those
+        of the shortest keys first."""
+        node = self
+        for ch in prefix:
+            node = node.children.get(ch)
+            if node is None:
+                return []
+        found, level = [], [node]
+        while level and len(found) < limit:
+            for node in level:
+                if node.values:
+                    found.extend(node.values)
+            level = [child for node in level
+                     for child in node.children.values()]
+        return found[:limit]
+
+
+def split_query(text):
+    """Returns the folder typed into and the start of the name being
+    typed, or None and the text when it isn't a path."""
+    text = os.path.expanduser(text)
+    if os.sep not in text:
+        return None, text
+    parent, part = os.path.split(text)
+    return parent or os.sep, part
+
+
+class NavFrecency:
+    """Process wide index of visited folders ranked by frecency, ageing
+    ranks like zoxide does. Folders are found by prefix of their path or
+    of their name through tries, and subfolders of the folder typed into
+    by prefix of their name in its sorted listing. The ranks are kept next
+    to the config file between sessions."""
+    version = 1
+    file = os.path.join(os.path.dirname(Nav.conf_file), "navgator.frecency")
+    entries = {}  # path -> [rank, last visit]
+    paths = NavTrie()  # lowercased path -> paths
+    names = NavTrie()  # lowercased name -> paths
+    max_rank = 10000  # ranks are aged once their total exceeds this
+    scan = 2000  # candidates looked at per query, at the most
+    folders = collections.OrderedDict()  # path -> (listing, sorted keys)
+    max_folders = 8  # sorted listings kept
+    total = 0
+    queries = 0
+    lock = threading.Lock()
+
+    @classmethod
+    def load(cls):
+        """Reads the ranks saved by the previous session."""
+        try:
+            with open(cls.file) as fh:
+                data = json.load(fh)
+            if data.get("version") != cls.version:
+                logger.debug("Ignoring frecency index of other version")
+                return
+            for path, (rank, last) in data["entries"].items():
+                cls.add(path, rank, last)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.error("Error reading %s: %s", cls.file, e)
+
+    @classmethod
+    def save(cls):
+        """Writes the ranks atomically, dropping those never visited."""
+        data = {"version": cls.version,
+                "entries": {p: e for p, e in cls.entries.items() if e[0]}}
+        tmp = f"{cls.file}.tmp"
+        try:
+            with open(tmp, "w") as fh:
+                json.dump(data, fh)
+            os.replace(tmp, cls.file)
+        except OSError as e:
+            logger.error("Error writing %s: %s", cls.file, e)
+
+    @classmethod
+    def add(cls, path, rank=0, last=0):
+        """Indexes path if it isn't, folders only seen in history have
+        no rank."""
+        if path in cls.entries or not path or ";" in path:
+            return  # ; separates the locations of searches and trash
+        cls.entries[path] = [rank, last]
+        cls.total += rank
+        cls.paths.insert(path.lower(), path)
+        cls.names.insert(os.path.basename(path).lower(), path)
+
+    @classmethod
+    def forget(cls, path):
+        entry = cls.entries.pop(path, None)
+        if entry is not None:
+            cls.total -= entry[0]
+            cls.paths.remove(path.lower(), path)
+            cls.names.remove(os.path.basename(path).lower(), path)
+
+    @classmethod
+    def visit(cls, path):
+        """Counts a visit of path."""
+        cls.add(path)
+        entry = cls.entries.get(path)
+        if entry is None:
+            return
+        entry[0] += 1
+        entry[1] = time.time()
+        cls.total += 1
+        if cls.total > cls.max_rank:
+            cls.age()
+
+    @classmethod
+    def age(cls):
+        """Scales ranks down, forgetting folders no longer visited."""
+        for path, entry in list(cls.entries.items()):
+            entry[0] *= 0.9
+            if entry[0] < 1:
+                cls.forget(path)
+        cls.total = sum(e[0] for e in cls.entries.values())
+
+    @classmethod
+    def score(cls, path, now):
+        """Returns the frecency of path, its rank weighted by recency."""
+        entry = cls.entries.get(path)
+        if entry is None:
+            return 0
+        rank, last = entry
+        age = now - last
+        if age < 3600:
+            return rank * 4
+        elif age < 86400:
+            return rank * 2
+        elif age < 604800:
+            return rank / 2
+        return rank / 4
+
+    @classmethod
+    def subfolders(cls, path):
+        """Returns the sorted (key, name) of the subfolders of path if its
+        cached listing has been sorted, or None."""
+        listing = NavDirCache.peek(path)
+        with cls.lock:
+            entry = cls.folders.get(path)
+            if entry is None or entry[0] is not listing:
+                return None
+            cls.folders.move_to_end(path)
+            return entry[1]
+
+    @classmethod
+    def sort_folders(cls, path):
+        """Lists path through NavDirCache and sorts its subfolders. Runs
+        in a pool."""
+        listing = NavDirCache.get(path)
+        keys = sorted((e.name.lower(), e.name) for e in listing if e.is_dir)
+        with cls.lock:
+            cls.folders[path] = (listing, keys)
+            cls.folders.move_to_end(path)
+            while len(cls.folders) > cls.max_folders:
+                cls.folders.popitem(last=False)
+
+    @classmethod
+    def complete(cls, text, limit):
+        """Returns up to limit folders for the text typed, visited ones by
+        frecency then subfolders from cached listings by name. Aliases are
+        completed for text starting with @."""
+        cls.queries += 1
+        if text.startswith("@"):
+            return sorted(a for a in Nav.conf.get("aliases", {})
+                          if a.startswith(text))[:limit]
+        parent, part = split_query(text)
+        key = part.lower()
+        if parent is None:
+            found = set(cls.names.find(key, cls.scan))
+        else:
+            found = set(cls.paths.find(
+                os.path.join(parent, part).lower(), cls.scan))
+            keys = cls.subfolders(parent) or ()
+            added = 0
+            for i in range(bisect.bisect_left(keys, (key,)), len(keys)):
+                lowered, name = keys[i]
+                if not lowered.startswith(key) or added >= limit:
+                    break
+                if part.startswith(".") or not name.startswith("."):
+                    found.add(os.path.join(parent, name))
+                    added += 1
+        now = time.time()
+        return sorted(found, key=lambda p: (-cls.score(p, now),
+                                            p.lower()))[:limit]
+
+    @classmethod
+    def diagnostics(cls):
+        return {
+            "Folders": len(cls.entries),
+            "Rank": round(cls.total),
+            "Queries": cls.queries,
+            "Latency": NavPerf.percentiles("complete"),
+        }
+
+
+class NavCompleter(QtWidgets.QCompleter):
+    """Completes folders in an address bar as it's typed into, from
+    NavFrecency. Folders typed into which aren't listed and sorted yet are
+    in the background, and completed once they are."""
+    listed = QtCore.pyqtSignal(str)
+    pool = futures.ThreadPoolExecutor(1, thread_name_prefix="NavComplete")
+    limit = 20  # completions offered
+
+    def __init__(self, edit):
+        super().__init__(edit)
+        self.edit = edit
+        self.listing = set()  # folders being listed
+        self.model = QtCore.QStringListModel(self)
+        self.setModel(self.model)
+        self.setCompletionMode(QtWidgets.QCompleter.UnfilteredPopupCompletion)
+        self.setMaxVisibleItems(12)
+        # Not the completer of edit, which would filter it all over again
+        self.setWidget(edit)
+        edit.textEdited.connect(self.update)
+        self.listed.connect(self.parent_listed)
+
+    def update(self, text):
+        """Offers the completions of text."""
+        if not text.strip():
+            self.popup().hide()
+            return
+        with NavPerf.timed("complete"):
+            found = NavFrecency.complete(text, self.limit)
+        parent, _ = split_query(text)
+        if parent is not None and parent not in self.listing and \
+                NavFrecency.subfolders(parent) is None:
+            self.listing.add(parent)
+            self.pool.submit(self.list_parent, parent)
+        self.model.setStringList(found)
+        if found:
+            self.complete()
+        else:
+            self.popup().hide()
+
+    def list_parent(self, parent):
+        """Lists and sorts parent. Runs in the pool."""
+        try:
+            NavFrecency.sort_folders(parent)
+        except OSError as e:
+            logger.debug("Unable to list %s: %s", parent, e)
+        try:
+            self.listed.emit(parent)
+        except RuntimeError:  # the address bar is gone
+            pass
+
+    def parent_listed(self, parent):
+        """Completes again if still typing into parent."""
+        self.listing.discard(parent)
+        text = self.edit.text()
+        if self.edit.hasFocus() and split_query(text)[0] == parent:
+            self.update(text)
+
+
+NavDiagnostics.register("Completion", NavFrecency.diagnostics)
@@ -1,19 +1,44 @@
+import errno
+import logging
+import json
 import os
 import shutil
 import sys
 import stat
+import threading
 import time
+from concurrent import futures
 from PyQt5 import QtWidgets, QtCore
-from helper import logger, humansize
+from helper import humansize, setup_logging
+from navtrace import NavTrace
+
+logger = logging.getLogger("navcopier")
 
 
 class NavCopier(QtWidgets.QWidget):
     """Copy/Move files/directories with a progress window."""
-    def __init__(self, arg):
+    strategies = ("buffered", "copy_file_range", "sendfile")
+    strategy = "buffered"  # how file contents are transferred
+    chunk = 16 * 1024  # bytes per read/write or system call
+    workers = 1  # threads copying the files of trees
+    progress_interval = 0.1  # seconds between progress updates
+    # Raised when a filesystem doesn't support a zero copy strategy
+    unsupported = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP,
+                   errno.EBADF}
+
+    def __init__(self, arg, strategy=None, chunk=None, workers=None):
         super().__init__()
         self.act = arg[0]
         self.sources = arg[1: -1]
         self.destination = arg[-1]
+        self.strategy = strategy or NavCopier.strategy
+        self.chunk = chunk or NavCopier.chunk
+        self.workers = workers or NavCopier.workers
+        self.lock = threading.Lock()
+        self.pool = None
+        self.pending = []  # file copies running in the pool
+        self.deferred = []  # dirs whose stats are copied once files are
+        self.files = 0
         self.copied = 0
         self.total = 0
         self.rate = "0"
@@ -22,8 +47,6 @@ class NavCopier(QtWidgets.QWidget):
         self.time_remaining = "0 s"
         self.last_time = 0
         self.build_ui()
-        self.copier(self.act)
-        sys.exit()
 
     def build_ui(self):
         """Builds the copy progress window"""
@@ -59,10 +82,11 @@ class NavCopier(QtWidgets.QWidget):
     def update_progress(self, optional=True):
         """Updates the progress bar."""
         try:
-            self.time_elapsed = time.process_time() - self.start_time
-            # if optional and self.time_elapsed - self.last_time < 0.1:
-            #    return
-            self.last_time = time.process_time()
+            now = time.perf_counter()
+            if optional and now - self.last_time < self.progress_interval:
+                return
+            self.time_elapsed = now - self.start_time
+            self.last_time = now
             completed = self.copied / self.total * 100
             self.pb.setValue(completed)
             self.lbl_copied.setText(f"Copied: {humansize(self.copied)}")
@@ -95,32 +119,47 @@ class NavCopier(QtWidgets.QWidget):
 
     def copier(self, act):
         """Copy/Move files"""
-        self.start_time = time.process_time()
+        self.start_time = started = time.perf_counter()
+        if self.workers > 1:
+            self.pool = futures.ThreadPoolExecutor(self.workers)
         self.lbl_action.setText("Calculating size...")
-        for source in self.sources:
-            self.total += self.get_size(source)
+        with NavTrace.span("size", "copier", sources=len(self.sources)):
+            for source in self.sources:
+                self.total += self.get_size(source)
         self.lbl_total.setText(f"Total Bytes: {humansize(self.total)}")
         if self.act == "copy":
             for src in self.sources:
-                logger.debug(f"Now copying {src}")
-                if os.path.isdir(src):
-                    self.copytree(src, os.path.join(self.destination,
-                                  os.path.basename(src)))
-                else:
-                    self.lbl_src.setText(f"Source: {src}")
-                    self.copy(src, self.destination)
+                logger.debug("Now copying %s", src)
+                with NavTrace.span("copy", "copier", source=src):
+                    if os.path.isdir(src):
+                        self.copytree(src, os.path.join(
+                            self.destination, os.path.basename(src)))
+                    else:
+                        self.lbl_src.setText(f"Source: {src}")
+                        self.copy(src, self.destination)
+                    self.drain()
         elif self.act == "move":
             for src in self.sources:
-                logger.debug(f"Now moving {src}")
+                logger.debug("Now moving %s", src)
                 self.lbl_src.setText(f"Source: {src}")
-                self.move(src, self.destination)
+                with NavTrace.span("move", "copier", source=src):
+                    self.move(src, self.destination)
+        if self.pool is not None:
+            self.pool.shutdown()
+        self.update_progress(optional=False)
+        # Reported to the parent for its throughput statistics and trace
+        print(f"copied {self.copied} {time.perf_counter() - started}",
+              flush=True)
+        if NavTrace.enabled:
+            print(f"trace {json.dumps(NavTrace.dump('navcopier'))}",
+                  flush=True)
         # self.thread_instance.stop()
 
     def copy(self, src, dst):
         """Reimplemented to report copy progress"""
         if os.path.isdir(dst):
             dst = os.path.join(dst, os.path.basename(src))
-        logger.debug(f"{self.act} {src} to {dst}")
+        logger.debug("%s %s to %s", self.act, src, dst)
         if os.path.exists(dst):
             choice = QtWidgets.QMessageBox.question(
                      None, "File exists",
@@ -128,10 +167,15 @@ class NavCopier(QtWidgets.QWidget):
                      QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No)
             if choice == QtWidgets.QMessageBox.No:
                 return
+        self.copy_file(src, dst)
 
+    def copy_file(self, src, dst):
+        """Copies contents and metadata of a file. May run in the pool."""
         self.copyfile(src, dst, follow_symlinks=True)
         shutil.copystat(src, dst, follow_symlinks=True)
         shutil.copymode(src, dst)
+        with self.lock:
+            self.files += 1
 
     def copyfile(self, src, dst, *, follow_symlinks=True):
         """Reimplemented to report copy progress"""
@@ -158,16 +202,80 @@ class NavCopier(QtWidgets.QWidget):
                     self.copyfileobj(fsrc, fdst)
         return dst
 
-    def copyfileobj(self, fsrc, fdst, length=16*1024):
+    def copyfileobj(self, fsrc, fdst):
         """Reimplemented to report copy progress"""
-        while 1:
-            buf = fsrc.read(length)
-            if not buf:
+        if self.strategy == "buffered":
+            return self.transfer_buffered(fsrc, fdst)
+        try:
+            getattr(self, f"transfer_{self.strategy}")(fsrc, fdst)
+        except OSError as e:
+            if e.errno not in self.unsupported or fdst.tell():
+                raise
+            logger.debug("%s unsupported for %s, copying buffered",
+                         self.strategy, fsrc.name)
+            self.transfer_buffered(fsrc, fdst)
+
+    def transfer_buffered(self, fsrc, fdst):
+        """Copies through a reused buffer, no larger than the file."""
+        size = os.fstat(fsrc.fileno()).st_size
+        buf = bytearray(min(self.chunk, size + 1))
+        view = memoryview(buf)
+        while True:
+            n = fsrc.readinto(buf)
+            if not n:
                 break
-            fdst.write(buf)
-            self.copied += len(buf)
+            fdst.write(view[:n])
+            self.add_progress(n)
+
+    def transfer_copy_file_range(self, fsrc, fdst):
+        """Copies within the kernel, sharing extents where supported."""
+        src, dst = fsrc.fileno(), fdst.fileno()
+        while True:
+            n = os.copy_file_range(src, dst, self.chunk)
+            if not n:
+                break
+            self.add_progress(n)
+
+    def transfer_sendfile(self, fsrc, fdst):
+        """Copies within the kernel through sendfile."""
+        src, dst = fsrc.fileno(), fdst.fileno()
+        offset = 0
+        while True:
+            n = os.sendfile(dst, src, offset, self.chunk)
+            if not n:
+                break
+            offset += n
+            self.add_progress(n)
+
+    def add_progress(self, n):
+        """Counts copied bytes, showing them when on the GUI thread."""
+        with self.lock:
+            self.copied += n
+        if threading.current_thread() is threading.main_thread():
             self.update_progress()
-        self.update_progress(optional=False)
+
+    def drain(self):
+        """Waits for file copies handed to the pool."""
+        errors = []
+        while self.pending:
+            done, running = futures.wait(self.pending,
+                                         self.progress_interval)
+            self.pending = list(running)
+            for future in done:
+                try:
+                    future.result()
+                except OSError as why:
+                    errors.append(str(why))
+            self.update_progress()
+        # Files created in a dir modify it, so stats go after
+        for src, dst in reversed(self.deferred):
+            try:
+                shutil.copystat(src, dst)
+            except OSError as why:
+                errors.append(str(why))
+        self.deferred = []
+        if errors:
+            raise shutil.Error(errors)
 
     def copytree(self, src, dst, symlinks=False, ignore=None,
                  copy_function=None, ignore_dangling_symlinks=False):
@@ -182,7 +290,7 @@ class NavCopier(QtWidgets.QWidget):
 
         try:
             os.makedirs(dst)
-            logger.debug(f"Directory created: {dst}")
+            logger.debug("Directory created: %s", dst)
         except FileExistsError:
             choice = QtWidgets.QMessageBox.question(
                         None, "Folder exists",
@@ -219,6 +327,10 @@ class NavCopier(QtWidgets.QWidget):
                 elif os.path.isdir(srcname):
                     self.copytree(srcname, dstname, symlinks, ignore,
                                   copy_function)
+                elif self.pool is not None and \
+                        not os.path.lexists(dstname):
+                    self.pending.append(self.pool.submit(
+                        self.copy_file, srcname, dstname))
                 else:
                     # Will raise a SpecialFileError for unsupported file types
                     copy_function(srcname, dstname)
@@ -228,6 +340,11 @@ class NavCopier(QtWidgets.QWidget):
                 errors.extend(err.args[0])
             except OSError as why:
                 errors.append((srcname, dstname, str(why)))
+        if self.pool is not None:
+            self.deferred.append((src, dst))
+            if errors:
+                raise shutil.Error(errors)
+            return dst
         try:
             shutil.copystat(src, dst)
         except OSError as why:
@@ -239,6 +356,14 @@ class NavCopier(QtWidgets.QWidget):
             # logger.debug(errors)
         return dst
 
+    def same_device(self, src, dst):
+        """Checks up front if src can be renamed to dst."""
+        parent = os.path.dirname(os.path.abspath(dst))
+        try:
+            return os.lstat(src).st_dev == os.stat(parent).st_dev
+        except OSError:
+            return False
+
     def move(self, src, dst, copy_function=None):
         """Reimplemented to report move progress"""
         copy_function = self.copy
@@ -264,48 +389,50 @@ class NavCopier(QtWidgets.QWidget):
                 if choice == QtWidgets.QMessageBox.No:
                     return
                 if os.path.isdir(src):
-                    logger.debug(f"now doing a folder move for {src}")
+                    logger.debug("now doing a folder move for %s", src)
                     for d in os.listdir(src):
                         d2 = os.path.join(src, d)
                         self.move(d2, real_dst)
                 else:
-                    logger.debug(f"now doing a file move for {src}")
+                    logger.debug("now doing a file move for %s", src)
                     # self.move(src, real_dst)
             # raise Error("Destination path '%s' already exists" % real_dst)
-        try:
-            # if os.path.isdir(real_dst):
-            #    raise OSError
-            logger.debug(f"Trying rename from {src} to {real_dst}")
-            size = self.get_size(src)
-            os.rename(src, real_dst)
-            self.copied += size
-            self.update_progress()  # self.copied)
-        except OSError:
-            logger.debug(
-                f"Rename from {src} to {real_dst} failed. Trying alternatives")
-            if os.path.islink(src):
-                linkto = os.readlink(src)
-                os.symlink(linkto, real_dst)
-                os.unlink(src)
-            elif os.path.isdir(src):
-                if shutil._destinsrc(src, dst):
-                    raise shutil.Error(f"Cannot move a directory '{src}' into "
-                                       f"itself '{dst}'.")
-                try:
-                    logger.debug(f"Copy tree from {src} to {real_dst}")
-                    self.copytree(src, real_dst, copy_function=copy_function,
-                                  symlinks=True)
-                    shutil.rmtree(src)
-                except Exception:
-                    logger.debug(f"Error copying {src}")
-            else:
-                logger.debug(f"Copy file from {src} to {real_dst}")
-                copy_function(src, real_dst)
-                os.unlink(src)
+        if self.same_device(src, real_dst):
+            try:
+                logger.debug("Renaming %s to %s", src, real_dst)
+                size = self.get_size(src)
+                os.rename(src, real_dst)
+                self.copied += size
+                self.update_progress()  # self.copied)
+                return real_dst
+            except OSError:
+                logger.debug("Rename from %s to %s failed. "
+                             "Trying alternatives", src, real_dst)
+        if os.path.islink(src):
+            linkto = os.readlink(src)
+            os.symlink(linkto, real_dst)
+            os.unlink(src)
+        elif os.path.isdir(src):
+            if shutil._destinsrc(src, dst):
+                raise shutil.Error(f"Cannot move a directory '{src}' into "
+                                   f"itself '{dst}'.")
+            try:
+                logger.debug("Copy tree from %s to %s", src, real_dst)
+                self.copytree(src, real_dst, copy_function=copy_function,
+                              symlinks=True)
+                self.drain()
+                shutil.rmtree(src)
+            except Exception:
+                logger.debug("Error copying %s", src)
+        else:
+            logger.debug("Copy file from %s to %s", src, real_dst)
+            copy_function(src, real_dst)
+            os.unlink(src)
         return real_dst
 
 
 if __name__ == '__main__':
+    setup_logging()
     app = QtWidgets.QApplication(sys.argv)
     ex = NavCopier(sys.argv[1:])
-    sys.exit(app.exec_())
+    ex.copier(ex.act)
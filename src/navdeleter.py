@@ -0,0 +1,167 @@
+import logging
+import os
+import threading
+import time
+from concurrent import futures
+from PyQt5 import QtCore
+from .pub import Pub
+
+logger = logging.getLogger(__name__)
+
+
+class NavDeleter(QtCore.QObject):
+    """Permanently deletes files/directories in the background."""
+    removed = QtCore.pyqtSignal(list)
+    finished = QtCore.pyqtSignal(int, int)
+    workers = min(8, (os.cpu_count() or 1) * 2)
+    chunk = 256  # files unlinked per pool task
+    interval = 0.5  # seconds between progress/batch updates
+    single_batch = False  # send removals only once the job is done
+    verbs = ("Deleting", "Deleted")
+    jobs = set()  # keeps running jobs alive until they finish
+
+    def __init__(self, paths, pid=""):
+        super().__init__()
+        self.paths = list(dict.fromkeys(paths))
+        self.pid = pid
+        self.files = self.dirs = self.errors = 0
+        self.failure = None  # (path, reason) of the first error
+        self.lock = threading.Lock()
+        self.pending = []
+        self.last_update = 0
+
+    def start(self):
+        """Starts the deletion on a background thread."""
+        self.jobs.add(self)
+        self.finished.connect(lambda *_: self.jobs.discard(self))
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        """Deletes each path and reports removed paths in batches."""
+        Pub.notify("App", f"{self.pid}: {self.verbs[0]} {len(self.paths)} "
+                   "item(s)")
+        with futures.ThreadPoolExecutor(self.workers) as pool:
+            for path in self.paths:
+                try:
+                    if os.path.isdir(path) and not os.path.islink(path):
+                        ok = self.rmtree(pool, path)
+                    else:
+                        ok = self.unlink(path)
+                        with self.lock:
+                            self.files += ok
+                except OSError as e:
+                    ok = False
+                    self.error(path, e)
+                if ok:
+                    self.deleted(path)
+                    self.pending.append(path)
+                self.report()
+        self.report(final=True)
+        logger.info("%s: %s %s files, %s dirs with %s errors", self.pid,
+                    self.verbs[1], self.files, self.dirs, self.errors)
+        self.finished.emit(self.files + self.dirs, self.errors)
+
+    def deleted(self, path):
+        """Invoked after a path was completely removed."""
+        pass
+
+    def report(self, final=False):
+        """Sends progress to the status bar and removed rows to the model."""
+        now = time.monotonic()
+        if not final and now - self.last_update < self.interval:
+            return
+        self.last_update = now
+        if self.pending and (final or not self.single_batch):
+            self.removed.emit(self.pending)
+            self.pending = []
+        state = self.verbs[1] if final else f"{self.verbs[0]}..."
+        msg = f"{self.pid}: {state} {self.files} files, {self.dirs} folders"
+        if self.errors:
+            msg += f", {self.errors} errors"
+            if final:
+                msg += " ({}: {})".format(*self.failure)
+        Pub.notify("App", msg, 5000 if final else 1000)
+
+    def error(self, path, e):
+        """Records an error without stopping the job, the first of which
+        is reported once the job is done."""
+        with self.lock:
+            self.errors += 1
+            if self.failure is None:
+                self.failure = (path, getattr(e, 'strerror', None) or e)
+        logger.error("Error %s %s: %s", self.verbs[0].lower(), path, e)
+
+    def unlink(self, path):
+        """Unlinks a file, ignoring one already gone."""
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        return True
+
+    def unlink_files(self, paths):
+        """Unlinks a batch of files. Runs in the pool."""
+        done = 0
+        for path in paths:
+            try:
+                done += self.unlink(path)
+            except OSError as e:
+                self.error(path, e)
+        with self.lock:
+            self.files += done
+
+    def scan(self, d):
+        """Lists a directory returning its subdirectories and files."""
+        dirs = []
+        files = []
+        with os.scandir(d) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.path)
+                else:
+                    files.append(entry.path)
+        return dirs, files
+
+    def rmdir(self, d):
+        """Removes an (empty) directory. Runs in the pool."""
+        try:
+            os.rmdir(d)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            self.error(d, e)
+            return
+        with self.lock:
+            self.dirs += 1
+
+    def rmtree(self, pool, root):
+        """Walks the tree in parallel unlinking files as they are found
+        and then removes the directories bottom-up, level by level."""
+        levels = [[root]]
+        running = {pool.submit(self.scan, root): (0, root)}
+        unlinks = []
+        while running:
+            done, _ = futures.wait(running,
+                                   return_when=futures.FIRST_COMPLETED)
+            for f in done:
+                level, d = running.pop(f)
+                try:
+                    dirs, files = f.result()
+                except OSError as e:
+                    self.error(d, e)
+                    continue
+                for i in range(0, len(files), self.chunk):
+                    unlinks.append(pool.submit(self.unlink_files,
+                                               files[i:i + self.chunk]))
+                if dirs:
+                    if len(levels) == level + 1:
+                        levels.append([])
+                    levels[level + 1] += dirs
+                    for sub in dirs:
+                        running[pool.submit(self.scan, sub)] = (level + 1, sub)
+            self.report()
+        futures.wait(unlinks)
+        for level in reversed(levels):
+            list(pool.map(self.rmdir, level))
+            self.report()
+        return not os.path.lexists(root)
@@ -0,0 +1,249 @@
+import logging
+import os
+import select
+import shutil
+import threading
+import time
+from concurrent import futures
+from .pub import Pub
+
+logger = logging.getLogger(__name__)
+
+
+class NavDevices:
+    """Cached mount table to map paths to devices and free space."""
+    mountinfo = "/proc/self/mountinfo"
+    mounts = []  # (mount point, device, fs type) longest mount point first
+    cache = {}  # path -> (device, fs type, mount point)
+    free = {}  # mount point -> (time, free bytes)
+    probed = {}  # mount point -> (time, available)
+    probing = {}  # mount point -> (start, done event) of running probes
+    ttl = 2  # seconds free space stays valid
+    probe_ttl = 30  # seconds a probe result stays valid
+    probe_timeout = 1  # seconds before a mount is considered dead
+    lock = threading.Lock()
+    running = False
+    pseudo = {
+        "autofs", "binfmt_misc", "bpf", "cgroup", "cgroup2", "configfs",
+        "debugfs", "devpts", "devtmpfs", "efivarfs", "fusectl", "hugetlbfs",
+        "mqueue", "nsfs", "proc", "pstore", "rpc_pipefs", "securityfs",
+        "selinuxfs", "sysfs", "tracefs",
+    }
+    network = {"cifs", "smb3", "smbfs", "nfs", "nfs4", "9p", "afs",
+               "ceph", "glusterfs", "davfs", "sshfs"}
+
+    @classmethod
+    def start(cls):
+        """Reads the mount table and refreshes it whenever it changes."""
+        if cls.running:
+            return
+        cls.running = True
+        cls.refresh()
+        for mp in cls.get_mounts():
+            cls.probe(mp)
+        if os.path.exists(cls.mountinfo):
+            threading.Thread(target=cls.wait_for_changes, daemon=True,
+                             name="NavDevices").start()
+
+    @classmethod
+    def wait_for_changes(cls):
+        """Blocks until the kernel flags a mount table change."""
+        with open(cls.mountinfo, "rb") as fh:
+            poller = select.poll()
+            poller.register(fh, select.POLLPRI | select.POLLERR)
+            while cls.running:
+                fh.read()  # consume the current state before waiting
+                fh.seek(0)
+                if poller.poll():
+                    logger.debug("Mount table changed")
+                    cls.refresh()
+                    Pub.notify("Devices.Changed")
+
+    @staticmethod
+    def unescape(field):
+        """Decodes octal escapes used in mountinfo paths."""
+        if "\\" not in field:
+            return field
+        return field.encode().decode("unicode_escape").encode(
+            "latin-1").decode(errors="surrogateescape")
+
+    @classmethod
+    def read_mountinfo(cls):
+        """Parses mountinfo into (mount point, device, fs type) tuples."""
+        mounts = []
+        with open(cls.mountinfo, "r") as fh:
+            for line in fh:
+                fields = line.split()
+                sep = fields.index("-")
+                major, minor = fields[2].split(":")
+                mounts.append((cls.unescape(fields[4]),
+                               os.makedev(int(major), int(minor)),
+                               fields[sep + 1]))
+        return mounts
+
+    @classmethod
+    def read_partitions(cls):
+        """Falls back to psutil where mountinfo isn't available."""
+        import psutil
+        mounts = []
+        for p in psutil.disk_partitions(all=True):
+            try:
+                dev = os.stat(p.mountpoint).st_dev
+            except OSError:
+                continue
+            mounts.append((p.mountpoint, dev, p.fstype))
+        return mounts
+
+    @classmethod
+    def refresh(cls):
+        """Re-reads the mount table and drops cached lookups."""
+        try:
+            mounts = cls.read_mountinfo()
+        except (OSError, ValueError, IndexError):
+            mounts = cls.read_partitions()
+        mounts.sort(key=lambda m: len(m[0]), reverse=True)
+        with cls.lock:
+            cls.mounts = mounts
+            cls.cache = {}
+            cls.free = {}
+            cls.probed = {}
+
+    @classmethod
+    def lookup(cls, path):
+        """Returns (device, fs type, mount point) for a path, following
+        symlinks to the mount they lead to."""
+        if not cls.running:
+            cls.start()
+        key = os.path.abspath(path)
+        try:
+            return cls.cache[key]
+        except KeyError:
+            pass
+        path = os.path.realpath(key)
+        info = (None, "", os.sep)
+        for mp, dev, fstype in cls.mounts:
+            if path == mp or path.startswith(mp.rstrip(os.sep) + os.sep):
+                info = (dev, fstype, mp)
+                break
+        with cls.lock:
+            if len(cls.cache) > 4096:
+                cls.cache = {}
+            cls.cache[key] = info
+        return info
+
+    @classmethod
+    def device(cls, path):
+        return cls.lookup(path)[0]
+
+    @classmethod
+    def fs_type(cls, path):
+        return cls.lookup(path)[1]
+
+    @classmethod
+    def mount_point(cls, path):
+        return cls.lookup(path)[2]
+
+    @classmethod
+    def same_device(cls, src, dst):
+        """Checks if a rename of src into dst can work. src itself is
+        renamed, symlink or not, so the mount of its folder counts."""
+        src = os.path.abspath(src)
+        return cls.lookup(os.path.dirname(src))[2] == cls.lookup(dst)[2]
+
+    @classmethod
+    def get_mounts(cls, physical=True):
+        """Returns mount points, skipping pseudo filesystems if asked."""
+        if not cls.running:
+            cls.start()
+        return [mp for mp, dev, fstype in cls.mounts
+                if not physical or fstype not in cls.pseudo]
+
+    @classmethod
+    def run(cls, fn, *args, timeout=None):
+        """Runs a possibly blocking call on a thread of its own, giving up
+        after a timeout. A call which hangs holds only its own thread."""
+        future = futures.Future()
+
+        def call():
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=call, daemon=True,
+                         name="NavDevices.run").start()
+        return future.result(timeout or cls.probe_timeout)
+
+    @classmethod
+    def probe(cls, mp):
+        """Measures the free space of mp on a thread of its own, which
+        tells whether it responds, unless a probe of it is under way."""
+        with cls.lock:
+            if mp in cls.probing:
+                return cls.probing[mp][1]
+            done = threading.Event()
+            cls.probing[mp] = (time.monotonic(), done)
+
+        def run():
+            try:
+                free = shutil.disk_usage(mp).free
+            except OSError:
+                free = None
+            now = time.monotonic()
+            with cls.lock:
+                del cls.probing[mp]
+                cls.probed[mp] = (now, free is not None)
+                if free is not None:
+                    cls.free[mp] = (now, free)
+            done.set()
+
+        threading.Thread(target=run, daemon=True,
+                         name="NavDevices.probe").start()
+        return done
+
+    @classmethod
+    def state(cls, mp):
+        """Returns whether mp is known to be available or None, and
+        whether that is still current. A mount whose probe has hung past
+        the timeout is dead until the probe returns."""
+        now = time.monotonic()
+        with cls.lock:
+            probing = cls.probing.get(mp)
+            stamp, ok = cls.probed.get(mp, (None, None))
+        if probing is not None and now - probing[0] > cls.probe_timeout:
+            return False, True
+        return ok, stamp is not None and now - stamp < cls.probe_ttl
+
+    @classmethod
+    def is_available(cls, path):
+        """Returns whether the mount holding path responds, probing it
+        anew once its state is outdated. On the GUI thread the last known
+        state is returned right away, mounts not probed yet are taken to
+        be available. Elsewhere the probe is waited for."""
+        mp = cls.mount_point(path)
+        ok, current = cls.state(mp)
+        if current:
+            return ok
+        done = cls.probe(mp)
+        if threading.current_thread() is threading.main_thread():
+            return ok is not False
+        if not done.wait(cls.probe_timeout):
+            logger.warning("%s did not respond. Skipping it.", mp)
+        return cls.state(mp)[0] is True
+
+    @classmethod
+    def free_space(cls, path):
+        """Returns the last known free bytes on the device of path or
+        None, measuring it anew in the background once outdated."""
+        mp = cls.mount_point(path)
+        if not cls.is_available(mp):
+            return None
+        with cls.lock:
+            stamp, free = cls.free.get(mp, (0, None))
+        if time.monotonic() - stamp >= cls.ttl:
+            cls.probe(mp)
+        return free
+
+    @classmethod
+    def stop(cls):
+        cls.running = False
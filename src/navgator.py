@@ -1,22 +1,29 @@
 #!/bin/python3
 
-import faulthandler
 import json
+import logging
 import os
 import pathlib
-import psutil
 import sys
 import subprocess
 from PyQt5 import QtGui, QtCore, QtWidgets
 from .core import Nav, NavView, NavSize
 from .custom import NavTree
-from .helper import logger, deep_merge, humansize
+from .helper import deep_merge, humansize, setup_logging
 from .navwatcher import NavWatcher
 from .panes import NavPane
 from .pub import Pub
+from .session import NavSession
 from .settings import NavSettings
+from .diagnostics import NavDiagnostics
 from .imageviewer import NavViewer
-from .navtrash import NavTrash
+from .navcomplete import NavFrecency
+from .navdevices import NavDevices
+from .navperf import NavPerf, NavPerfHud, NavStallDetector
+from .navprofile import NavProfiler
+from .navtrace import NavTrace
+
+logger = logging.getLogger(__name__)
 
 
 class NavApp(QtWidgets.QApplication):
@@ -33,12 +40,13 @@ class Navgator(QtWidgets.QMainWindow):
     def __init__(self, *args):
         super().__init__()
         self.title = 'Navgator'
-        NavTrash.get_trash_folders()
+        NavDevices.start()
         self.load_settings()
+        setup_logging(Nav.conf["logging"])
+        NavSession.load()
+        NavFrecency.load()
         Nav.icon = QtGui.QIcon(f"{Nav.app_dir}{os.sep}navgator.ico")
         self.setWindowIcon(Nav.icon)
-        proc_id = os.getpid()
-        self.res_info = psutil.Process(proc_id)
         self.img_vwr = None
         threadpool = QtCore.QThreadPool()
         threadpool.setMaxThreadCount(1)
@@ -129,13 +137,20 @@ class Navgator(QtWidgets.QMainWindow):
         self.active_pane_changed(Nav.pact)
         Nav.conf["window"]["statusbar"] = not Nav.conf["window"]["statusbar"]
         self.statusbar_toggle()
+        self.perf_hud = NavPerfHud(self)
+        self.perf_hud.toggle(Nav.conf["window"]["perf_hud"])
+        NavStallDetector.start(Nav.conf["stall_ms"])
         self.sb.showMessage("Ready", 2000)
+        if NavSession.enabled():
+            self.session_timer = QtCore.QTimer()
+            self.session_timer.timeout.connect(
+                lambda: NavSession.save(self.panes))
+            self.session_timer.start(Nav.conf["session_interval"] * 1000)
 
     def update_resources(self):
         """Updates a label with memory usage"""
-        # logger.debug(self.res_info.memory_full_info())
-        mem = humansize(self.res_info.memory_full_info().uss)
-        cpu = self.res_info.cpu_percent()
+        mem = humansize(NavPerf.memory())
+        cpu = NavPerf.cpu_percent()
         self.res_label.setText(f"{mem} ({cpu}%)")
 
     def define_actions(self):
@@ -202,6 +217,11 @@ class Navgator(QtWidgets.QMainWindow):
                 "triggered": (lambda: Nav.pact.tabbar.currentWidget().
                               delete()),
             },
+            "restore": {
+                "caption": "R&estore from Trash",
+                "triggered": (lambda: Nav.pact.tabbar.currentWidget().
+                              restore()),
+            },
             "del_dir_up": {
                 "caption": "Delete Dir Up",
                 "shortcut": "Ctrl+del",
@@ -303,6 +323,32 @@ class Navgator(QtWidgets.QMainWindow):
                 "shortcut": "F9",
                 "triggered": self.show_settings,
             },
+            "profile": {
+                "caption": "&Profile...",
+                "shortcut": "Shift+F9",
+                "triggered": self.profile,
+            },
+            "diagnostics": {
+                "caption": "&Diagnostics",
+                "triggered": self.show_diagnostics,
+            },
+            "perf_hud": {
+                "caption": "&Performance HUD",
+                "checkable": True,
+                "checked": Nav.conf["window"]["perf_hud"],
+                "shortcut": "Shift+F12",
+                "triggered": self.perf_hud_toggle,
+            },
+            "trace": {
+                "caption": "Record T&race",
+                "checkable": True,
+                "checked": NavTrace.enabled,
+                "triggered": self.trace_toggle,
+            },
+            "export_trace": {
+                "caption": "E&xport Trace...",
+                "triggered": self.export_trace,
+            },
             "statusbar": {
                 "caption": "&Status Bar",
                 "checkable": True,
@@ -485,8 +531,8 @@ class Navgator(QtWidgets.QMainWindow):
         items["edit"]["sm"] = [
             Nav.actions["rename"], Nav.actions["cut"], Nav.actions["copy"],
             Nav.actions["paste"], Nav.actions["trash"], Nav.actions["delete"],
-            Nav.actions["del_dir_up"], Nav.actions["new_file"],
-            Nav.actions["new_folder"],
+            Nav.actions["restore"], Nav.actions["del_dir_up"],
+            Nav.actions["new_file"], Nav.actions["new_folder"],
             {
                 "caption": "&Selections",
                 "sm": [
@@ -521,7 +567,10 @@ class Navgator(QtWidgets.QMainWindow):
 
         items["window"]["sm"] += [
             Nav.actions["maintree"], Nav.actions["settings"],
-            Nav.actions["statusbar"],
+            Nav.actions["profile"],
+            Nav.actions["statusbar"], Nav.actions["perf_hud"],
+            Nav.actions["diagnostics"], Nav.actions["trace"],
+            Nav.actions["export_trace"],
         ]
 
         self.expose_shortcuts(items)
@@ -587,7 +636,7 @@ class Navgator(QtWidgets.QMainWindow):
                     return
             Nav.conf["panes"][item]["visible"] = True
             self.sender().setChecked(True)
-            logger.warning(f"Can't hide last visible pane.")
+            logger.warning("Can't hide last visible pane.")
             Pub.notify("App", f"{item}: Can't hide last visible pane.")
             return False
         else:
@@ -620,12 +669,61 @@ class Navgator(QtWidgets.QMainWindow):
             self.sb.show()
         Nav.conf["window"]["statusbar"] = not Nav.conf["window"]["statusbar"]
 
+    def perf_hud_toggle(self):
+        """Toggle the performance overlay."""
+        Nav.conf["window"]["perf_hud"] = not Nav.conf["window"]["perf_hud"]
+        self.perf_hud.toggle(Nav.conf["window"]["perf_hud"])
+
+    def trace_toggle(self):
+        """Starts or stops recording trace spans."""
+        NavTrace.enabled = not NavTrace.enabled
+        Pub.notify("App", "Tracing " + ("started" if NavTrace.enabled
+                                        else "stopped"))
+
+    def export_trace(self):
+        """Saves recent trace spans for chrome://tracing or Perfetto."""
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(
+            self, "Export Trace",
+            os.path.join(str(pathlib.Path.home()), "navgator-trace.json"),
+            "Trace (*.json)")
+        if not path:
+            return
+        try:
+            NavTrace.export(path)
+        except OSError as e:
+            logger.error("Error exporting trace to %s: %s", path, e)
+            Pub.notify("App", f"Error exporting trace: {e}")
+            return
+        Pub.notify("App", f"Trace exported to {path}")
+
+    def profile(self):
+        """Starts sampling for a chosen no. of seconds, or stops early."""
+        if NavProfiler.running():
+            NavProfiler.stop()
+            return
+        seconds, ok = QtWidgets.QInputDialog.getInt(
+            self, "Profile", "Seconds to sample:",
+            Nav.conf["profile_seconds"], 1, 3600)
+        if not ok:
+            return
+        Nav.conf["profile_seconds"] = seconds
+        # Called on the sampler thread, the signal queues it to ours
+        NavProfiler.start(seconds, lambda paths: self.update_sb.emit(
+            "Profile saved to " + ", ".join(paths) if paths
+            else "Error saving profile", 5000))
+        key = Nav.actions["profile"].shortcut().toString()
+        Pub.notify("App", f"Profiling for {seconds}s, {key} to stop")
+
     def show_settings(self):
         """Displays the settings window."""
         setting = NavSettings(self)
         setting.settings_changed.connect(self.settings_changed)
         setting.show()
 
+    def show_diagnostics(self):
+        """Displays internal counters like watches held."""
+        NavDiagnostics(self).show()
+
     def settings_changed(self):
         logger.debug("Settings were changed")
         self.create_menu()
@@ -654,11 +752,13 @@ class Navgator(QtWidgets.QMainWindow):
 
     def contextMenuEvent(self, event):
         child = self.childAt(event.pos())
-        logger.debug(f"Context menu requested on {child}")
+        logger.debug("Context menu requested on %s", child)
 
     def save_settings(self):
         """Saves application settings to reload later on."""
         NavWatcher.stop()  # Stop watching folders
+        NavSession.save(self.panes, wait=True)
+        NavFrecency.save()
         # Remember window sizes
         wind = self.geometry()
         Nav.conf["dims"] = {
@@ -696,7 +796,7 @@ class Navgator(QtWidgets.QMainWindow):
             Nav.conf["panes"]["active"] = Nav.pact.pid
         with open(Nav.conf_file, "w") as json_file:
             json.dump(Nav.conf, json_file, indent=4)
-        logger.debug(f"Settings saved to {Nav.conf_file}")
+        logger.debug("Settings saved to %s", Nav.conf_file)
 
     def load_settings(self, conf: str=Nav.conf_file):
         """Load a config file and merge it with defaults"""
@@ -765,6 +865,7 @@ def exception_hook(exctype, val, trcbk):
 
 
 def main(args=None):
+    setup_logging()
     if args is None:
         args = sys.argv[1:]
         logger.debug(args)
@@ -778,6 +879,7 @@ def trace(frame, event, arg):
 
 
 if __name__ == '__main__':
+    import faulthandler
     faulthandler.enable()
     # sys.settrace(trace)
     main()
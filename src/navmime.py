@@ -0,0 +1,128 @@
+import collections
+import logging
+import os
+import threading
+from concurrent import futures
+from PyQt5 import QtCore
+from .diagnostics import NavDiagnostics
+
+logger = logging.getLogger(__name__)
+
+
+class NavMimeSignals(QtCore.QObject):
+    """Announces types sniffed in the background on the GUI thread."""
+    detected = QtCore.pyqtSignal(str, str)
+
+
+class NavMime:
+    """Process wide MIME type detection. Extensions which rarely lie are
+    trusted as is, other files are sniffed with libmagic and remembered
+    by (inode, mtime, size) so they're read once."""
+    trusted = {
+        ".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png",
+        ".gif": "image/gif", ".webp": "image/webp", ".bmp": "image/bmp",
+        ".tif": "image/tiff", ".tiff": "image/tiff",
+        ".svg": "image/svg+xml", ".ico": "image/vnd.microsoft.icon",
+        ".mp3": "audio/mpeg", ".flac": "audio/flac", ".ogg": "audio/ogg",
+        ".wav": "audio/x-wav", ".m4a": "audio/mp4", ".mp4": "video/mp4",
+        ".mkv": "video/x-matroska", ".webm": "video/webm",
+        ".avi": "video/x-msvideo", ".mov": "video/quicktime",
+        ".pdf": "application/pdf", ".txt": "text/plain",
+        ".md": "text/markdown", ".py": "text/x-python", ".c": "text/x-c",
+        ".h": "text/x-c", ".cpp": "text/x-c++", ".js": "text/javascript",
+        ".css": "text/css", ".html": "text/html", ".htm": "text/html",
+        ".json": "application/json", ".xml": "text/xml",
+        ".csv": "text/csv", ".zip": "application/zip",
+        ".tar": "application/x-tar", ".gz": "application/gzip",
+        ".bz2": "application/x-bzip2", ".xz": "application/x-xz",
+        ".7z": "application/x-7z-compressed",
+        ".iso": "application/x-iso9660-image",
+    }
+    unknown = "application/octet-stream"
+    cache = collections.OrderedDict()  # path -> ((ino, mtime, size), type)
+    max_entries = 100000
+    pending = set()  # paths being sniffed
+    hits = misses = sniffed = 0
+    lock = threading.Lock()
+    pool = futures.ThreadPoolExecutor(2, thread_name_prefix="NavMime")
+    signals = NavMimeSignals()
+
+    @classmethod
+    def from_extension(cls, path):
+        """Returns the type of a trusted extension, or None."""
+        return cls.trusted.get(os.path.splitext(path)[1].lower())
+
+    @classmethod
+    def lookup(cls, path, size=None):
+        """Returns the type of path if known without touching the disk.
+        Cached types are only revalidated against size, the size of path
+        as listed, if given; forget drops those of changed files. Otherwise
+        returns None and sniffs path in the background, announcing it
+        through signals.detected."""
+        mime = cls.from_extension(path)
+        if mime is not None:
+            return mime
+        with cls.lock:
+            cached = cls.cache.get(path)
+            if cached is not None and (size is None or
+                                       cached[0][2] == size):
+                cls.hits += 1
+                cls.cache.move_to_end(path)
+                return cached[1]
+            cls.misses += 1
+            if path in cls.pending:
+                return None
+            cls.pending.add(path)
+        cls.pool.submit(cls.sniff_later, path)
+        return None
+
+    @classmethod
+    def forget(cls, path):
+        """Drops the cached type of a file which changed."""
+        with cls.lock:
+            cls.cache.pop(path, None)
+
+    @classmethod
+    def sniff(cls, path, stamp):
+        """Reads the type of path and caches it."""
+        import magic
+        try:
+            mime = magic.detect_from_filename(path).mime_type
+        except ValueError as e:  # unreadable
+            logger.debug("Unable to sniff %s: %s", path, e)
+            mime = cls.unknown
+        with cls.lock:
+            cls.sniffed += 1
+            cls.cache[path] = (stamp, mime)
+            cls.cache.move_to_end(path)
+            while len(cls.cache) > cls.max_entries:
+                cls.cache.popitem(last=False)
+        return mime
+
+    @classmethod
+    def sniff_later(cls, path):
+        """Runs on the pool for lookup."""
+        try:
+            st = os.stat(path)
+            mime = cls.sniff(path, (st.st_ino, st.st_mtime_ns, st.st_size))
+        except (OSError, ImportError) as e:
+            logger.debug("Unable to sniff %s: %s", path, e)
+            mime = cls.unknown
+        finally:
+            with cls.lock:
+                cls.pending.discard(path)
+        cls.signals.detected.emit(path, mime)
+
+    @classmethod
+    def diagnostics(cls):
+        """Returns cache counters for the diagnostics dialog."""
+        return {
+            "Types": len(cls.cache),
+            "Hits": cls.hits,
+            "Misses": cls.misses,
+            "Sniffed": cls.sniffed,
+            "Pending": len(cls.pending),
+        }
+
+
+NavDiagnostics.register("MIME cache", NavMime.diagnostics)
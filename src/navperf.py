@@ -0,0 +1,324 @@
+import collections
+import contextlib
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+import traceback
+from PyQt5 import QtCore, QtWidgets
+from .core import Nav
+from .diagnostics import NavDiagnostics
+from .helper import humansize
+from .navtrace import NavTrace
+
+logger = logging.getLogger(__name__)
+
+
+class NavPerf:
+    """Keeps recent latencies of operations and samples resource usage
+    from cheap sources. Recording is always on, it only appends to a
+    bounded deque."""
+    samples = {}  # operation -> deque of (seconds, amount)
+    keep = 512  # samples kept per operation
+    queues = {}  # name -> callable returning the queue depth
+    lock = threading.Lock()
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    last_cpu = None  # (wall, cpu) at the previous cpu_percent call
+
+    @classmethod
+    def record(cls, op, seconds, amount=0):
+        """Records a latency and optionally the bytes/items it handled."""
+        with cls.lock:
+            try:
+                cls.samples[op].append((seconds, amount))
+            except KeyError:
+                cls.samples[op] = collections.deque([(seconds, amount)],
+                                                    maxlen=cls.keep)
+
+    @classmethod
+    @contextlib.contextmanager
+    def timed(cls, op):
+        """Records the time spent in the with block under op, and as a
+        trace span while tracing."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            cls.record(op, end - start)
+            if NavTrace.enabled:
+                NavTrace.add(op, "perf", start, end)
+
+    @classmethod
+    def percentiles(cls, op, points=(50, 95, 99)):
+        """Returns {point: seconds} over the recent samples of op."""
+        with cls.lock:
+            values = sorted(s for s, _ in cls.samples.get(op, ()))
+        if not values:
+            return {}
+        last = len(values) - 1
+        return {p: values[round(last * p / 100)] for p in points}
+
+    @classmethod
+    def throughput(cls, op):
+        """Returns amount per second over the recent samples of op."""
+        with cls.lock:
+            samples = list(cls.samples.get(op, ()))
+        elapsed = sum(s for s, _ in samples)
+        return sum(a for _, a in samples) / elapsed if elapsed else 0
+
+    @classmethod
+    def count(cls, op, above=0):
+        """Returns the no. of recent samples of op longer than above."""
+        with cls.lock:
+            return sum(1 for s, _ in cls.samples.get(op, ()) if s > above)
+
+    @classmethod
+    def register_queue(cls, name, depth):
+        """Registers a callable reporting pending work of a queue."""
+        cls.queues[name] = depth
+
+    @classmethod
+    def queue_depths(cls):
+        depths = {}
+        for name, depth in list(cls.queues.items()):
+            try:
+                depths[name] = depth()
+            except Exception:
+                depths[name] = "?"
+        return depths
+
+    @classmethod
+    def memory(cls):
+        """Returns the resident set size in bytes from statm, which unlike
+        smaps costs the same regardless of the process size."""
+        try:
+            with open("/proc/self/statm") as fh:
+                return int(fh.read().split()[1]) * cls.page_size
+        except OSError:
+            # Peak instead of current but available everywhere
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    @classmethod
+    def cpu_percent(cls):
+        """Returns cpu usage since the previous call."""
+        ru = resource.getrusage(resource.RUSAGE_SELF)
+        now = (time.monotonic(), ru.ru_utime + ru.ru_stime)
+        last, cls.last_cpu = cls.last_cpu, now
+        if last is None or now[0] == last[0]:
+            return 0.0
+        return round((now[1] - last[1]) / (now[0] - last[0]) * 100, 1)
+
+    @staticmethod
+    def smaps():
+        """Returns the detailed memory breakdown. Reading smaps walks every
+        mapping of the process so this is only done on demand."""
+        fields = {}
+        try:
+            with open("/proc/self/smaps_rollup") as fh:
+                for line in fh:
+                    key, _, value = line.partition(":")
+                    if value.strip().endswith("kB"):
+                        fields[key] = int(value.split()[0]) * 1024
+        except OSError as e:
+            return {"Error": str(e)}
+        uss = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+        info = {"USS": humansize(uss)}
+        for key in ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Swap"):
+            if key in fields:
+                info[key] = humansize(fields[key])
+        return info
+
+    @classmethod
+    def diagnostics(cls):
+        """Returns latency percentiles for the diagnostics dialog."""
+        with cls.lock:
+            ops = sorted(cls.samples)
+        stats = {}
+        for op in ops:
+            pct = cls.percentiles(op)
+            stats[op] = " ".join(f"p{p} {s * 1000:.1f}ms"
+                                 for p, s in pct.items())
+        return stats
+
+
+class NavStallDetector:
+    """Finds blocking calls on the GUI thread. A timer on the GUI thread
+    beats every interval and a watchdog thread captures the stack of the
+    GUI thread when a beat is late by more than the threshold. Stalls
+    are aggregated by the innermost frame of our code."""
+    interval = 0.05  # seconds between heartbeats
+    threshold = 0.15  # seconds late before the stack is captured
+    timer = None
+    last_beat = 0
+    captured = None  # stack of the current stall, set by the watchdog
+    sites = {}  # call site -> [stalls, seconds, longest]
+    unsampled = 0  # stalls which ended before the watchdog looked
+    lock = threading.Lock()
+
+    @classmethod
+    def start(cls, threshold_ms):
+        """Starts watching, unless threshold_ms is 0."""
+        if not threshold_ms or cls.timer is not None:
+            return
+        cls.threshold = threshold_ms / 1000
+        cls.main = threading.main_thread().ident
+        cls.last_beat = time.perf_counter()
+        cls.timer = QtCore.QTimer()
+        cls.timer.setTimerType(QtCore.Qt.PreciseTimer)
+        cls.timer.timeout.connect(cls.beat)
+        cls.timer.start(int(cls.interval * 1000))
+        threading.Thread(target=cls.watch, name="stall detector",
+                         daemon=True).start()
+
+    @classmethod
+    def beat(cls):
+        """Runs on the GUI thread, recording the stall it was late for."""
+        now = time.perf_counter()
+        late = now - cls.last_beat - cls.interval
+        cls.last_beat = now
+        stack, cls.captured = cls.captured, None
+        if late <= cls.threshold:
+            return
+        if stack is None:
+            cls.unsampled += 1
+            return
+        cls.record(stack, late, now)
+
+    @classmethod
+    def watch(cls):
+        while True:
+            time.sleep(cls.interval)
+            late = time.perf_counter() - cls.last_beat - cls.interval
+            if late > cls.threshold and cls.captured is None:
+                frame = sys._current_frames().get(cls.main)
+                if frame is not None:
+                    cls.captured = traceback.StackSummary.extract(
+                        traceback.walk_stack(frame), lookup_lines=False)
+                    del frame
+
+    @staticmethod
+    def call_site(stack):
+        """Returns our innermost frame, and the frame it was blocked in
+        when that is elsewhere."""
+        app_dir = os.path.dirname(__file__)
+        ours = next((f for f in stack if f.filename.startswith(app_dir)),
+                    stack[0])
+        site = f"{ours.name} ({os.path.basename(ours.filename)}:" \
+               f"{ours.lineno})"
+        if ours is not stack[0]:
+            leaf = stack[0]
+            site += f" in {leaf.name} ({os.path.basename(leaf.filename)}:" \
+                    f"{leaf.lineno})"
+        return site
+
+    @classmethod
+    def record(cls, stack, seconds, end):
+        site = cls.call_site(stack)
+        with cls.lock:
+            stats = cls.sites.get(site)
+            if stats is None:
+                stats = cls.sites[site] = [0, 0, 0]
+                logger.warning("GUI thread stalled %.0fms at %s\n%s",
+                               seconds * 1000, site,
+                               "".join(reversed(stack.format())))
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+        NavPerf.record("stall", seconds)
+        if NavTrace.enabled:
+            NavTrace.add("stall", "gui", end - seconds, end, {"site": site})
+
+    @classmethod
+    def diagnostics(cls):
+        """Returns call sites by the time stalled at them."""
+        with cls.lock:
+            sites = sorted(cls.sites.items(), key=lambda s: -s[1][1])
+        stats = {site: f"{n} stalls, {total * 1000:.0f}ms total, "
+                       f"{longest * 1000:.0f}ms longest"
+                 for site, (n, total, longest) in sites[:20]}
+        if cls.unsampled:
+            stats["Not sampled"] = cls.unsampled
+        return stats
+
+
+class NavPerfHud(QtWidgets.QLabel):
+    """Overlay showing frame times, operation latencies, cache hit rates
+    and queue depths. Frame times are measured by a heartbeat timer which
+    only runs while the overlay is shown."""
+    frame = 16  # ms, heartbeat interval
+    stall = 0.1  # seconds, a heartbeat later than this is a GUI stall
+    ops = ("list_dir", "sort", "filter", "thumbnail")
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.setAttribute(QtCore.Qt.WA_TransparentForMouseEvents)
+        self.setStyleSheet("background-color: rgba(0, 0, 0, 160);"
+                           "color: white; font-family: monospace;"
+                           "padding: 4px;")
+        self.heartbeat = QtCore.QTimer(self)
+        self.heartbeat.setTimerType(QtCore.Qt.PreciseTimer)
+        self.heartbeat.timeout.connect(self.beat)
+        self.refresher = QtCore.QTimer(self)
+        self.refresher.timeout.connect(self.refresh)
+        self.last_beat = None
+        self.hide()
+
+    def toggle(self, visible):
+        if visible:
+            self.last_beat = None
+            self.heartbeat.start(self.frame)
+            self.refresher.start(1000)
+            self.refresh()
+            self.show()
+            self.raise_()
+        else:
+            self.heartbeat.stop()
+            self.refresher.stop()
+            self.hide()
+
+    def beat(self):
+        """Records the time between heartbeats as the frame time."""
+        now = time.perf_counter()
+        if self.last_beat is not None:
+            NavPerf.record("frame", now - self.last_beat)
+        self.last_beat = now
+
+    @staticmethod
+    def latency(op):
+        pct = NavPerf.percentiles(op)
+        if not pct:
+            return f"{op:10} -"
+        return f"{op:10} " + " ".join(f"{s * 1000:7.1f}"
+                                      for s in pct.values())
+
+    def refresh(self):
+        """Rebuilds the overlay text."""
+        frames = max(1, len(NavPerf.samples.get("frame", ())))
+        stalls = NavPerf.count("frame", self.stall)
+        lines = [f"{'ms':10} {'p50':>7} {'p95':>7} {'p99':>7}",
+                 self.latency("frame"),
+                 f"stalls     {stalls} ({stalls * 100 / frames:.1f}%)"]
+        lines += [self.latency(op) for op in self.ops]
+        lines.append(f"copy       {humansize(NavPerf.throughput('copy'))}/s")
+        cache = NavDiagnostics.get("Listing cache")
+        lookups = cache.get("Hits", 0) + cache.get("Misses", 0)
+        if lookups:
+            lines.append(f"cache hits {cache['Hits'] * 100 / lookups:.0f}%"
+                         f" of {lookups}")
+        lines.append("queues     " + " ".join(
+            f"{k} {v}" for k, v in NavPerf.queue_depths().items()))
+        lines.append(f"rss        {humansize(NavPerf.memory())} "
+                     f"cpu {NavPerf.cpu_percent()}%")
+        self.setText("\n".join(lines))
+        self.adjustSize()
+        parent = self.parentWidget()
+        self.move(parent.width() - self.width() - 10, 60)
+
+
+NavPerf.register_queue("copies", lambda: Nav.copy_jobs)
+NavDiagnostics.register("Latency", NavPerf.diagnostics)
+NavDiagnostics.register("Memory", NavPerf.smaps)
+NavDiagnostics.register("Stalls", NavStallDetector.diagnostics)
@@ -0,0 +1,190 @@
+import heapq
+import logging
+import os
+import threading
+import time
+from .navdevices import NavDevices
+from watchdog.events import (
+    DirCreatedEvent, DirDeletedEvent, DirModifiedEvent, DirMovedEvent,
+    FileCreatedEvent, FileDeletedEvent, FileModifiedEvent, FileMovedEvent)
+
+logger = logging.getLogger(__name__)
+
+
+class NavPoller:
+    """Watches directories on filesystems without inotify support by
+    comparing snapshots. Directories which changed recently or are
+    visible are polled often, idle ones back off exponentially. Each
+    mount is polled by a thread of its own, so that one which hangs holds
+    up only its own directories."""
+    min_interval = 1.0  # seconds, for recently changed dirs
+    fast_interval = 2.0  # seconds, cap for visible dirs
+    idle_interval = 4.0  # seconds, first interval for background dirs
+    max_interval = 60.0  # seconds, cap for the exponential backoff
+    watches = {}  # loc -> watch details
+    queues = {}  # mount point -> heap of (due, loc)
+    threads = {}  # mount point -> polling thread
+    cond = threading.Condition()
+    polls = failures = 0
+
+    @classmethod
+    def schedule(cls, handler, loc, fast=True):
+        """Starts polling loc, dispatching synthesized events to handler.
+        Returns loc which serves as the watch handle."""
+        now = time.monotonic()
+        mp = NavDevices.mount_point(loc)
+        with cls.cond:
+            cls.watches[loc] = {
+                "handler": handler,
+                "fast": fast,
+                "interval": cls.min_interval,
+                "snapshot": None,
+                "due": now,
+                "mount": mp,
+            }
+            heapq.heappush(cls.queues.setdefault(mp, []), (now, loc))
+            if mp not in cls.threads:
+                cls.threads[mp] = threading.Thread(
+                    target=cls.run, args=(mp,), daemon=True,
+                    name=f"NavPoller {mp}")
+                cls.threads[mp].start()
+            cls.cond.notify_all()
+        logger.debug("Polling started for %s", loc)
+        return loc
+
+    @classmethod
+    def unschedule(cls, loc):
+        """Stops polling loc."""
+        with cls.cond:
+            del cls.watches[loc]
+        logger.debug("Polling stopped for %s", loc)
+
+    @classmethod
+    def set_fast(cls, loc, fast):
+        """Polls loc often while it is visible."""
+        with cls.cond:
+            try:
+                watch = cls.watches[loc]
+            except KeyError:
+                return
+            if watch["fast"] == fast:
+                return
+            watch["fast"] = fast
+            if fast:
+                watch["interval"] = cls.min_interval
+                watch["due"] = time.monotonic()
+                heapq.heappush(cls.queues[watch["mount"]],
+                               (watch["due"], loc))
+                cls.cond.notify_all()
+
+    @classmethod
+    def run(cls, mp):
+        """Polls the due directories of mount mp until none are left.
+        Never runs on the GUI thread."""
+        queue = cls.queues[mp]
+        while True:
+            with cls.cond:
+                while True:
+                    # Skip stale heap entries for rescheduled/removed dirs
+                    while queue and (
+                            queue[0][1] not in cls.watches or
+                            cls.watches[queue[0][1]]["due"] != queue[0][0]):
+                        heapq.heappop(queue)
+                    if not queue:
+                        del cls.threads[mp], cls.queues[mp]
+                        return
+                    timeout = queue[0][0] - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    cls.cond.wait(timeout)
+                due, loc = heapq.heappop(queue)
+                watch = cls.watches[loc]
+            snapshot = cls.snapshot(loc)
+            cls.polls += 1
+            events = []
+            if snapshot is None:
+                cls.failures += 1
+            elif watch["snapshot"] is not None:
+                events = cls.compare(loc, watch["snapshot"], snapshot)
+            with cls.cond:
+                if cls.watches.get(loc) is not watch:
+                    continue  # unscheduled while we were polling
+                if snapshot is not None:
+                    watch["snapshot"] = snapshot
+                if events:
+                    watch["interval"] = cls.min_interval
+                elif watch["fast"]:
+                    watch["interval"] = min(watch["interval"] * 2,
+                                            cls.fast_interval)
+                else:
+                    watch["interval"] = min(
+                        max(watch["interval"], cls.idle_interval) * 2,
+                        cls.max_interval)
+                watch["due"] = time.monotonic() + watch["interval"]
+                heapq.heappush(queue, (watch["due"], loc))
+            for evt in events:
+                try:
+                    watch["handler"].dispatch(evt)
+                except Exception:
+                    logger.error("Error dispatching %s", evt, exc_info=True)
+
+    @staticmethod
+    def snapshot(loc):
+        """Returns {name: (inode, is dir, size, mtime)} for loc, or None
+        if it can't be listed, which keeps the previous snapshot so that
+        a passing error isn't taken for every entry being deleted."""
+        snap = {}
+        try:
+            with os.scandir(loc) as it:
+                for entry in it:
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    snap[entry.name] = (st.st_ino,
+                                        entry.is_dir(follow_symlinks=False),
+                                        st.st_size, st.st_mtime)
+        except OSError as e:
+            logger.debug("Unable to poll %s: %s", loc, e)
+            return None
+        return snap
+
+    @staticmethod
+    def compare(loc, old, new):
+        """Synthesizes watchdog events from two snapshots."""
+        events = []
+        gone = {old[n][0]: n for n in old.keys() - new.keys()}
+        for name in new.keys() - old.keys():
+            ino, is_dir = new[name][:2]
+            path = os.path.join(loc, name)
+            if ino in gone:
+                src = os.path.join(loc, gone.pop(ino))
+                cls = DirMovedEvent if is_dir else FileMovedEvent
+                events.append(cls(src, path))
+            else:
+                cls = DirCreatedEvent if is_dir else FileCreatedEvent
+                events.append(cls(path))
+        for name in gone.values():
+            cls = DirDeletedEvent if old[name][1] else FileDeletedEvent
+            events.append(cls(os.path.join(loc, name)))
+        for name in old.keys() & new.keys():
+            if old[name] != new[name]:
+                is_dir = new[name][1]
+                cls = DirModifiedEvent if is_dir else FileModifiedEvent
+                events.append(cls(os.path.join(loc, name)))
+        return events
+
+    @classmethod
+    def diagnostics(cls):
+        """Returns poll counters for the diagnostics dialog."""
+        with cls.cond:
+            watches = list(cls.watches.values())
+            threads = len(cls.threads)
+        return {
+            "Polled": len(watches),
+            "Visible": sum(1 for w in watches if w["fast"]),
+            "Max interval": max((w["interval"] for w in watches), default=0),
+            "Polls": cls.polls,
+            "Failed": cls.failures,
+            "Threads": threads,
+        }
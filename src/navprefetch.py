@@ -0,0 +1,158 @@
+import logging
+import os
+import threading
+import time
+from concurrent import futures
+from PyQt5 import QtCore
+from .core import Nav
+from .diagnostics import NavDiagnostics
+from .navcache import NavDirCache
+
+logger = logging.getLogger(__name__)
+
+
+class NavPrefetchAbort(Exception):
+    """Raised from within a scan to abandon it."""
+
+
+class NavPrefetcher:
+    """Lists the folders likely to be navigated to next while the user is
+    idle, so that navigating usually finds them in NavDirCache: the folder
+    hovered or focused, the parent and the back and forward targets of the
+    tab last used. A thread at the lowest priority lists them one at a
+    time within a share of its time, and abandons a listing as soon as a
+    tab loads or once the folder turns out too large to be worth it.
+    Listings prefetched and not navigated to yet are held within a budget
+    of entries, and none are while the cache is nearly full."""
+    idle_ms = 500  # quiet time before prefetching
+    budget = 0.2  # fraction of time the thread may spend listing
+    max_listing = 20000  # entries past which a folder is abandoned
+    pool = futures.ThreadPoolExecutor(1, thread_name_prefix="NavPrefetch")
+    timer = None
+    tab = None
+    generation = 0  # bumped to abandon prefetching
+    wake = threading.Event()  # cuts the pauses between folders short
+    prefetched = {}  # path -> entries, of listings not navigated to yet
+    listed = useful = aborted = skipped = 0
+    lock = threading.Lock()
+
+    @classmethod
+    def schedule(cls, tab):
+        """Prefetches around tab once idle, abandoning prefetching under
+        way as its candidates may have changed."""
+        if not Nav.conf["prefetch_entries"]:
+            return
+        cls.interrupt()
+        if cls.timer is None:
+            cls.timer = QtCore.QTimer()
+            cls.timer.setSingleShot(True)
+            cls.timer.timeout.connect(cls.start)
+        cls.tab = tab
+        cls.timer.start(cls.idle_ms)
+
+    @classmethod
+    def interrupt(cls):
+        """Abandons prefetching, for real work has arrived."""
+        with cls.lock:
+            cls.generation += 1
+        cls.wake.set()
+
+    @classmethod
+    def used(cls, path):
+        """Counts a navigation to a prefetched folder."""
+        with cls.lock:
+            if cls.prefetched.pop(path, None) is not None:
+                cls.useful += 1
+
+    @staticmethod
+    def candidates(tab):
+        """Returns the folders likely next from tab, likeliest first."""
+        found = [tab.hovered, tab.folder_at(tab.view.currentIndex()),
+                 os.path.dirname(tab.location)]
+        if tab.history:
+            found.append(tab.history[-1])
+        if tab.future:
+            found.append(tab.future[-1])
+        # ; separates the locations of searches and trash
+        return [p for i, p in enumerate(found) if p and ";" not in p and
+                p != tab.location and p not in found[:i]]
+
+    @classmethod
+    def start(cls):
+        try:
+            paths = cls.candidates(cls.tab)
+        except (RuntimeError, AttributeError):  # gone or not built yet
+            return
+        paths = [p for p in paths if NavDirCache.peek(p) is None]
+        if paths:
+            cls.wake.clear()
+            cls.pool.submit(cls.run, paths, cls.generation)
+
+    @classmethod
+    def within_budget(cls):
+        """Whether more may be prefetched, forgetting listings the cache
+        dropped meanwhile."""
+        with cls.lock:
+            for path in [p for p in cls.prefetched
+                         if NavDirCache.peek(p) is None]:
+                del cls.prefetched[path]
+            held = sum(cls.prefetched.values())
+        return held < Nav.conf["prefetch_entries"] and \
+            NavDirCache.entries < NavDirCache.max_entries * 3 // 4
+
+    @staticmethod
+    def lower_priority():
+        """Drops this thread to the lowest CPU priority, which the I/O
+        schedulers of Linux derive its I/O priority from."""
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except (AttributeError, OSError):  # no per thread priorities
+            pass
+
+    @classmethod
+    def run(cls, paths, generation):
+        """Lists paths until interrupted. Runs in the pool."""
+        cls.lower_priority()
+        for path in paths:
+            if cls.generation != generation:
+                return
+            if not cls.within_budget():
+                cls.skipped += len(paths) - paths.index(path)
+                return
+            scanned = 0
+
+            def progress(batch):
+                nonlocal scanned
+                scanned += len(batch)
+                if cls.generation != generation or \
+                        scanned > cls.max_listing:
+                    raise NavPrefetchAbort
+
+            start = time.perf_counter()
+            try:
+                listing = NavDirCache.get(path, progress=progress)
+            except NavPrefetchAbort:
+                cls.aborted += 1
+                continue
+            except OSError as e:
+                logger.debug("Unable to prefetch %s: %s", path, e)
+                continue
+            with cls.lock:
+                cls.prefetched[path] = len(listing)
+                cls.listed += 1
+            elapsed = time.perf_counter() - start
+            cls.wake.wait(elapsed / cls.budget - elapsed)
+
+    @classmethod
+    def diagnostics(cls):
+        """Returns prefetch counters for the diagnostics dialog."""
+        return {
+            "Listed": cls.listed,
+            "Navigated to": cls.useful,
+            "Abandoned": cls.aborted,
+            "Over budget": cls.skipped,
+            "Held": len(cls.prefetched),
+        }
+
+
+NavDiagnostics.register("Prefetch", NavPrefetcher.diagnostics)
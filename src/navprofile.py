@@ -0,0 +1,137 @@
+import collections
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from .diagnostics import NavDiagnostics
+from .helper import log_file
+
+logger = logging.getLogger(__name__)
+
+
+class NavProfiler:
+    """Sampling profiler for reproducing stutters where no external
+    profiler can be attached. A background thread samples the stacks of
+    all threads with sys._current_frames(). Walking the stacks holds the
+    GIL, so the sampler sleeps long enough for that to stay within
+    budget of the time of one core whatever the number of threads."""
+    interval = 0.005  # seconds between samples at the least
+    budget = 0.02  # fraction of time the sampler may hold the GIL
+    depth = 128  # frames kept of a stack, from the innermost
+    thread = None
+    stopping = threading.Event()
+    last = {}  # statistics of the last run
+
+    @classmethod
+    def running(cls):
+        return cls.thread is not None and cls.thread.is_alive()
+
+    @classmethod
+    def start(cls, seconds, done=None):
+        """Samples for seconds in the background, then writes the output
+        next to the log and calls done with the paths written."""
+        if cls.running():
+            return False
+        cls.stopping.clear()
+        cls.thread = threading.Thread(target=cls.run, args=(seconds, done),
+                                      name="profiler", daemon=True)
+        cls.thread.start()
+        return True
+
+    @classmethod
+    def stop(cls):
+        """Ends sampling early, output is still written."""
+        cls.stopping.set()
+
+    @classmethod
+    def run(cls, seconds, done):
+        stacks = collections.Counter()  # (thread, frames) -> samples
+        names = {}  # thread id -> name
+        own = threading.get_ident()
+        taken = busy = 0
+        start = time.perf_counter()
+        end = start + seconds
+        now = start
+        while now < end and not cls.stopping.is_set():
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < cls.depth:
+                    code = frame.f_code
+                    stack.append((code.co_name, code.co_filename,
+                                  code.co_firstlineno))
+                    frame = frame.f_back
+                stack.reverse()
+                stacks[(names.get(ident, str(ident)), tuple(stack))] += 1
+            taken += 1
+            cost = time.perf_counter() - now
+            busy += cost
+            cls.stopping.wait(max(cls.interval, cost / cls.budget - cost))
+            now = time.perf_counter()
+        elapsed = now - start
+        cls.last = {"Samples": taken, "Seconds": round(elapsed, 2),
+                    "Overhead": f"{busy * 100 / max(elapsed, 1e-9):.2f}%"}
+        paths = []
+        try:
+            paths = cls.write(stacks, elapsed / max(taken, 1))
+        except OSError as e:
+            logger.error("Error writing profile: %s", e)
+        logger.info("Profiled %s samples in %.1fs, overhead %s: %s", taken,
+                    elapsed, cls.last["Overhead"], paths)
+        if done:
+            done(paths)
+
+    @classmethod
+    def write(cls, stacks, period):
+        """Writes collapsed stacks and a speedscope profile, returning the
+        paths."""
+        base = os.path.join(os.path.dirname(log_file),
+                            time.strftime("navgator-profile-%Y%m%d-%H%M%S"))
+        with open(f"{base}.collapsed", "w") as fh:
+            for (thread, stack), count in stacks.most_common():
+                frames = ";".join(f"{name} ({os.path.basename(file)}:{line})"
+                                  for name, file, line in stack)
+                fh.write(f"{thread};{frames} {count}\n")
+        with open(f"{base}.speedscope.json", "w") as fh:
+            json.dump(cls.speedscope(stacks, period), fh)
+        return [f"{base}.collapsed", f"{base}.speedscope.json"]
+
+    @staticmethod
+    def speedscope(stacks, period):
+        """Returns the samples as a speedscope file, a profile per
+        thread weighted in milliseconds."""
+        frames, index = [], {}
+        threads = collections.defaultdict(list)
+        for (thread, stack), count in stacks.items():
+            sample = []
+            for frame in stack:
+                if frame not in index:
+                    index[frame] = len(frames)
+                    name, file, line = frame
+                    frames.append({"name": name, "file": file, "line": line})
+                sample.append(index[frame])
+            threads[thread].append((sample, count * period * 1000))
+        profiles = []
+        for thread, samples in sorted(threads.items()):
+            total = sum(weight for _, weight in samples)
+            profiles.append({
+                "type": "sampled", "name": thread, "unit": "milliseconds",
+                "startValue": 0, "endValue": total,
+                "samples": [sample for sample, _ in samples],
+                "weights": [weight for _, weight in samples]})
+        return {"$schema": "https://www.speedscope.app/file-format-schema"
+                           ".json",
+                "shared": {"frames": frames}, "profiles": profiles,
+                "name": "navgator", "exporter": "navgator"}
+
+    @classmethod
+    def diagnostics(cls):
+        return {"Running": cls.running(), **cls.last}
+
+
+NavDiagnostics.register("Profiler", NavProfiler.diagnostics)
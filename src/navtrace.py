@@ -0,0 +1,149 @@
+import collections
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+from PyQt5 import QtCore
+
+# Spans are stamped with time.perf_counter() which is CLOCK_MONOTONIC on
+# Linux, so spans recorded by the copier process line up with ours.
+
+
+class NavSpan:
+    """Records the with block as a complete trace event."""
+    __slots__ = ("name", "cat", "args", "start")
+
+    def __init__(self, name, cat, args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        NavTrace.add(self.name, self.cat, self.start, time.perf_counter(),
+                     self.args)
+
+
+class NavTrace:
+    """Ring buffer of the spans of the last few seconds, exportable in the
+    Chrome trace event format for chrome://tracing or Perfetto. When not
+    enabled spans cost a function call returning a shared no-op."""
+    enabled = os.environ.get("NAVGATOR_TRACE") == "1"
+    window = 30.0  # seconds of events kept
+    events = collections.deque(maxlen=100000)
+    threads = {}  # (pid, tid) -> thread name
+    processes = {os.getpid(): "navgator"}
+    null = contextlib.nullcontext()
+    lock = threading.Lock()
+
+    @classmethod
+    def span(cls, name, cat="app", **args):
+        """Returns a context manager tracing its block."""
+        if not cls.enabled:
+            return cls.null
+        return NavSpan(name, cat, args)
+
+    @classmethod
+    def add(cls, name, cat, start, end, args=None):
+        """Records a span of the calling thread. Times from perf_counter."""
+        pid, tid = os.getpid(), threading.get_ident()
+        with cls.lock:
+            if (pid, tid) not in cls.threads:
+                cls.threads[(pid, tid)] = threading.current_thread().name
+            cls.events.append((name, cat, start, end - start, pid, tid,
+                               args or None))
+            while cls.events[0][2] + cls.events[0][3] < end - cls.window:
+                cls.events.popleft()
+
+    @classmethod
+    def instant(cls, name, cat="app", **args):
+        """Records a zero length event."""
+        if cls.enabled:
+            now = time.perf_counter()
+            cls.add(name, cat, now, now, args)
+
+    @classmethod
+    def dump(cls, process):
+        """Returns recorded events for merging into another process."""
+        with cls.lock:
+            return {"process": process, "events": list(cls.events),
+                    "threads": [[*k, v] for k, v in cls.threads.items()]}
+
+    @classmethod
+    def merge(cls, dump):
+        """Adds events recorded by a child process."""
+        with cls.lock:
+            for pid, tid, name in dump["threads"]:
+                cls.threads[(pid, tid)] = name
+                cls.processes[pid] = dump["process"]
+            cls.events.extend(tuple(e) for e in dump["events"])
+
+    @classmethod
+    def chrome_events(cls):
+        """Returns the buffer as a list of Chrome trace events."""
+        with cls.lock:
+            events = sorted(cls.events, key=lambda e: e[2])
+            threads = dict(cls.threads)
+            processes = dict(cls.processes)
+        trace = [{"ph": "M", "name": "process_name", "pid": pid,
+                  "args": {"name": name}}
+                 for pid, name in processes.items()]
+        trace += [{"ph": "M", "name": "thread_name", "pid": pid,
+                   "tid": tid, "args": {"name": name}}
+                  for (pid, tid), name in threads.items()]
+        for name, cat, start, dur, pid, tid, args in events:
+            event = {"name": name, "cat": cat, "ph": "X",
+                     "ts": start * 1e6, "dur": dur * 1e6, "pid": pid,
+                     "tid": tid}
+            if not dur:
+                event.update(ph="i", s="t")
+                del event["dur"]
+            if args:
+                event["args"] = args
+            trace.append(event)
+        return trace
+
+    @classmethod
+    def export(cls, path):
+        """Writes the buffer to path as Chrome trace JSON."""
+        with open(path, "w") as fh:
+            json.dump({"traceEvents": cls.chrome_events(),
+                       "displayTimeUnit": "ms"}, fh, default=str)
+
+
+def traced(name=None, cat="app"):
+    """Decorator tracing each call of the function."""
+    def decorator(func):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not NavTrace.enabled:
+                return func(*args, **kwargs)
+            with NavSpan(label, cat, None):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class NavPaintProbe(QtCore.QObject):
+    """Records a span from start until the widget next paints."""
+    def __init__(self, widget, name, start, **args):
+        super().__init__(widget)
+        self.name = name
+        self.start = start
+        self.args = args
+        widget.installEventFilter(self)
+
+    def eventFilter(self, obj, event):
+        if event.type() == QtCore.QEvent.Paint:
+            NavTrace.add(self.name, "gui", self.start, time.perf_counter(),
+                         self.args)
+            obj.removeEventFilter(self)
+            self.deleteLater()
+        return False
@@ -1,13 +1,28 @@
+import json
+import logging
 import os
 import pathlib
-import psutil
+import shutil
+import stat
+import threading
+import time
+import urllib.parse
+from concurrent import futures
 from datetime import datetime
-from .helper import logger
+from PyQt5 import QtCore
+from .navdeleter import NavDeleter
+from .navdevices import NavDevices
+from .pub import Pub
+
+logger = logging.getLogger(__name__)
 
 
 class NavTrash:
     """Trash implementation"""
     HOME = pathlib.Path(os.path.expandvars("$HOME"))
+    uid = os.getuid()
+    trash_dirs = {}  # device -> (trash dir, top dir) resolved once
+    folders = None  # trash folders found on the mounted devices
 
     @classmethod
     def get_path(cls, variable, default):
@@ -64,22 +79,36 @@ class NavTrash:
 
     @classmethod
     def get_mountpoints(cls):
-        return psutil.disk_partitions()
+        return NavDevices.get_mounts()
 
     @classmethod
-    def get_mountpoint_names(cls):
+    def get_trash_folders(cls):
+        """Returns trash folders, probing each mount with a timeout."""
+        if cls.folders is not None:
+            return cls.folders
+        trash = [str(cls.get_xdg_data_home()) + os.sep + "Trash"]
         for mp in cls.get_mountpoints():
-            yield mp.mountpoint
+            if not NavDevices.is_available(mp):
+                continue
+            try:
+                trash += NavDevices.run(cls.find_trash, mp)
+            except (OSError, futures.TimeoutError):
+                logger.warning("Skipping trash on %s", mp)
+        cls.folders = list(dict.fromkeys(trash))
+        return cls.folders
 
     @classmethod
-    def get_trash_folders(cls):
-        trash = [str(cls.get_xdg_data_home()) + os.sep + "Trash"]
-        for mp in cls.get_mountpoint_names():
-            p = pathlib.Path(mp)
-            d = [x for x in p.iterdir() if x.name.startswith(".Trash")
-                 and x.is_dir()]
-            trash += d
-        return trash
+    def find_trash(cls, mp):
+        """Lists the trash folders at the top of a mount."""
+        with os.scandir(mp) as it:
+            return [entry.path for entry in it
+                    if entry.name.startswith(".Trash") and entry.is_dir()]
+
+    @classmethod
+    def mounts_changed(cls, *args):
+        """Forgets trash folders when devices are (un)mounted."""
+        cls.folders = None
+        cls.trash_dirs = {}
 
     @classmethod
     def get_trash_locations(cls, sep=";"):
@@ -88,21 +117,377 @@ class NavTrash:
         return sep.join([f"{d}{os.sep}files" for d in cls.get_trash_folders()])
 
     @classmethod
-    def get_trash(cls):
-        for tf in cls.get_trash_folders():
-            p = pathlib.Path(f"{tf}{os.sep}files")
-            mp = pathlib.Path(f"{tf}{os.sep}").parent
-            for f in p.iterdir():
-                info = f"{tf}{os.sep}info{os.sep}{f.name}.trashinfo"
-                with open(info, "r") as fh:
-                    contents = fh.readlines()
-                    for line in contents:
-                        line = line.strip()
-                        if line.startswith('DeletionDate='):
-                            date = datetime.strptime(
-                                    line, "DeletionDate=%Y-%m-%dT%H:%M:%S")
-                        elif line.startswith('Path='):
-                            path = line[len('Path='):]
-                            if not path.startswith("/"):
-                                path = f"{mp}{os.sep}{path}"
-                logger.debug(f"{f.name} was deleted at {date} from {path}")
+    def get_trash_dir(cls, dev, path):
+        """Resolves (and creates) the trash directory for a device."""
+        if dev in cls.trash_dirs:
+            return cls.trash_dirs[dev]
+        home_trash = cls.get_xdg_data_home() / "Trash"
+        home = home_trash
+        while not home.exists():
+            home = home.parent
+        if os.lstat(home).st_dev == dev:
+            trash, top = str(home_trash), None
+        else:
+            top = NavDevices.mount_point(os.path.realpath(path))
+            shared = os.path.join(top, ".Trash")
+            try:
+                st = os.lstat(shared)
+                if stat.S_ISDIR(st.st_mode) and st.st_mode & stat.S_ISVTX:
+                    trash = os.path.join(shared, str(cls.uid))
+                else:
+                    raise OSError(f"{shared} is not a valid trash")
+            except OSError:
+                trash = os.path.join(top, f".Trash-{cls.uid}")
+        for sub in ("files", "info"):
+            os.makedirs(os.path.join(trash, sub), mode=0o700, exist_ok=True)
+        logger.debug("Trash for device %s is %s", dev, trash)
+        if cls.folders is not None and trash not in cls.folders:
+            cls.folders.append(trash)
+        cls.trash_dirs[dev] = (trash, top)
+        return cls.trash_dirs[dev]
+
+    @classmethod
+    def write_info(cls, trash, top, path, date):
+        """Reserves a unique name in trash by writing its trashinfo."""
+        name = os.path.basename(path)
+        stem, ext = os.path.splitext(name)
+        origin = path if top is None else os.path.relpath(path, top)
+        info = ("[Trash Info]\n"
+                f"Path={urllib.parse.quote(origin)}\n"
+                f"DeletionDate={date}\n").encode()
+        n = 1
+        while True:
+            info_file = os.path.join(trash, "info", f"{name}.trashinfo")
+            if not os.path.lexists(os.path.join(trash, "files", name)):
+                try:
+                    fd = os.open(info_file,
+                                 os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+                    break
+                except FileExistsError:
+                    pass
+            n += 1
+            name = f"{stem}.{n}{ext}"
+        try:
+            os.write(fd, info)
+        finally:
+            os.close(fd)
+        return name, info_file
+
+
+Pub.subscribe("Devices", NavTrash.mounts_changed)
+
+
+class NavTrashSignals(QtCore.QObject):
+    refreshed = QtCore.pyqtSignal(list)
+
+
+class NavTrashIndex:
+    """Cache of parsed trashinfo records keyed by trashinfo mtime. The
+    trash cans are rescanned in the background, announcing the records
+    through signals.refreshed."""
+    records = {}  # trashinfo file -> record
+    lock = threading.RLock()
+    loaded = False
+    pool = futures.ThreadPoolExecutor(1, thread_name_prefix="NavTrash")
+    signals = NavTrashSignals()
+    cache_file = NavTrash.get_xdg_cache_home() / "navgator" / "trash.json"
+
+    @classmethod
+    def get_info_locations(cls, sep=";"):
+        """Returns the info folders whose mtime tells if trash changed."""
+        return sep.join([f"{d}{os.sep}info"
+                         for d in NavTrash.get_trash_folders()])
+
+    @classmethod
+    def top_dir(cls, trash):
+        """Returns the directory relative trashinfo paths start from."""
+        top = os.path.dirname(trash)
+        if os.path.basename(top) == ".Trash":
+            top = os.path.dirname(top)
+        return top
+
+    @classmethod
+    def trashed_path(cls, rec):
+        """Returns the current location of a trashed item."""
+        return os.path.join(rec["trash"], "files", rec["name"])
+
+    @classmethod
+    def load(cls):
+        """Loads the records saved by the previous session."""
+        cls.loaded = True
+        try:
+            with open(cls.cache_file, "r") as fh:
+                cls.records = json.load(fh)
+        except (OSError, ValueError):
+            cls.records = {}
+
+    @classmethod
+    def save(cls):
+        """Saves the records to reuse in the next session."""
+        with cls.lock:
+            records = dict(cls.records)
+        try:
+            os.makedirs(cls.cache_file.parent, exist_ok=True)
+            tmp = f"{cls.cache_file}.tmp"
+            with open(tmp, "w") as fh:
+                json.dump(records, fh)
+            os.replace(tmp, cls.cache_file)
+        except OSError:
+            logger.error("Error saving trash index", exc_info=True)
+
+    @classmethod
+    def parse(cls, info_file, trash, mtime):
+        """Parses a trashinfo file and sizes the item it describes."""
+        name = os.path.basename(info_file)[:-len(".trashinfo")]
+        rec = {"mtime": mtime, "name": name, "trash": trash, "origin": "",
+               "deleted": ""}
+        with open(info_file, "r") as fh:
+            for line in fh:
+                line = line.strip()
+                if line.startswith('DeletionDate='):
+                    rec["deleted"] = line[len('DeletionDate='):].replace(
+                        "T", " ")[:16]
+                elif line.startswith('Path='):
+                    path = urllib.parse.unquote(line[len('Path='):])
+                    if not path.startswith("/"):
+                        path = os.path.join(cls.top_dir(trash), path)
+                    rec["origin"] = path
+        trashed = cls.trashed_path(rec)
+        st = os.lstat(trashed)
+        rec["is_dir"] = stat.S_ISDIR(st.st_mode)
+        rec["size"] = cls.get_size(trashed) if rec["is_dir"] else st.st_size
+        rec["modified"] = time.strftime('%Y-%m-%d %H:%M',
+                                        time.localtime(st.st_mtime))
+        return rec
+
+    @classmethod
+    def get_size(cls, d):
+        """Returns the total size of files under a directory."""
+        total = 0
+        stack = [d]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        else:
+                            total += entry.stat(follow_symlinks=False).st_size
+            except OSError:
+                pass
+        return total
+
+    @classmethod
+    def known(cls):
+        """Returns the records indexed so far, without scanning."""
+        with cls.lock:
+            if not cls.loaded:
+                cls.load()
+            return list(cls.records.values())
+
+    @classmethod
+    def refresh_later(cls):
+        """Refreshes the records in the background."""
+        cls.pool.submit(cls.announce)
+
+    @classmethod
+    def announce(cls):
+        """Refreshes the records and announces them. Runs in the pool."""
+        try:
+            records = cls.refresh()
+        except Exception:
+            logger.error("Error refreshing trash index", exc_info=True)
+            return
+        cls.signals.refreshed.emit(records)
+
+    @classmethod
+    def refresh(cls):
+        """Returns all records, parsing only new or changed trashinfo.
+        The lock is only held to read and apply the records, never while
+        scanning, so that the GUI thread doesn't wait on it."""
+        with cls.lock:
+            if not cls.loaded:
+                cls.load()
+            known = {f: rec["mtime"] for f, rec in cls.records.items()}
+        seen = set()
+        parsed = {}
+        for trash in NavTrash.get_trash_folders():
+            trash = str(trash)
+            try:
+                it = os.scandir(f"{trash}{os.sep}info")
+            except OSError:
+                continue
+            with it:
+                for entry in it:
+                    if not entry.name.endswith(".trashinfo"):
+                        continue
+                    try:
+                        mtime = entry.stat().st_mtime
+                        if known.get(entry.path) != mtime:
+                            parsed[entry.path] = cls.parse(entry.path, trash,
+                                                           mtime)
+                        seen.add(entry.path)
+                    except OSError:
+                        pass
+        with cls.lock:
+            gone = set(cls.records) - seen
+            for info_file in gone:
+                del cls.records[info_file]
+            cls.records.update(parsed)
+            records = list(cls.records.values())
+        if parsed or gone:
+            cls.save()
+        return records
+
+    @classmethod
+    def update(cls, info_file):
+        """Updates a single record, returning None if it is gone."""
+        with cls.lock:
+            if not cls.loaded:
+                cls.load()
+            try:
+                mtime = os.stat(info_file).st_mtime
+                rec = cls.records.get(info_file)
+                if rec is None or rec["mtime"] != mtime:
+                    trash = os.path.dirname(os.path.dirname(info_file))
+                    cls.records[info_file] = cls.parse(info_file, trash,
+                                                       mtime)
+                return cls.records[info_file]
+            except OSError:
+                cls.records.pop(info_file, None)
+                return None
+
+    @classmethod
+    def lookup(cls, trashed):
+        """Returns the trashinfo file and record for a trashed item."""
+        trash = os.path.dirname(os.path.dirname(trashed))
+        info_file = os.path.join(trash, "info",
+                                 f"{os.path.basename(trashed)}.trashinfo")
+        return info_file, cls.update(info_file)
+
+    @classmethod
+    def forget(cls, info_file):
+        """Removes a trashinfo file and its record."""
+        with cls.lock:
+            cls.records.pop(info_file, None)
+        try:
+            os.unlink(info_file)
+        except FileNotFoundError:
+            pass
+
+
+class NavTrasher(NavDeleter):
+    """Moves files to the trash of their own device in the background."""
+    batch = 512  # trashinfo records written before moving the files
+    single_batch = True
+    verbs = ("Trashing", "Trashed")
+
+    def run(self):
+        """Groups files per device and renames them into its trash."""
+        Pub.notify("App", f"{self.pid}: {self.verbs[0]} {len(self.paths)} "
+                   "item(s)")
+        devices = {}
+        for path in self.paths:
+            try:
+                devices.setdefault(os.lstat(path).st_dev, []).append(path)
+            except OSError as e:
+                self.error(path, e)
+        for dev, paths in devices.items():
+            try:
+                trash, top = NavTrash.get_trash_dir(dev, paths[0])
+            except OSError as e:
+                logger.warning("No trash for device %s: %s", dev, e)
+                self.fallback(paths)
+                continue
+            for i in range(0, len(paths), self.batch):
+                self.move(trash, top, paths[i:i + self.batch])
+                self.report()
+        self.report(final=True)
+        logger.info("%s: %s %s files, %s dirs with %s errors", self.pid,
+                    self.verbs[1], self.files, self.dirs, self.errors)
+        self.finished.emit(self.files + self.dirs, self.errors)
+
+    def move(self, trash, top, paths):
+        """Writes the trashinfo records for a batch and then moves it."""
+        date = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+        infos = []
+        for path in paths:
+            try:
+                infos.append((path, *NavTrash.write_info(trash, top, path,
+                                                         date)))
+            except OSError as e:
+                self.error(path, e)
+        for path, name, info_file in infos:
+            try:
+                is_dir = os.path.isdir(path) and not os.path.islink(path)
+                os.rename(path, os.path.join(trash, "files", name))
+            except OSError as e:
+                try:
+                    os.unlink(info_file)
+                except OSError as err:
+                    logger.warning("Unable to remove %s: %s", info_file, err)
+                self.error(path, e)
+                continue
+            if is_dir:
+                self.dirs += 1
+            else:
+                self.files += 1
+            self.pending.append(path)
+
+    def fallback(self, paths):
+        """Trashes files one by one when the device has no usable trash."""
+        for path in paths:
+            try:
+                from send2trash import send2trash
+                send2trash(path)
+                self.files += 1
+                self.pending.append(path)
+            except OSError as e:
+                self.error(path, e)
+
+
+class NavTrashPurger(NavDeleter):
+    """Permanently deletes trashed items along with their trashinfo."""
+
+    def deleted(self, path):
+        """Drops the trashinfo of a purged item."""
+        NavTrashIndex.forget(NavTrashIndex.lookup(path)[0])
+
+    def run(self):
+        super().run()
+        NavTrashIndex.save()
+
+
+class NavTrashRestorer(NavDeleter):
+    """Moves trashed items back to where they were deleted from."""
+    single_batch = True
+    verbs = ("Restoring", "Restored")
+
+    def run(self):
+        """Restores each item and drops its trashinfo."""
+        Pub.notify("App", f"{self.pid}: {self.verbs[0]} {len(self.paths)} "
+                   "item(s)")
+        for path in self.paths:
+            info_file, rec = NavTrashIndex.lookup(path)
+            try:
+                if rec is None or not rec["origin"]:
+                    raise OSError(f"No trash information for {path}")
+                if os.path.lexists(rec["origin"]):
+                    raise FileExistsError(f"{rec['origin']} already exists")
+                os.makedirs(os.path.dirname(rec["origin"]), exist_ok=True)
+                shutil.move(path, rec["origin"])
+            except OSError as e:
+                self.error(path, e)
+                continue
+            NavTrashIndex.forget(info_file)
+            if rec["is_dir"]:
+                self.dirs += 1
+            else:
+                self.files += 1
+            self.pending.append(path)
+            self.report()
+        NavTrashIndex.save()
+        self.report(final=True)
+        logger.info("%s: %s %s files, %s dirs with %s errors", self.pid,
+                    self.verbs[1], self.files, self.dirs, self.errors)
+        self.finished.emit(self.files + self.dirs, self.errors)
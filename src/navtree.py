@@ -0,0 +1,259 @@
+import bisect
+import logging
+import os
+from concurrent import futures
+from PyQt5 import QtCore, QtWidgets
+from .diagnostics import NavDiagnostics
+from .navcache import NavDirCache
+from .navperf import NavPerf
+from .navwatcher import NavWatcher
+
+logger = logging.getLogger(__name__)
+
+
+class NavTreeNode:
+    """A directory in the shared tree."""
+    __slots__ = ("name", "path", "parent", "children", "fetching")
+
+    def __init__(self, name, path, parent):
+        self.name = name
+        self.path = path
+        self.parent = parent
+        self.children = None  # None until listed
+        self.fetching = False
+
+    def row(self):
+        return self.parent.children.index(self)
+
+
+class NavTreeModel(QtCore.QAbstractItemModel):
+    """Directory tree shared by all NavTree views. Directories are listed
+    in the background on expansion through NavDirCache and kept current
+    by NavWatcher instead of Qt's own file system watchers."""
+    listed = QtCore.pyqtSignal(str, list)
+    changed = QtCore.pyqtSignal(str)
+    revealed = QtCore.pyqtSignal(str)
+    shared = None
+    pool = futures.ThreadPoolExecutor(2, thread_name_prefix="NavTree")
+    folder_icon = None
+
+    @classmethod
+    def instance(cls):
+        """Returns the process wide model."""
+        if cls.shared is None:
+            cls.shared = cls()
+        return cls.shared
+
+    def __init__(self):
+        super().__init__()
+        self.root = NavTreeNode("", "", None)
+        self.root.children = [NavTreeNode(os.sep, os.sep, self.root)]
+        self.nodes = {os.sep: self.root.children[0]}
+        self.revealing = set()  # paths whose ancestors are being listed
+        self.listed.connect(self.apply_listing)
+        self.changed.connect(self.refresh)
+
+    @staticmethod
+    def sort_key(name):
+        return name.lower()
+
+    def node(self, index):
+        return index.internalPointer() if index.isValid() else self.root
+
+    def node_index(self, node):
+        if node is self.root:
+            return QtCore.QModelIndex()
+        return self.createIndex(node.row(), 0, node)
+
+    def index(self, row, column=0, parent=QtCore.QModelIndex()):
+        """Mirrors QFileSystemModel accepting a path instead of a row."""
+        if isinstance(row, str):
+            return self.path_index(row)
+        node = self.node(parent)
+        if node.children is None or not 0 <= row < len(node.children):
+            return QtCore.QModelIndex()
+        return self.createIndex(row, column, node.children[row])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QtCore.QModelIndex()
+        return self.node_index(index.internalPointer().parent)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        node = self.node(parent)
+        return 0 if node.children is None else len(node.children)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 1
+
+    def hasChildren(self, parent=QtCore.QModelIndex()):
+        node = self.node(parent)
+        return node.children is None or bool(node.children)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        if role == QtCore.Qt.DisplayRole:
+            return node.name
+        elif role == QtCore.Qt.DecorationRole:
+            if self.folder_icon is None:
+                self.__class__.folder_icon = QtWidgets.QFileIconProvider(
+                    ).icon(QtWidgets.QFileIconProvider.Folder)
+            return self.folder_icon
+        elif role == QtCore.Qt.ToolTipRole:
+            return node.path
+        return None
+
+    def filePath(self, index):
+        return self.node(index).path
+
+    def canFetchMore(self, parent):
+        node = self.node(parent)
+        return node.children is None and not node.fetching
+
+    def fetchMore(self, parent):
+        """Lists the directory on a background thread."""
+        node = self.node(parent)
+        if node is self.root or node.fetching:
+            return
+        node.fetching = True
+        self.pool.submit(self.fetch, node.path)
+
+    def fetch(self, path, fresh=False):
+        """Lists subdirectories of path. Runs in the pool."""
+        try:
+            names = self.list_dirs(path, fresh)
+        except OSError as e:
+            logger.debug("Unable to list %s: %s", path, e)
+            names = []
+        self.listed.emit(path, names)
+
+    def list_dirs(self, path, fresh=False):
+        """Returns sorted names of the visible subdirectories of path."""
+        return sorted((e.name for e in NavDirCache.get(path, fresh)
+                       if e.is_dir and not e.name.startswith(".")),
+                      key=self.sort_key)
+
+    def apply_listing(self, path, names):
+        """Applies a listing, going on revealing the paths under it."""
+        self.sync_children(path, names)
+        prefix = path.rstrip(os.sep) + os.sep
+        for target in [p for p in self.revealing
+                       if p == path or p.startswith(prefix)]:
+            self.reveal_from_listed(target)
+
+    def sync_children(self, path, names):
+        """Syncs the children of path with a listing, inserting and
+        removing only the rows which differ."""
+        node = self.nodes.get(path)
+        if node is None:
+            return
+        node.fetching = False
+        index = self.node_index(node)
+        if node.children is None:
+            NavWatcher.add_path(path, self.watch_event, pinned=False)
+            if not names:
+                node.children = []
+                # Drop the expansion arrow
+                self.dataChanged.emit(index, index)
+                return
+            self.beginInsertRows(index, 0, len(names) - 1)
+            node.children = [self.new_node(n, node) for n in names]
+            self.endInsertRows()
+            return
+        wanted = set(names)
+        for row in reversed(range(len(node.children))):
+            if node.children[row].name not in wanted:
+                self.beginRemoveRows(index, row, row)
+                self.forget(node.children.pop(row))
+                self.endRemoveRows()
+        present = {c.name for c in node.children}
+        keys = [self.sort_key(c.name) for c in node.children]
+        for name in names:
+            if name in present:
+                continue
+            row = bisect.bisect(keys, self.sort_key(name))
+            self.beginInsertRows(index, row, row)
+            node.children.insert(row, self.new_node(name, node))
+            keys.insert(row, self.sort_key(name))
+            self.endInsertRows()
+
+    def new_node(self, name, parent):
+        node = NavTreeNode(name, os.path.join(parent.path, name), parent)
+        self.nodes[node.path] = node
+        return node
+
+    def forget(self, node):
+        """Drops a removed node and its subtree."""
+        self.nodes.pop(node.path, None)
+        if node.children is not None:
+            NavWatcher.remove_path(node.path, self.watch_event,
+                                   missing_ok=True)
+            for child in node.children:
+                self.forget(child)
+
+    def watch_event(self, evt, loc):
+        """Refreshes a listed directory. Invoked from the watcher thread."""
+        if evt.is_directory and evt.event_type != "modified":
+            self.changed.emit(loc)
+
+    def refresh(self, path, fresh=False):
+        """Relists a directory in the background if already listed."""
+        node = self.nodes.get(path)
+        if node is None or node.children is None or node.fetching:
+            return
+        node.fetching = True
+        self.pool.submit(self.fetch, path, fresh)
+
+    def revalidate(self, index):
+        """Catches up on changes missed while unwatched. Connected to
+        expansion of views since the watch budget may evict tree watches."""
+        self.refresh(self.filePath(index))
+
+    def path_index(self, path):
+        """Returns the index for path, invalid unless its ancestors have
+        been listed, which reveal does."""
+        node = self.nodes.get(path.rstrip(os.sep) or os.sep)
+        if node is None:
+            return QtCore.QModelIndex()
+        return self.node_index(node)
+
+    def reveal(self, path):
+        """Lists the ancestors of path in the background, level by level
+        as their listings arrive, announcing path through revealed once it
+        has an index."""
+        if not path.startswith(os.sep):
+            return
+        self.revealing.add(path)
+        self.reveal_from_listed(path)
+
+    def reveal_from_listed(self, path):
+        """Walks down to path through the listed ancestors, fetching the
+        first which isn't listed yet."""
+        node = self.nodes[os.sep]
+        for part in path.split(os.sep):
+            if not part:
+                continue
+            if node.children is None:
+                self.fetchMore(self.node_index(node))
+                return
+            node = self.nodes.get(os.path.join(node.path, part))
+            if node is None:  # gone or hidden
+                self.revealing.discard(path)
+                return
+        self.revealing.discard(path)
+        self.revealed.emit(path)
+
+    def diagnostics(self):
+        """Returns node counters for the diagnostics dialog."""
+        return {
+            "Nodes": len(self.nodes),
+            "Listed": sum(1 for n in self.nodes.values()
+                          if n.children is not None),
+        }
+
+
+NavDiagnostics.register("Tree", lambda: NavTreeModel.instance().diagnostics())
+NavPerf.register_queue(
+    "tree", lambda: NavTreeModel.pool._work_queue.qsize())
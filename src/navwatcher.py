@@ -1,85 +1,204 @@
+import collections
+import logging
 import os
 import pathlib
+import threading
 # import psutil
-from .helper import logger
+from .core import Nav
+from .diagnostics import NavDiagnostics
+from .navperf import NavPerf
+from .navtrace import NavTrace
+from .navcache import NavDirCache
+from .navdevices import NavDevices
+from .navpoller import NavPoller
 from watchdog.observers import Observer
-# from watchdog.observers.polling import PollingObserver
 from watchdog.events import FileSystemEventHandler
 
+logger = logging.getLogger(__name__)
+
 
 class NavWatcher:
     """Helper class to start/stop watchdog and add/remove paths."""
     running = False
-    monitored = {}
+    monitored = collections.OrderedDict()  # least recently used first
+    lock = threading.RLock()
+    max_user_watches = "/proc/sys/fs/inotify/max_user_watches"
+    budget = None
+    evictions = 0
     event_handler = FileSystemEventHandler()
     observer = Observer()
-    # poller = PollingObserver()
 
     @classmethod
     def on_file_system_event(cls, event):
         """Invokes provided callback on FileSystemEvent."""
         loc = str(pathlib.PurePath(event.src_path).parent)
         # logger.debug(f"Change detected in {loc}")
+        # In place modifications don't touch the directory mtime
+        NavDirCache.invalidate(loc)
+        if getattr(event, "dest_path", None):
+            NavDirCache.invalidate(os.path.dirname(event.dest_path))
         try:
-            for callback in cls.monitored[loc]['callbacks']:
-                callback(event, loc)
+            # No locking here: watchdog dispatches holding its own lock,
+            # which add_path/remove_path need while holding ours.
+            callbacks = list(cls.monitored[loc]['callbacks'])
         except KeyError:
             # KeyError occurs for parent folders. Expected
-            pass
+            return
+        with NavTrace.span("watch event", "watcher",
+                           event=event.event_type, location=loc):
+            for callback in callbacks:
+                callback(event, loc)
 
     @classmethod
-    def add_path(cls, loc, callback, recursive=False):
-        """Adds callbacks and watches for the said location."""
+    def get_budget(cls):
+        """Returns the number of watches we may hold."""
+        if cls.budget is None:
+            budget = Nav.conf["watch_budget"]
+            try:
+                with open(cls.max_user_watches) as fh:
+                    # the limit is shared with every other application
+                    budget = min(budget, int(fh.read()) // 4)
+            except (OSError, ValueError):
+                pass
+            cls.budget = max(budget, 1)
+        return cls.budget
+
+    @classmethod
+    def add_path(cls, loc, callback, recursive=False, pinned=True):
+        """Adds callbacks and watches for the said location. Pinned
+        locations (active tabs) are never evicted to meet the budget."""
+        if not NavDevices.is_available(loc):
+            logger.warning("%s is on an unavailable device.", loc)
+            return
         if not os.path.exists(loc):
-            logger.warning(f"{loc} no longer exists.")
+            logger.warning("%s no longer exists.", loc)
+            return
+        with cls.lock:
+            try:
+                entry = cls.monitored[loc]
+            except KeyError:
+                entry = cls.monitored[loc] = {
+                    "stamp": os.stat(loc).st_mtime,
+                    "callbacks": [],
+                    "pinned": set(),
+                    "recursive": recursive,
+                    "watch": None,
+                }
+            if callback not in entry["callbacks"]:
+                entry["callbacks"].append(callback)
+                logger.debug("Callback %s registered for %s", callback, loc)
+            if pinned:
+                entry["pinned"].add(callback)
+                if entry["watch"] == loc:
+                    NavPoller.set_fast(loc, True)
+            cls.monitored.move_to_end(loc)
+            cls.schedule(loc, entry)
+            cls.enforce_budget()
+        logger.debug("Current watchers: %s", cls.observer._watches)
+
+    @classmethod
+    def unpin(cls, loc, callback):
+        """Keeps watching a location no longer active while the budget
+        allows it."""
+        with cls.lock:
+            try:
+                entry = cls.monitored[loc]
+            except KeyError:
+                return
+            entry["pinned"].discard(callback)
+            if entry["watch"] == loc and not entry["pinned"]:
+                NavPoller.set_fast(loc, False)
+            cls.monitored.move_to_end(loc)
+            cls.enforce_budget()
+
+    @staticmethod
+    def needs_polling(loc):
+        """Checks if loc is on a filesystem inotify can't see changes on."""
+        fstype = NavDevices.fs_type(loc)
+        return fstype in NavDevices.network or fstype.startswith("fuse")
+
+    @classmethod
+    def schedule(cls, loc, entry):
+        """Starts watching a location if it isn't already watched."""
+        if entry["watch"] is not None:
+            return
+        if cls.needs_polling(loc):
+            # Polled watches don't use inotify and aren't budgeted
+            entry["watch"] = NavPoller.schedule(cls.event_handler, loc,
+                                                fast=bool(entry["pinned"]))
             return
         try:
-            if callback not in cls.monitored[loc]['callbacks']:
-                cls.monitored[loc]['callbacks'].append(callback)
-            logger.debug(f"Callback {callback} registered for {loc}")
-        except KeyError:
-            cls.monitored[loc] = {
-                "stamp": os.stat(loc).st_mtime,
-                "callbacks": [callback],
-                "watch": cls.observer.schedule(cls.event_handler, loc,
-                                               recursive=recursive),
-            }
-            # partitions = psutil.disk_partitions()
-            # mp = None
-            # for p in partitions:
-            #     if loc.startswith(p):
-            #         if mp is None or mp in p.mountpoint:
-            #             mp = p.mountpoint
-            #             logger.debug(f"{loc} mounted on {mp}")
-            # try:
-            #     if callback not in cls.monitored[mp]['callbacks']:
-            #         cls.monitored[mp]['callbacks'].append(callback)
-            # except KeyError:
-            #     cls.monitored[mp] = {
-            #         "stamp": os.stat(loc).st_mtime,
-            #         "callbacks": [callback],
-            #         "watch": cls.poller.schedule(cls.event_handler, mp),
-            #     }
-            logger.debug(f"Monitoring started for {loc}")
-        logger.debug(f"Current watchers: {cls.observer._watches}")
+            entry["watch"] = cls.observer.schedule(
+                cls.event_handler, loc, recursive=entry["recursive"])
+            logger.debug("Monitoring started for %s", loc)
+        except OSError as e:
+            # Out of inotify watches. It'll be revalidated on activation
+            logger.warning("Unable to watch %s: %s", loc, e)
 
     @classmethod
-    def remove_path(cls, loc, callback):
-        """Removes callbacks and watches for the said location."""
+    def unschedule(cls, loc, entry):
+        """Stops watching a location while keeping its callbacks."""
         try:
-            cls.monitored[loc]['callbacks'].remove(callback)
-            logger.debug(f"Callback removed from {loc}")
+            if entry["watch"] == loc:
+                NavPoller.unschedule(loc)
+            else:
+                cls.observer.unschedule(entry["watch"])
         except (KeyError, ValueError):
-            logger.warning(f"Error removing callback for {loc}")
-        try:
-            if "callbacks" not in cls.monitored[loc] or \
-                    len(cls.monitored[loc]["callbacks"]) < 1:
-                cls.observer.unschedule(cls.monitored[loc]["watch"])
-                logger.debug(f"Stopped monitoring for {loc} as no callbacks")
+            logger.warning("Error unscheduling watch for %s.", loc)
+        entry["watch"] = None
+
+    @classmethod
+    def enforce_budget(cls):
+        """Evicts least recently used unpinned watches over budget."""
+        watched = sum(1 for loc, e in cls.monitored.items()
+                      if e["watch"] not in (None, loc))
+        if watched <= cls.get_budget():
+            return
+        for loc, entry in cls.monitored.items():
+            if entry["watch"] in (None, loc) or entry["pinned"]:
+                continue
+            cls.unschedule(loc, entry)
+            cls.evictions += 1
+            logger.debug("Evicted watch for %s", loc)
+            watched -= 1
+            if watched <= cls.budget:
+                break
+
+    @classmethod
+    def remove_path(cls, loc, callback, missing_ok=False):
+        """Removes callbacks and watches for the said location."""
+        with cls.lock:
+            try:
+                cls.monitored[loc]['callbacks'].remove(callback)
+                cls.monitored[loc]['pinned'].discard(callback)
+                logger.debug("Callback removed from %s", loc)
+            except (KeyError, ValueError):
+                if not missing_ok:
+                    logger.warning("Error removing callback for %s", loc)
+                return
+            if not cls.monitored[loc]["callbacks"]:
+                if cls.monitored[loc]["watch"] is not None:
+                    cls.unschedule(loc, cls.monitored[loc])
+                logger.debug("Stopped monitoring for %s as no callbacks", loc)
                 del cls.monitored[loc]
-        except (KeyError, ValueError):
-            logger.warning(f"Error unscheduling watch for {loc}.")
-        logger.debug(f"Current watchers: {cls.observer._watches}")
+        logger.debug("Current watchers: %s", cls.observer._watches)
+
+    @classmethod
+    def diagnostics(cls):
+        """Returns watch counters for the diagnostics dialog."""
+        with cls.lock:
+            entries = list(cls.monitored.values())
+        return {
+            "Budget": cls.get_budget(),
+            "Watched": sum(1 for e in entries if e["watch"] and
+                           not isinstance(e["watch"], str)),
+            "Polled": sum(1 for e in entries
+                          if isinstance(e["watch"], str)),
+            "Pinned": sum(1 for e in entries if e["pinned"]),
+            "Unwatched (revalidated on activation)":
+                sum(1 for e in entries if e["watch"] is None),
+            "Evictions": cls.evictions,
+        }
 
     @classmethod
     def start(cls):
@@ -93,13 +212,18 @@ class NavWatcher:
             cls.event_handler.on_thread_stop = cls.on_thread_stop
             cls.observer.daemon = True
             cls.observer.start()
-            # cls.poller.start()
 
     def on_thread_stop(cls):
-        logger.debug(f"Watchdog stopped.")
+        logger.debug("Watchdog stopped.")
 
     @classmethod
     def stop(cls):
         """Unschedules all watchdogs."""
         cls.observer.unschedule_all()
         cls.running = False
+
+
+NavDiagnostics.register("Watcher", NavWatcher.diagnostics)
+NavDiagnostics.register("Poller", NavPoller.diagnostics)
+NavPerf.register_queue("polls", lambda: sum(
+    len(q) for q in list(NavPoller.queues.values())))
@@ -1,21 +1,26 @@
+import logging
 import os
 import pathlib
-import sys
 from PyQt5 import QtWidgets, QtCore
 from .core import Nav
 from .custom import NavTree
-from .helper import logger
+from .navcomplete import NavCompleter
 from .navwatcher import NavWatcher
-from .navtrash import NavTrash
+from .navtrash import NavTrashIndex
+from .navtrace import NavTrace
 from .pub import Pub
 from .tabs import NavTabWidget
 
+logger = logging.getLogger(__name__)
+
 
 class NavPane(QtWidgets.QFrame):
     pane_updated = QtCore.pyqtSignal(QtCore.QObject)
+    changed = QtCore.pyqtSignal(object, str)  # watcher event, location
 
     def __init__(self, pid, pane_info):
         super().__init__()
+        self.changed.connect(self.notify_tabs, QtCore.Qt.QueuedConnection)
         x = self.size().width()
         self.pid = pid
         self.location = str(pathlib.Path.home())
@@ -29,6 +34,8 @@ class NavPane(QtWidgets.QFrame):
         self.tree = NavTree()
         self.tree.clicked[QtCore.QModelIndex].connect(self.tree_navigate)
         self.abar.returnPressed.connect(self.go_to)
+        self.completer = NavCompleter(self.abar)
+        self.completer.activated[str].connect(self.complete_to)
         self.tabbar = NavTabWidget(self)
         self.trash_folders = set()
         # Create button that must be placed in tabs row
@@ -42,13 +49,13 @@ class NavPane(QtWidgets.QFrame):
                 tab_info = pane_info["tabs"][str(i)]
                 self.tabbar.new_tab(tab_info)
         except KeyError:
-            logger.error(f"{self.pid}: Error restoring tabs")
+            logger.error("%s: Error restoring tabs", self.pid)
             self.tabbar.new_tab()
         try:
             # logger.debug(f"Selecting active tab")
             self.tabbar.setCurrentIndex(int(pane_info["tabs"]["active"]))
         except KeyError:
-            logger.error(f"Error Selecting active tab", exc_info=True)
+            logger.error("Error Selecting active tab", exc_info=True)
 
         # line edit for filtering
         self.filter_edit = QtWidgets.QLineEdit()
@@ -69,10 +76,12 @@ class NavPane(QtWidgets.QFrame):
             Pub.subscribe(f"Panes.{self.pid}", self.update_status_bar)
             self.update_gui(self.tabbar.currentWidget().location)
             # start monitoring active tab for refreshing
+            self.watch_tabs()
             self.start_monitoring(self.location)
             NavWatcher.start()
         self.installEventFilter(self)  # this will catch focus events
         self.tabbar.tab_created.connect(lambda: self.install_filters())
+        self.tabbar.tab_closed.connect(self.tab_closed)
 
     def set_visibility(self, visibility):
         """Toggle pane visibility."""
@@ -80,22 +89,46 @@ class NavPane(QtWidgets.QFrame):
             self.location = self.tabbar.currentWidget().location
             self.update_gui(self.location)
             Pub.subscribe(f"Panes.{self.pid}", self.update_status_bar)
+            self.watch_tabs()
             self.start_monitoring(self.location)
             self.tabbar.currentWidget().load_tab()
         else:
-            self.stop_monitoring(self.location)
+            for loc in self.tab_locations() | {self.location}:
+                self.stop_monitoring(loc, hidden=True)
             Pub.unsubscribe(f"Panes.{self.pid}", self.update_status_bar)
 
     def change_detected(self, evt, loc: str):
-        """Informs current tab if its current directory was changed."""
-        # if loc == self.location:
+        """Informs tabs listing the directory which was changed. Runs on
+        the watcher thread, so the change is queued to the GUI thread
+        which owns the models of the tabs."""
         try:
-            self.tabbar.currentWidget().change_detected(evt)
-        except OSError as e:
-            logger.error(e)
-            self.sb.showMessage(e)
-            return
-        self.sb.showMessage(self.tabbar.currentWidget().status_info)
+            self.changed.emit(evt, loc)
+        except RuntimeError:  # the pane is gone
+            pass
+
+    def notify_tabs(self, evt, loc):
+        """Passes a change on to the tabs listing loc."""
+        with NavTrace.span("change_detected", "watcher",
+                           event=evt.event_type, location=loc):
+            current = self.tabbar.currentWidget()
+            for i in range(self.tabbar.count()):
+                tab = self.tabbar.widget(i)
+                # Background tabs which weren't listed yet have nothing to
+                # update
+                if tab is None or tab.view is None or \
+                        tab is not current and (
+                            tab.model.last_read == 0 or
+                            loc not in tab.location.split(";")):
+                    continue
+                try:
+                    tab.change_detected(evt)
+                except OSError as e:
+                    logger.error(e)
+                    if tab is current:
+                        self.sb.showMessage(str(e))
+                        return
+            if current is not None:
+                self.sb.showMessage(current.status_info)
 
     def eventFilter(self, obj, event):
         """Reimplemented to handle active pane."""
@@ -127,7 +160,7 @@ class NavPane(QtWidgets.QFrame):
     def tree_navigate(self, index):
         """Handles tree navigation."""
         loc = self.tree.model.filePath(index)
-        logger.debug(f"{self.pid}: Tree Navigation: {loc}")
+        logger.debug("%s: Tree Navigation: %s", self.pid, loc)
         ret = self.tabbar.currentWidget().navigate(loc)
         self.sb.showMessage(self.tabbar.currentWidget().status_info)
         if ret:
@@ -146,7 +179,7 @@ class NavPane(QtWidgets.QFrame):
                 if actual == "":
                     try:
                         del Nav.conf["aliases"][alias]
-                        logger.debug(f"Alias: {alias} unset")
+                        logger.debug("Alias: %s unset", alias)
                         Pub.notify("App", f"{self.pid}: Alias {alias} unset.",
                                    5000)
                     except KeyError:
@@ -156,7 +189,7 @@ class NavPane(QtWidgets.QFrame):
                         Nav.conf["aliases"][alias] = actual
                     except KeyError:
                         Nav.conf["aliases"] = {alias: actual}
-                    logger.debug(f"Alias: {alias} = {actual}")
+                    logger.debug("Alias: %s = %s", alias, actual)
                     Pub.notify("App", f"{self.pid}: Alias {alias} set to "
                                f"{actual}.", 5000)
                 self.abar.setText(self.location)
@@ -165,34 +198,33 @@ class NavPane(QtWidgets.QFrame):
                 try:
                     loc = Nav.conf["aliases"][loc]
                 except KeyError:
-                    logger.error(f"Alias {loc} not set")
+                    logger.error("Alias %s not set", loc)
                     Pub.notify("App", f"{self.pid}: Alias {loc} not set.")
                     self.abar.setText(self.location)
                     return
-        if loc == "trash":
-            ds = NavTrash.get_trash_locations()
-            ret = self.tabbar.currentWidget().navigate(ds)
+        ret = self.tabbar.currentWidget().navigate(loc)
+        if ret:
+            self.location = loc
         else:
-            ret = self.tabbar.currentWidget().navigate(loc)
-            if ret:
-                self.location = loc
-            else:
-                self.abar.setText(self.location)
+            self.abar.setText(self.location)
         self.sb.showMessage(self.tabbar.currentWidget().status_info)
 
+    def complete_to(self, loc):
+        """Goes to a completion picked in the address bar."""
+        self.abar.setText(loc)
+        self.go_to()
+
     def tab_changed(self):
         """Update GUI elements to reflect the tab change."""
         self.update_gui(self.tabbar.currentWidget().location)
 
     def position_tree(self, loc: str):
-        """Repositions tree based on the currently navigated folder."""
-        index = self.tree.model.index(loc, 0)
-        self.tree.setCurrentIndex(index)
-        self.tree.scrollTo(index)
+        """Repositions tree based on the currently navigated folder, once
+        it's listed in the background."""
+        self.tree.reveal(loc)
 
     def update_gui(self, loc):
         """Updates GUI to sync with navigations."""
-        logger.debug(f"Invoked by {sys._getframe().f_back.f_code.co_name}")
         if loc != self.location:
             try:
                 self.stop_monitoring(self.location)
@@ -202,7 +234,7 @@ class NavPane(QtWidgets.QFrame):
                 self.abar.setText(self.location)
                 self.position_tree(self.location)
             except (FileNotFoundError, NotADirectoryError):
-                logger.error(f"{loc} not found")
+                logger.error("%s not found", loc)
         else:
             self.abar.setText(loc)
         # load tab if not already loaded
@@ -227,22 +259,50 @@ class NavPane(QtWidgets.QFrame):
         """Updates status bar for pane with provided message."""
         self.sb.showMessage(msg)
 
+    def tab_locations(self):
+        """Returns the locations listed by any tab of this pane."""
+        locs = set()
+        for i in range(self.tabbar.count()):
+            locs.add(self.tabbar.widget(i).location)
+        return locs
+
+    def watch_tabs(self):
+        """Watches inactive tabs too, as far as the watch budget allows.
+        Tabs which lose their watch are revalidated on activation."""
+        if not Nav.conf["watch_all_tabs"]:
+            return
+        for loc in self.tab_locations() - {"trash", self.location}:
+            for d in loc.split(";"):
+                NavWatcher.add_path(d, self.change_detected, pinned=False)
+
+    def tab_closed(self, loc):
+        """Releases watches of a closed tab."""
+        if loc not in self.tab_locations() | {self.location}:
+            self.stop_monitoring(loc, hidden=True)
+
     def start_monitoring(self, loc):
         """Start monitoring location(s)"""
         if loc != "trash":
             for d in loc.split(";"):
                 NavWatcher.add_path(d, self.change_detected)
         else:
-            for tf in NavTrash.get_trash_locations(sep=None):
+            for tf in NavTrashIndex.get_info_locations().split(";"):
                 NavWatcher.add_path(tf, self.change_detected)
                 self.trash_folders.add(tf)
 
-    def stop_monitoring(self, loc):
-        """Stop monitoring location(s)"""
+    def stop_monitoring(self, loc, hidden=False):
+        """Stop monitoring location(s). Locations still listed by an
+        inactive tab are kept in the watch budget unless hidden."""
         if loc != "trash":
+            keep = (not hidden and Nav.conf["watch_all_tabs"] and
+                    loc in self.tab_locations())
             for d in loc.split(";"):
-                NavWatcher.remove_path(d, self.change_detected)
+                if keep:
+                    NavWatcher.unpin(d, self.change_detected)
+                else:
+                    NavWatcher.remove_path(d, self.change_detected,
+                                           missing_ok=hidden)
         else:
-            for tf in NavTrash.get_trash_locations(sep=None):
+            for tf in self.trash_folders:
                 NavWatcher.remove_path(tf, self.change_detected)
             self.trash_folders = set()
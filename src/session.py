@@ -0,0 +1,136 @@
+import logging
+import os
+import pickle
+import threading
+from PyQt5 import QtCore
+from .core import Nav, NavStates
+from .model import STATE, THUMBNAIL
+
+logger = logging.getLogger(__name__)
+
+
+class NavSession:
+    """Binary snapshot of the listings shown by visible tabs, letting
+    them paint right away on the next start before revalidating."""
+    version = 2  # bump whenever the snapshot or model row layout changes
+    file = os.path.join(os.path.dirname(Nav.conf_file), "navgator.session")
+    snapshots = {}  # (pane id, location) -> tab snapshot
+    saved = {}  # (pane id, location) -> tab snapshot last written, only
+    # ever replaced as a whole
+    lock = threading.Lock()
+    writing = False  # a snapshot is being written in the background
+
+    @classmethod
+    def enabled(cls):
+        return Nav.conf["session_snapshot"]
+
+    @classmethod
+    def load(cls):
+        """Reads the snapshot written by the previous session."""
+        if not cls.enabled():
+            return
+        try:
+            with open(cls.file, "rb") as fh:
+                data = pickle.load(fh)
+            if data.get("version") != cls.version:
+                logger.debug("Ignoring session snapshot of other version")
+                return
+            cls.snapshots = data["tabs"]
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error("Error reading %s: %s", cls.file, e)
+
+    @classmethod
+    def take(cls, pid, loc):
+        """Hands out a tab snapshot once."""
+        return cls.snapshots.pop((pid, loc), None)
+
+    @classmethod
+    def save(cls, panes, wait=False):
+        """Snapshots the current tab of each visible pane, unless none
+        changed since last saved. The rows are copied here, then ordered
+        and written on a background thread unless waiting. Saves are
+        skipped while one is being written."""
+        if not cls.enabled() or cls.writing and not wait:
+            return
+        saved = cls.saved
+        tabs = {}
+        for p in panes:
+            if not p.isVisible():
+                continue
+            tab = p.tabbar.currentWidget()
+            if tab is None:
+                continue
+            key = (p.pid, tab.location)
+            snap = tab.snapshot(saved.get(key))
+            if snap is not None:
+                tabs[key] = snap
+        if tabs.keys() == saved.keys() and \
+                all(snap is saved[key] for key, snap in tabs.items()):
+            return
+        data = {"version": cls.version, "tabs": tabs}
+        if wait:
+            cls.write(data)
+        else:
+            cls.writing = True
+            threading.Thread(target=cls.write, args=(data,),
+                             daemon=True).start()
+
+    @staticmethod
+    def display_order(files, column, order):
+        """Returns the rows in the order the sort of the listing shows
+        them, folders first as NavSortFilterProxyModel does, or as they
+        are if they can't be compared."""
+        if column < 0:
+            return files
+        descending = order == QtCore.Qt.DescendingOrder
+        folders_first = Nav.conf["sort_folders_first"]
+
+        def key(item):
+            is_dir = bool(item[STATE] & NavStates.IS_DIR) and folders_first
+            return (is_dir == descending, item[column] is not None,
+                    item[column])
+
+        try:
+            return sorted(files, key=key, reverse=descending)
+        except TypeError:
+            return files
+
+    @classmethod
+    def order_rows(cls, snap):
+        """Puts the rows copied for a tab snapshot in display order,
+        dropping thumbnails and selections."""
+        files, column, order = snap.pop("rows")
+        for row in files:
+            row[THUMBNAIL] = None
+            row[STATE] &= ~NavStates.IS_SELECTED
+        snap["files"] = cls.display_order(files, column, order)
+
+    @classmethod
+    def write(cls, data):
+        """Writes the snapshot atomically."""
+        try:
+            cls.write_snapshot(data)
+        finally:
+            cls.writing = False
+
+    @classmethod
+    def write_snapshot(cls, data):
+        try:
+            for snap in data["tabs"].values():
+                if "rows" in snap:
+                    cls.order_rows(snap)
+        except Exception:
+            logger.error("Error taking session snapshot", exc_info=True)
+            return
+        cls.saved = dict(data["tabs"])
+        tmp = f"{cls.file}.tmp"
+        with cls.lock:
+            try:
+                with open(tmp, "wb") as fh:
+                    pickle.dump(data, fh, pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, cls.file)
+                logger.debug("Session snapshot saved to %s", cls.file)
+            except OSError as e:
+                logger.error("Error writing %s: %s", cls.file, e)
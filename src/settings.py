@@ -1,7 +1,9 @@
+import logging
 from PyQt5 import QtWidgets, QtCore
-from .helper import logger
 from .core import Nav
 
+logger = logging.getLogger(__name__)
+
 
 class NavSettings(QtWidgets.QDialog):
     settings_changed = QtCore.pyqtSignal()
@@ -57,7 +59,8 @@ class NavSettings(QtWidgets.QDialog):
         for c in self.stack.children():
             for widget in c.children():
                 if isinstance(widget, QtWidgets.QCheckBox):
-                    logger.debug(f"CB: {widget.text()}-{widget.checkState()}")
+                    logger.debug("CB: %s-%s", widget.text(),
+                                 widget.checkState())
                     if widget.text() == "Sort folder to top":
                         if widget.checkState():
                             Nav.conf["sort_folders_first"] = True
@@ -1,26 +1,39 @@
 import collections
+import errno
+import json
+import logging
 import os
 import pathlib
 import random
-import shutil
-import stat
 import subprocess
 import sys
 import threading
+import time
 from PyQt5 import QtWidgets, QtCore, QtGui
-from send2trash import send2trash
 from .breadcrumbs import NavBreadCrumbsBar
-from .helper import logger, humansize
+from .helper import humansize
 from .pub import Pub
-from .model import NavItemModel, NavSortFilterProxyModel
+from .model import NavItemModel, NavSortFilterProxyModel, STATE
+from .navcomplete import NavFrecency
+from .navdeleter import NavDeleter
+from .navdevices import NavDevices
+from .navperf import NavPerf
+from .navprefetch import NavPrefetcher
+from .navtrace import NavTrace, NavPaintProbe, traced
+from .navtrash import (NavTrasher, NavTrashIndex, NavTrashPurger,
+                       NavTrashRestorer)
 from .custom import (NavHeaderView, NavColumn)
-from .core import Nav, NavView, NavSize
+from .core import Nav, NavView, NavSize, NavStates
+from .session import NavSession
+
+logger = logging.getLogger(__name__)
 
 
 class NavTabWidget(QtWidgets.QTabWidget):
     """Re-implemented to present tab menu"""
     cMenu = None  # common contextMenu across class
     tab_created = QtCore.pyqtSignal()
+    tab_closed = QtCore.pyqtSignal(str)
 
     def __init__(self, parent, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -89,7 +102,7 @@ class NavTabWidget(QtWidgets.QTabWidget):
         if tab < 0:
             return
         self.cMenu.exec_(event.globalPos())
-        logger.debug(f"Mouse is on tab# {self.tabBar().tabAt(event.pos())}")
+        logger.debug("Mouse is on tab# %s", self.tabBar().tabAt(event.pos()))
 
     def get_index(self, depth=3):
         """Gets index for actioning tab."""
@@ -122,7 +135,9 @@ class NavTabWidget(QtWidgets.QTabWidget):
         if widget is not None:
             widget.deleteLater()
         self.removeTab(index)
-        logger.debug(f"Removed tab {index}")
+        logger.debug("Removed tab %s", index)
+        if widget is not None:
+            self.tab_closed.emit(widget.location)
 
     def close_other_tabs(self, index=None):
         """Closes all tabs except this."""
@@ -172,9 +187,6 @@ class NavTab(QtWidgets.QFrame):
         self.mutex = QtCore.QMutex()
         super().__init__()
         self.pid = parent_id
-        self.bcbar = NavBreadCrumbsBar("/")
-        self.bcbar.clicked.connect(self.navigate)
-        self._offset = QtCore.QPoint(30, 30)
         try:
             self.history = collections.deque(tab_info["history"], maxlen=64)
         except (KeyError, TypeError):
@@ -188,6 +200,8 @@ class NavTab(QtWidgets.QFrame):
         except (KeyError, TypeError):
             self.location = str(pathlib.Path.home())
             tab_info["location"] = self.location
+        for d in (*self.history, *self.future, self.location):
+            NavFrecency.add(d)
         try:
             self.caption = tab_info["caption"]
         except (KeyError, TypeError):
@@ -211,52 +225,17 @@ class NavTab(QtWidgets.QFrame):
             "Modified": NavColumn("Modified", 150),
             "Thumbnails": NavColumn("Thumbnails", 128),
             "Path": NavColumn("Path", 200),
-            "Deleted": NavColumn("Deleted", 100)
+            "Deleted": NavColumn("Deleted", 100),
+            "Type": NavColumn("Type", 150),
         }
-        self.model = NavItemModel(self, self.header)
-        self.proxy = NavSortFilterProxyModel(self)
-        self.proxy.setSourceModel(self.model)
-        self.proxy.setFilterKeyColumn(0)
-        self.lv = self.tv = None
-        self.init_table_view()
-        self.init_list_view()
-        self.view = self.tv
-        self.rubberBand = QtWidgets.QRubberBand(
-            QtWidgets.QRubberBand.Rectangle, self.view.viewport())
-
-        # Show columns for tab
+        # Remember columns for tab. Applied once the table is built
         if "columns" in tab_info:
-            idx = 0
+            cols = {col[0]: col for col in tab_info["columns"]}
             for k, v in self.header.items():
-                # logger.debug(f"{k}: {")
-                flag = 0
-                # Check if column should be displayed
-                for col in tab_info["columns"]:
-                    if v.caption == col[0]:
-                        flag = 1
-                        break
-                # Hide column if it isn't Name column
-                if not flag and k != "Name":
-                    self.hv.hideSection(idx)
+                if v.caption in cols:
+                    v.position = cols[v.caption][2]
+                elif k != "Name":
                     v.visible = False
-                # If it is to be displayed at said index, position it=
-                elif col[2] != -1:
-                    vis_ind = self.hv.visualIndex(idx)
-                    self.hv.moveSection(vis_ind, col[2])
-                idx += 1
-            self.columns_moved(0, 0, 0)
-        # Connect to save column movements
-        self.hv.sectionMoved.connect(self.columns_moved)
-        self.hv.visibility_changed.connect(self.columns_visibility_changed)
-        # self.hv.randomize.connect(self.sort_random)
-        self.lyt = QtWidgets.QVBoxLayout()
-        self.lyt.setSpacing(0)
-        self.lyt.setContentsMargins(0, 0, 0, 0)
-        self.lyt.addWidget(self.bcbar)
-        self.lyt.addWidget(self.view)
-        self.setLayout(self.lyt)
-        self.install_filters()
-        self.proxy.dataChanged.connect(self.row_sel)
         try:
             self.vtype = tab_info["view"]
         except KeyError:
@@ -265,8 +244,40 @@ class NavTab(QtWidgets.QFrame):
             self.vsize = tab_info["itsize"]
         except KeyError:
             self.vsize = NavSize.Tiny
+        # Restored tabs are placeholders until activated
+        self.bcbar = self.model = self.proxy = None
+        self.lv = self.tv = self.hv = self.view = self.rubberBand = None
+        self.hovered = None  # folder under the mouse
+        self.lyt = QtWidgets.QVBoxLayout()
+        self.lyt.setSpacing(0)
+        self.lyt.setContentsMargins(0, 0, 0, 0)
+        self.setLayout(self.lyt)
+
+    def materialize(self):
+        """Builds the model and the view in use on first activation."""
+        if self.model is not None:
+            return
+        logger.debug("%s: Materializing tab for %s", self.pid, self.location)
+        self.bcbar = NavBreadCrumbsBar("/")
+        self.bcbar.clicked.connect(self.navigate)
+        self._offset = QtCore.QPoint(30, 30)
+        self.model = NavItemModel(self, self.header)
+        self.proxy = NavSortFilterProxyModel(self)
+        self.proxy.setSourceModel(self.model)
+        self.proxy.setFilterKeyColumn(0)
+        self.lyt.addWidget(self.bcbar)
+        self.proxy.dataChanged.connect(self.row_sel)
+        self.changes = 0  # bumped whenever the rows shown change
+        for signal in (self.proxy.layoutChanged, self.proxy.modelReset,
+                       self.proxy.rowsInserted, self.proxy.rowsRemoved,
+                       self.proxy.dataChanged):
+            signal.connect(self.rows_changed)
+        NavTrashIndex.signals.refreshed.connect(self.trash_refreshed)
         self.switch_view(self.vtype, self.vsize)
 
+    def rows_changed(self, *args):
+        self.changes += 1
+
     def sort_random(self):
         """Sort the list randomly"""
         cursel = self.get_selected_items(False)
@@ -282,7 +293,7 @@ class NavTab(QtWidgets.QFrame):
         if cursel:
             for i in range(self.proxy.rowCount()):
                 index = self.proxy.index(i, 0)
-                name = self.proxy.itemData(index).get(0)
+                name = index.data()
                 if name in cursel:
                     self.view.selectionModel().select(
                         index, QtCore.QItemSelectionModel.Select)
@@ -313,10 +324,27 @@ class NavTab(QtWidgets.QFrame):
         self.tv.SelectionBehavior(1)
         self.tv.SelectionMode(7)
         self.tv.selectionModel().selectionChanged.connect(self.rows_selected)
+        self.tv.selectionModel().currentChanged.connect(
+            lambda: NavPrefetcher.schedule(self))
         self.tv.doubleClicked.connect(self.double_clicked)
+        self.tv.setMouseTracking(True)
+        self.tv.entered.connect(self.item_hovered)
         self.tv.setDragDropMode(
                 QtWidgets.QAbstractItemView.DragDrop &
                 ~QtWidgets.QAbstractItemView.InternalMove)
+        self.rubberBand = QtWidgets.QRubberBand(
+            QtWidgets.QRubberBand.Rectangle, self.tv.viewport())
+        # Show columns for tab
+        for idx, v in enumerate(self.header.values()):
+            if not v.visible:
+                self.hv.hideSection(idx)
+            elif v.position != -1:
+                self.hv.moveSection(self.hv.visualIndex(idx), v.position)
+        self.columns_moved(0, 0, 0)
+        # Connect to save column movements
+        self.hv.sectionMoved.connect(self.columns_moved)
+        self.hv.visibility_changed.connect(self.columns_visibility_changed)
+        # self.hv.randomize.connect(self.sort_random)
 
     def init_list_view(self):
         """Initialize List View."""
@@ -337,36 +365,49 @@ class NavTab(QtWidgets.QFrame):
         self.lv.SelectionBehavior(1)
         self.lv.SelectionMode(7)
         self.lv.selectionModel().selectionChanged.connect(self.rows_selected)
+        self.lv.selectionModel().currentChanged.connect(
+            lambda: NavPrefetcher.schedule(self))
         self.lv.doubleClicked.connect(self.double_clicked)
+        self.lv.setMouseTracking(True)
+        self.lv.entered.connect(self.item_hovered)
+
+    def show_view(self, view):
+        """Swaps the displayed view retaining selections."""
+        if self.view is not None:
+            selections = self.view.selectionModel().selection()
+            self.lyt.removeWidget(self.view)
+            self.view.setGeometry(0, 0, 0, 0)
+        else:
+            selections = None
+        self.view = view
+        self.lyt.addWidget(self.view)
+        self.install_filters()
+        if selections is not None:
+            self.view.selectionModel().select(
+                selections, QtCore.QItemSelectionModel.ClearAndSelect)
 
     def switch_view(self, new_view, size=NavSize.Tiny):
-        """Switch between views"""
+        """Switch between views, building them on first use."""
         self.vtype = new_view
         self.vsize = size
+        if self.model is None:
+            return
         width = self.widths[size]
         height = self.heights[size]
 
         if new_view == NavView.Details:
+            if self.tv is None:
+                self.init_table_view()
             if self.tv is not self.view:
-                selections = self.view.selectionModel().selection()
-                self.lyt.removeWidget(self.view)
-                self.view.setGeometry(0, 0, 0, 0)
-                self.view = self.tv
-                self.lyt.addWidget(self.view)
-                self.view.selectionModel().select(
-                    selections, QtCore.QItemSelectionModel.ClearAndSelect)
+                self.show_view(self.tv)
             self.columns_visibility_changed(list(self.header.keys()).index(
                                             "Thumbnails"), "Thumbnails",
                                             self.header["Thumbnails"].visible)
             return
-        elif self.lv is not self.view:
-            selections = self.view.selectionModel().selection()
-            self.lyt.removeWidget(self.view)
-            self.view.setGeometry(0, 0, 0, 0)
-            self.view = self.lv
-            self.lyt.addWidget(self.view)
-            self.view.selectionModel().select(
-                selections, QtCore.QItemSelectionModel.ClearAndSelect)
+        if self.lv is None:
+            self.init_list_view()
+        if self.lv is not self.view:
+            self.show_view(self.lv)
         if new_view == NavView.List:
             self.view.setViewMode(QtWidgets.QListView.ListMode)
             self.lv.verticalScrollBar().setSingleStep(height)
@@ -380,6 +421,22 @@ class NavTab(QtWidgets.QFrame):
             self.lv.setGridSize(QtCore.QSize(width+10, height+20))
             self.lv.verticalScrollBar().setSingleStep(height)
 
+    def folder_at(self, index):
+        """Returns the folder at an index of the view, or None."""
+        if not index.isValid():
+            return None
+        row = self.proxy.mapToSource(index).row()
+        if self.model.files[row][STATE] & NavStates.IS_DIR:
+            return self.model.get_full_name(row)
+        return None
+
+    def item_hovered(self, index):
+        """Prefetches the folder under the mouse once it rests."""
+        folder = self.folder_at(index)
+        if folder != self.hovered:
+            self.hovered = folder
+            NavPrefetcher.schedule(self)
+
     def install_filters(self):
         """Install event filter in all children of the panel."""
         for widget in self.findChildren(QtWidgets.QWidget):
@@ -398,8 +455,11 @@ class NavTab(QtWidgets.QFrame):
     def set_filter(self, filter_text):
         """Apply the filter provided in filter box."""
         self.filter_text = filter_text
+        if self.proxy is None:
+            return
         self.proxy.setFilterCaseSensitivity(False)
-        self.proxy.setFilterRegExp(filter_text)
+        with NavPerf.timed("filter"):
+            self.proxy.setFilterRegExp(filter_text)
         for i in range(self.proxy.rowCount()):
             index = self.proxy.index(i, 0)
             if index not in self.view.selectionModel().selectedIndexes():
@@ -467,7 +527,7 @@ class NavTab(QtWidgets.QFrame):
     def double_clicked(self, index):
         """Get details to open the double clicked item."""
         if index == self.view.currentIndex():
-            item = self.proxy.itemData(index).get(0)
+            item = index.data()
         else:
             item = None
         if item:
@@ -490,11 +550,13 @@ class NavTab(QtWidgets.QFrame):
 
     def navigate(self, d):
         """Navigates to the provided location."""
-        logger.debug(f"Invoked by {sys._getframe().f_back.f_code.co_name}")
-        logger.debug(f"Navigating to {d}")
+        logger.debug("Navigating to %s", d)
         if d != self.location:
+            if NavTrace.enabled and self.view is not None:
+                NavPaintProbe(self.view.viewport(), "navigate to paint",
+                              time.perf_counter(), location=d)
             if Nav.conf["history_without_dupes"] and d in self.history:
-                logger.debug(f"Removing {d} from history")
+                logger.debug("Removing %s from history", d)
                 self.history.remove(d)
             self.history.append(self.location)
             # if "Trash" in d:
@@ -508,7 +570,9 @@ class NavTab(QtWidgets.QFrame):
             #     self.header["Path"].visible = True
             # self.model.update_header(header)
             # self.hv.update_headers()
-            self.load_tab(d)
+            with NavTrace.span("navigate", "tab", location=d):
+                self.load_tab(d)
+            NavFrecency.visit(d)
             self.location_changed.emit(self.location)
             self.future.clear()
             return d
@@ -530,9 +594,10 @@ class NavTab(QtWidgets.QFrame):
                     self.future.remove(self.location)
                 self.future.append(self.location)
                 self.load_tab(d)
+                NavFrecency.visit(d)
                 # logger.debug(f"Future: {self.future}")
         except IndexError:
-            logger.error(f"No more back")
+            logger.error("No more back")
 
     def go_forward(self):
         """Go forward in future."""
@@ -543,9 +608,10 @@ class NavTab(QtWidgets.QFrame):
                     self.history.remove(self.location)
                 self.history.append(self.location)
                 self.load_tab(d)
+                NavFrecency.visit(d)
                 # logger.debug(f"History: {self.history}")
         except IndexError:
-            logger.error(f"No more forward")
+            logger.error("No more forward")
 
     def latest_history(self):
         return self.history[0]
@@ -555,7 +621,7 @@ class NavTab(QtWidgets.QFrame):
         self.view.selectionModel().select(a, QtCore.QItemSelectionModel.Toggle)
 
     def model_changed(self, a, b):
-        logger.debug(f"called {a} {b}")
+        logger.debug("called %s %s", a, b)
 
     def rows_selected(self, sel, desel):
         """Handle row (de)selections."""
@@ -563,20 +629,22 @@ class NavTab(QtWidgets.QFrame):
             self.proxy.setData(index, QtCore.Qt.Checked,
                                QtCore.Qt.CheckStateRole)
         for index in desel.indexes():
-            if not self.proxy.itemData(index):
+            # Rows removed since
+            if not index.isValid() or index.row() >= self.proxy.rowCount():
                 continue
             self.proxy.setData(index, QtCore.Qt.Unchecked,
                                QtCore.Qt.CheckStateRole)
 
         selinfo = self.get_selection_info()
-        if selinfo:
+        if self.hv is None:  # table view wasn't built yet
+            state = None
+        elif selinfo:
             selstat = len(self.view.selectionModel().selectedIndexes())
-            if (selstat >= self.proxy.rowCount()):
-                self.hv.updateCheckState(1)
-            else:
-                self.hv.updateCheckState(2)
+            state = 1 if selstat >= self.proxy.rowCount() else 2
         else:
-            self.hv.updateCheckState(0)
+            state = 0
+        if state is not None:
+            self.hv.updateCheckState(state)
         Pub.notify(f"Panes.{self.pid}.Tabs", f"{self.status_info} {selinfo}")
 
     def updateModel(self, index, state):
@@ -599,17 +667,21 @@ class NavTab(QtWidgets.QFrame):
 
     def invert_selection(self):
         """Toggles (de)selection of items in current listing."""
-        for i in range(self.proxy.rowCount()):
-            ix = self.proxy.index(i, 0)
-            self.view.selectionModel().select(
-                ix, QtCore.QItemSelectionModel.Toggle)
+        rows = self.proxy.rowCount()
+        if not rows:
+            return
+        # One selection change for all rows, not one per row
+        sel = QtCore.QItemSelection(self.proxy.index(0, 0),
+                                    self.proxy.index(rows - 1, 0))
+        self.view.selectionModel().select(sel,
+                                          QtCore.QItemSelectionModel.Toggle)
 
     def keyPressEvent(self, event):
         """Reimplemented keyPressEvent for custom handling."""
         key = event.key()
         if key == QtCore.Qt.Key_Return:
             index = self.view.currentIndex()
-            item = self.proxy.itemData(index).get(0)
+            item = index.data()
             if self.view.state() != QtWidgets.QAbstractItemView.EditingState:
                 loc = os.path.join(self.location, item)
                 self.opener(loc)
@@ -624,27 +696,25 @@ class NavTab(QtWidgets.QFrame):
             super().keyPressEvent(event)
             event.ignore()
 
+    @traced("NavTab.load_tab", "tab")
     def load_tab(self, loc=None, forced=False):
         """Loads a tab if not already loaded or is stale."""
-        logger.debug(f"Invoked by {sys._getframe().f_back.f_code.co_name}")
-        logger.debug(f"Navigating to {loc} and current is {self.location}")
+        logger.debug("Navigating to %s and current is %s", loc, self.location)
         if loc is None:
             loc = self.location
+        NavPrefetcher.interrupt()
+        self.materialize()
         if not forced:
             self.filter_text = ""
         cursel = self.get_selected_items(False)
-        if self.model.load_tab(loc, forced):
+        restored = not forced and self.restore_snapshot(loc)
+        if restored or self.model.load_tab(loc, forced):
             self.view.clearSelection()
-            try:
-                free_disk = humansize(shutil.disk_usage(loc)[2])
-            except OSError:
-                free_disk = ""
-            self.status_info = f"Files: {self.model.fcount}, Dirs: " \
-                f"{self.model.dcount} Total: {humansize(self.model.total)} " \
-                f"Free: {free_disk}"
+            self.status_info = self.get_status_info(loc)
             if self.vtype == NavView.Details:
                 if self.sort_order == -1:
-                    self.sort_random()
+                    if not restored:  # keep the shuffled order shown before
+                        self.sort_random()
                 else:
                     self.tv.sortByColumn(self.sort_column, self.sort_order)
             if self.location != os.path.abspath(loc):
@@ -660,35 +730,117 @@ class NavTab(QtWidgets.QFrame):
                 self.select_items(cursel)
             Pub.notify(f"Panes.{self.pid}.Tabs", f"{self.status_info}"
                        f"{self.get_selection_info()}")
+            NavPrefetcher.used(self.location)
+            self.hovered = None
+            NavPrefetcher.schedule(self)
+
+    def snapshot(self, last=None):
+        """Returns the listing as shown for the session snapshot, or None
+        if there is nothing worth saving. last, the snapshot of the tab
+        previously saved, is returned as is when nothing changed since and
+        its rows are reused when only the view did. Otherwise the rows are
+        copied as they are along with the sorting, for NavSession.write to
+        put them in display order off the GUI thread."""
+        if self.model is None or self.location == "trash" or \
+                self.model.location != self.location:
+            return None
+        current = self.view.currentIndex()
+        snap = {
+            "changes": self.changes,
+            "counts": (self.model.fcount, self.model.dcount,
+                       self.model.total),
+            "last_read": self.model.last_read,
+            "scroll": self.view.verticalScrollBar().value(),
+            "current": current.data() if current.isValid() else None,
+        }
+        if last is not None and last["changes"] == self.changes:
+            if all(last[k] == v for k, v in snap.items()):
+                return last
+            snap["files"] = last["files"]
+            return snap
+        # Rows change in place, so they're copied while the GUI thread is
+        # the only one touching them
+        snap["rows"] = (list(map(list, self.model.files)),
+                        self.proxy.sortColumn(), self.proxy.sortOrder())
+        return snap
+
+    def restore_snapshot(self, loc):
+        """Paints the listing saved by the previous session on the first
+        load of the tab, revalidating it once shown."""
+        if self.model.location is not None:
+            return False
+        snap = NavSession.take(self.pid, loc)
+        if snap is None:
+            return False
+        logger.debug("%s: Restoring %s from session snapshot", self.pid, loc)
+        self.model.restore(loc, snap)
+        QtCore.QTimer.singleShot(0, lambda: self.restore_view(snap))
+        return True
+
+    def restore_view(self, snap):
+        """Restores the scroll position and then catches up with changes
+        made while the application was not running."""
+        if snap["current"] is not None:
+            matches = self.proxy.match(self.proxy.index(0, 0),
+                                       QtCore.Qt.DisplayRole,
+                                       snap["current"], 1,
+                                       QtCore.Qt.MatchExactly)
+            if matches:
+                self.view.selectionModel().setCurrentIndex(
+                    matches[0], QtCore.QItemSelectionModel.NoUpdate)
+        self.view.verticalScrollBar().setValue(snap["scroll"])
+        self.revalidate()
+
+    def revalidate(self):
+        """Applies changes to the listing made since it was last read."""
+        if self.model.location != self.location or not \
+                self.model.is_changed(self.location, self.model.last_read):
+            return
+        self.model.sync_listing()
+        self.status_info = self.get_status_info(self.location)
+        Pub.notify(f"Panes.{self.pid}.Tabs", f"{self.status_info}"
+                   f"{self.get_selection_info()}")
+
+    def trash_refreshed(self, records):
+        """Updates the trash listing once the trash index is refreshed."""
+        if self.location != "trash" or self.model.location != "trash":
+            return
+        self.model.sync_trash(records)
+        self.status_info = self.get_status_info(self.location)
+        Pub.notify(f"Panes.{self.pid}.Tabs", f"{self.status_info}"
+                   f"{self.get_selection_info()}")
 
     def change_detected(self, evt):
         """Invokes appropriate methods to add/update/remove listed files."""
         # logger.debug(f"Invoked by {sys._getframe().f_back.f_code.co_name}")
         # name = os.path.basename(evt.src_path)
-        logger.debug(f"{evt.src_path} {evt.event_type}")
-        if evt.event_type == "deleted":
+        logger.debug("%s %s", evt.src_path, evt.event_type)
+        if self.location == "trash":
+            self.model.update_trash(evt.src_path)
+            if evt.event_type == "moved":
+                self.model.update_trash(evt.dest_path)
+        elif evt.event_type == "deleted":
             self.model.remove_row(evt.src_path)
         elif evt.event_type == "created":
-            logger.debug(f"{evt.src_path} created in {self.location}")
+            logger.debug("%s created in %s", evt.src_path, self.location)
             self.model.insert_row(evt.src_path)
         elif evt.event_type == "moved":
-            logger.debug(f"{self.location}: Moved {evt.src_path} to "
-                         f"{evt.dest_path}")
+            logger.debug("%s: Moved %s to %s", self.location, evt.src_path,
+                         evt.dest_path)
             # new_name = os.path.basename(evt.dest_path)
             self.model.rename_row(evt.src_path, evt.dest_path)
         elif evt.event_type == "modified":
-            logger.debug(f"{self.location}: {evt.src_path} Modified")
+            logger.debug("%s: %s Modified", self.location, evt.src_path)
             self.model.update_row(evt.src_path)
-        try:
-            loc = self.location.split(';')[0]
-            self.status_info = (
-                f"Files: {self.model.fcount}, Dirs: "
-                f"{self.model.dcount} Total: {humansize(self.model.total)} "
-                f"Free: {humansize(shutil.disk_usage(loc)[2])} "
-                f"{self.get_selection_info()}")
-        except Exception as e:
-            logger.error(e)
-            self.status_info = ""
+        self.status_info = (f"{self.get_status_info(self.location)} "
+                            f"{self.get_selection_info()}")
+
+    def get_status_info(self, loc):
+        """Get status text information for the listing."""
+        free = NavDevices.free_space(loc.split(';')[0])
+        free_disk = "" if free is None else humansize(free)
+        return (f"Files: {self.model.fcount}, Dirs: {self.model.dcount} "
+                f"Total: {humansize(self.model.total)} Free: {free_disk}")
 
     def sortIndicatorChanged(self, logicalIndex, sortOrder):
         """Remembers the sorted column and order."""
@@ -702,33 +854,48 @@ class NavTab(QtWidgets.QFrame):
             return
         self.view.edit(index)
 
-    def trash(self, files=None):
-        """Delete the current list of selected files to trash."""
+    def trash(self, files=None, finished=None):
+        """Delete the current list of selected files to trash, calling
+        finished with the counts of items trashed and errors once done."""
         if files is None:
             files = [self.proxy.get_full_name(index)
                      for index in self.view.selectionModel().selectedIndexes()]
-        for f in files:
-            try:
-                send2trash(f)
-                self.model.remove_row(f)
-            except OSError:
-                logger.error(f"Error deleting file", exc_info=True)
-                Pub.notify("App", f"{self.pid}: Error deleting file",
-                           exc_info=True)
+        if not files:
+            return None
+        if self.location == "trash":
+            Pub.notify("App", f"{self.pid}: Already in trash. Use Shift+Del "
+                       "to delete permanently or restore them.")
+            return None
+        job = NavTrasher(files, self.pid)
+        job.removed.connect(self.model.remove_rows)
+        if finished is not None:
+            job.finished.connect(finished)
+        job.start()
+        return job
 
     def delete(self):
         """Permanently delete the currently selected files."""
-        files = [os.path.join(self.location, self.proxy.itemData(index).get(0))
+        files = [self.proxy.get_full_name(index)
                  for index in self.view.selectionModel().selectedIndexes()]
-        for f in files:
-            try:
-                if os.path.isdir(f):
-                    shutil.rmtree(f, onerror=self.remove_readonly)
-                else:
-                    os.unlink(f)
-            except FileNotFoundError:
-                logger.error(f"{f} not found")
-                Pub.notify(f"App", f"{self.pid}: {f} not found.")
+        if not files:
+            return
+        if self.location == "trash":
+            job = NavTrashPurger(files, self.pid)
+        else:
+            job = NavDeleter(files, self.pid)
+        job.removed.connect(self.model.remove_rows)
+        job.start()
+
+    def restore(self):
+        """Restores the selected trashed files to their original paths."""
+        if self.location != "trash":
+            return
+        files = [self.proxy.get_full_name(index)
+                 for index in self.view.selectionModel().selectedIndexes()]
+        if files:
+            job = NavTrashRestorer(files, self.pid)
+            job.removed.connect(self.model.remove_rows)
+            job.start()
 
     def del_dir_up(self, mode=0):
         """Deletes the current directory and goes up one directory."""
@@ -736,6 +903,7 @@ class NavTab(QtWidgets.QFrame):
         new_location = str(pathlib.PurePath(d).parent)
         try:
             if mode < 2:
+                from send2trash import send2trash
                 send2trash(d)
             self.navigate(new_location)
             if mode > 0:
@@ -747,11 +915,6 @@ class NavTab(QtWidgets.QFrame):
             logger.error(e)
             Pub.notify("App.{self.pid}.Tab", f"{self.pid}: {e}")
 
-    def remove_readonly(self, func, path, _):
-        "Clear the readonly bit and reattempts the removal."
-        os.chmod(path, stat.S_IWRITE)
-        func(path)
-
     def new_file(self, kind):
         """Creates new file or folder."""
         kind = kind.title()
@@ -773,13 +936,13 @@ class NavTab(QtWidgets.QFrame):
                 os.mknod(filename)
             Pub.notify("App", f"{self.pid}: {kind} - {filename} created")
         except OSError:
-            logger.error(f"Error creating {filename}", exc_info=True)
+            logger.error("Error creating %s", filename, exc_info=True)
             Pub.notify("App", f"{self.pid}: Error creating {filename}")
 
     def copy(self, cut=False):
         """Cut/Copy files to clipboard."""
         files = [QtCore.QUrl.fromLocalFile(
-            os.path.join(self.location, self.proxy.itemData(index).get(0)))
+            os.path.join(self.location, index.data()))
                  for index in self.view.selectionModel().selectedIndexes()]
         mime_data = self.proxy.mimeData(self.view.selectionModel().
                                         selectedIndexes())
@@ -805,10 +968,10 @@ class NavTab(QtWidgets.QFrame):
         kde_op = clipboard.mimeData().data('application/x-kde-cutselection')
         kde_cut = True if kde_op == b'1' else False
         cut = True if kde_cut or gnome_cut else False
-        logger.debug(f"Files were cut: {cut}")
+        logger.debug("Files were cut: %s", cut)
         urls = [QtCore.QUrl.toLocalFile(url)
                 for url in clipboard.mimeData().urls()]
-        logger.debug(f"Paste {urls}")
+        logger.debug("Paste %s", urls)
         if not urls:
             return
 
@@ -824,34 +987,43 @@ class NavTab(QtWidgets.QFrame):
         """Invokes the copier in separate process."""
         Nav.copy_jobs += 1
         process = subprocess.Popen(
-                    ['python3', Nav.copier, act] + sources + [dest])
+                    ['python3', Nav.copier, act] + sources + [dest],
+                    stdout=subprocess.PIPE, universal_newlines=True,
+                    env=dict(os.environ,
+                             NAVGATOR_TRACE="1" if NavTrace.enabled else ""))
+        for line in process.stdout:
+            if line.startswith("copied "):
+                copied, seconds = line.split()[1:]
+                NavPerf.record("copy", float(seconds), int(copied))
+            elif line.startswith("trace "):
+                NavTrace.merge(json.loads(line[len("trace "):]))
         process.wait()
         Nav.copy_jobs -= 1
-        logger.info(f"{act} {sources} {dest} -> completed")
+        logger.info("%s %s %s -> completed", act, sources, dest)
 
     def startDrag(self, supported_actions):
         """Reimplemented to handle drag."""
         drag = QtGui.QDrag(self)
         t = [QtCore.QUrl.fromLocalFile(
-                f"{self.location}{os.sep}{self.proxy.itemData(index).get(0)}")
+                f"{self.location}{os.sep}{index.data()}")
              for index in self.view.selectionModel().selectedIndexes()]
         mime_data = self.proxy.mimeData(self.view.selectionModel().
                                         selectedIndexes())
         mime_data.setUrls(t)
-        logger.debug(f"Dragging: {mime_data.urls()}")
+        logger.debug("Dragging: %s", mime_data.urls())
         drag.setMimeData(mime_data)
         drag.exec_()
 
     def dragEnterEvent(self, event):
         """Reimplemented to handle drag"""
         logger.debug("startDrag")
-        if self.rubberBand.isVisible:
+        if self.rubberBand is not None and self.rubberBand.isVisible:
             logger.debug("return")
             event.accept()
             return
         m = event.mimeData()
         if m.hasUrls():
-            logger.debug(f"{event.mimeData().urls()}")
+            logger.debug("%s", event.mimeData().urls())
             event.accept()
             return
         event.ignore()
@@ -866,7 +1038,7 @@ class NavTab(QtWidgets.QFrame):
         """Reimplemented to handle drop"""
         m = event.mimeData()
         if m.hasUrls():
-            logger.debug(f"Dropping urls: {m.urls()}")
+            logger.debug("Dropping urls: %s", m.urls())
             links = []
             drop_loc = self.proxy.data(self.view.indexAt(event.pos()))
             if drop_loc is None:
@@ -876,20 +1048,28 @@ class NavTab(QtWidgets.QFrame):
                 # if dropped on file, go back to parent folder
                 if not os.path.isdir(drop_loc):
                     drop_loc = self.location
-            logger.debug(f"Drop Location: {drop_loc}")
+            logger.debug("Drop Location: %s", drop_loc)
             copylist = []
             for url in m.urls():
                 links.append(str(url.toLocalFile()))
 
             for link in links:
-                logger.debug(f"Copying {link} to {drop_loc}")
+                if not NavDevices.same_device(link, drop_loc):
+                    logger.debug("%s is on different mount. Copying", link)
+                    copylist.append(link)
+                    continue
+                logger.debug("Moving %s to %s", link, drop_loc)
                 try:
                     basename = os.path.basename(link)
                     os.rename(link, f"{drop_loc}{os.sep}{basename}")
-                except OSError:
-                    logger.error(f"{self.location}: It's on different mount. "
-                                 "Copying", exc_info=True)
-                    copylist.append(link)
+                except OSError as e:
+                    if e.errno == errno.EXDEV:  # a bind mount or subvolume
+                        logger.debug("%s is on other device. Copying", link)
+                        copylist.append(link)
+                        continue
+                    logger.error("%s: Error moving %s", self.location, link,
+                                 exc_info=True)
+                    Pub.notify("App", f"{self.pid}: Error moving {link}")
 
             if copylist:
                 self.t = threading.Thread(target=self.copier,
@@ -906,10 +1086,10 @@ class NavTab(QtWidgets.QFrame):
         """Returns list of selected item."""
         if full:
             files = [os.path.join(self.location,
-                                  self.proxy.itemData(index).get(0))
+                                  index.data())
                      for index in self.view.selectionModel().selectedIndexes()]
         else:
-            files = [self.proxy.itemData(index).get(0)
+            files = [index.data()
                      for index in self.view.selectionModel().selectedIndexes()]
         return files
 